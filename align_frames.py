@@ -2,12 +2,18 @@ import cv2
 import numpy as np
 from pathlib import Path
 
+from encoders import save_frame
+from frame_store import load_frame
+from parallel import WORKERS, map_frames
+from tracing import traced
+
 # Configuration
 INPUT_FOLDER = 'car_frames_nobg'
 OUTPUT_FOLDER = 'car_frames_aligned'
 CANVAS_SIZE = (1200, 900)  # Fixed canvas size (width, height)
 CAR_CENTER_POSITION = (600, 450)  # Where to center the car
 
+@traced('find_car_center', 'analysis')
 def find_car_center(image):
     """Find the center of the car (non-transparent pixels)"""
     if image.shape[2] == 4:  # Has alpha channel
@@ -34,10 +40,9 @@ def find_car_center(image):
 def align_frame(input_path, output_path):
     """Align a single frame to center the car"""
     # Read image with alpha channel
-    img = cv2.imread(str(input_path), cv2.IMREAD_UNCHANGED)
+    img = load_frame(input_path)
     
     if img is None:
-        print(f"Failed to load: {input_path}")
         return False
     
     # Find car center in current frame
@@ -73,7 +78,7 @@ def align_frame(input_path, output_path):
         canvas[dst_y1:dst_y2, dst_x1:dst_x2] = img[src_y1:src_y2, src_x1:src_x2]
     
     # Save aligned frame
-    cv2.imwrite(str(output_path), canvas)
+    save_frame(output_path, canvas)
     return True
 
 def main():
@@ -92,16 +97,17 @@ def main():
     print(f"Canvas size: {CANVAS_SIZE[0]}x{CANVAS_SIZE[1]}")
     print(f"Car will be centered at: {CAR_CENTER_POSITION}")
     
-    success_count = 0
-    for i, input_path in enumerate(frame_files, 1):
-        output_path = output_folder / input_path.name
-        
-        if align_frame(input_path, output_path):
-            success_count += 1
+    def report(i, aligned, error):
+        if aligned:
             if i % 10 == 0:
                 print(f"Processed {i}/{len(frame_files)} frames...")
         else:
-            print(f"Failed to process: {input_path.name}")
+            print(f"Failed to process: {frame_files[i - 1].name}" + (f" ({error})" if error else ""))
+    
+    results = map_frames(align_frame,
+                         [(input_path, output_folder / input_path.name) for input_path in frame_files],
+                         WORKERS, report)
+    success_count = sum(1 for aligned, _ in results if aligned)
     
     print(f"\nAlignment complete!")
     print(f"Successfully aligned {success_count}/{len(frame_files)} frames")
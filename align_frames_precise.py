@@ -2,31 +2,23 @@ import cv2
 import numpy as np
 from pathlib import Path
 
+from alpha_stats import bounding_box, car_mask
+from encoders import save_frame
+from frame_store import load_frame
+from parallel import WORKERS, map_frames
+from tracing import traced
+
 # Configuration
 INPUT_FOLDER = 'car_frames_nobg'
 OUTPUT_FOLDER = 'car_frames_aligned'
 CANVAS_SIZE = (1200, 900)  # Fixed canvas size (width, height)
 
-def get_car_bbox(image):
-    """Get bounding box of the car (non-transparent pixels)"""
-    if image.shape[2] == 4:  # Has alpha channel
-        alpha = image[:, :, 3]
-        # Find all non-transparent pixels
-        coords = cv2.findNonZero(alpha)
-    else:
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-        _, binary = cv2.threshold(gray, 10, 255, cv2.THRESH_BINARY)
-        coords = cv2.findNonZero(binary)
-    
-    if coords is not None:
-        x, y, w, h = cv2.boundingRect(coords)
-        return x, y, w, h
-    return None
-
-def align_to_reference(image, ref_bbox, ref_center):
+@traced('composite', 'render')
+def align_to_reference(image, ref_bbox, ref_center, bbox=None):
     """Align image to match reference bounding box center"""
     # Get bounding box of current image
-    bbox = get_car_bbox(image)
+    if bbox is None:
+        bbox = bounding_box(car_mask(image))
     
     if bbox is None:
         # Return centered on canvas
@@ -71,6 +63,20 @@ def align_to_reference(image, ref_bbox, ref_center):
     
     return canvas
 
+def process_frame(input_path, output_folder, ref_bbox, ref_center):
+    """Load one frame, align it to the reference and save it"""
+    img = load_frame(input_path)
+    
+    if img is None:
+        raise ValueError(f"Failed to load: {input_path}")
+    
+    # Align to reference
+    aligned = align_to_reference(img, ref_bbox, ref_center)
+    
+    # Save
+    output_path = output_folder / input_path.name
+    save_frame(output_path, aligned)
+
 def main():
     input_folder = Path(INPUT_FOLDER)
     output_folder = Path(OUTPUT_FOLDER)
@@ -87,8 +93,8 @@ def main():
     
     # Load reference frame (first frame)
     print("Loading reference frame...")
-    ref_img = cv2.imread(str(frame_files[0]), cv2.IMREAD_UNCHANGED)
-    ref_bbox = get_car_bbox(ref_img)
+    ref_img = load_frame(frame_files[0])
+    ref_bbox = bounding_box(car_mask(ref_img))
     
     if ref_bbox is None:
         print("Could not detect car in reference frame!")
@@ -102,25 +108,17 @@ def main():
     print(f"Reference car size: {ref_w}x{ref_h}")
     
     # Process all frames
-    success_count = 0
-    for i, input_path in enumerate(frame_files, 1):
-        img = cv2.imread(str(input_path), cv2.IMREAD_UNCHANGED)
-        
-        if img is None:
-            print(f"Failed to load: {input_path}")
-            continue
-        
-        # Align to reference
-        aligned = align_to_reference(img, ref_bbox, ref_center)
-        
-        # Save
-        output_path = output_folder / input_path.name
-        cv2.imwrite(str(output_path), aligned)
-        success_count += 1
-        
+    def report(i, result, error):
+        if error:
+            print(error)
         if i % 10 == 0:
             print(f"Processed {i}/{len(frame_files)} frames...")
     
+    results = map_frames(process_frame,
+                         [(input_path, output_folder, ref_bbox, ref_center) for input_path in frame_files],
+                         WORKERS, report)
+    success_count = sum(1 for _, error in results if error is None)
+    
     print(f"\nPrecise alignment complete!")
     print(f"Successfully aligned {success_count}/{len(frame_files)} frames")
     print(f"All cars centered at the same position relative to reference frame")
@@ -0,0 +1,186 @@
+import cv2
+import numpy as np
+
+from tracing import traced
+
+# Configuration
+# Longest side of the reduced planes coarse searches run on; larger frames are
+# reduced by a whole factor and only read at full resolution near the car's edges
+ANALYSIS_SIZE = 1024
+
+# Shared per-frame measurements of the car's alpha plane. The car is located
+# on a block-maximum reduction of the plane, and the exact statistics are then
+# taken from full-resolution windows: the strips along the edges for the
+# bounding box, the box itself for moments and counts. Nothing materialises
+# pixel coordinates with np.where or cv2.findNonZero, so measuring a frame
+# allocates little beyond the plane.
+
+@traced('alpha_channel', 'analysis')
+def alpha_channel(image):
+    """Contiguous alpha plane of a BGRA image, or None without alpha"""
+    if image.ndim != 3 or image.shape[2] != 4:
+        return None
+    # One copy up front; OpenCV would otherwise copy the strided view per call
+    return np.ascontiguousarray(image[:, :, 3])
+
+@traced('car_mask', 'analysis')
+def car_mask(image):
+    """Plane whose non-zero pixels are the car (thresholded gray without alpha)"""
+    alpha = alpha_channel(image)
+    if alpha is not None:
+        return alpha
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    _, binary = cv2.threshold(gray, 10, 255, cv2.THRESH_BINARY)
+    return binary
+
+def reduction_factor(shape):
+    """Whole factor that brings the longest side of a plane down to ANALYSIS_SIZE"""
+    return max(1, -(-max(shape[:2]) // ANALYSIS_SIZE))
+
+def block_max(plane, factor):
+    """Plane shrunk by factor on both axes, each pixel the maximum of its block.
+
+    Unlike an averaging resize, a single faint pixel keeps its block
+    non-zero, so a box found on the reduced plane always holds the
+    full-resolution one. Edge blocks may be partial.
+    """
+    if factor == 1:
+        return plane
+    bands = plane[::factor].copy()
+    for i in range(1, factor):
+        rows = plane[i::factor]
+        np.maximum(bands[:len(rows)], rows, out=bands[:len(rows)])
+    blocks = bands[:, ::factor].copy()
+    for i in range(1, factor):
+        cols = bands[:, i::factor]
+        np.maximum(blocks[:, :cols.shape[1]], cols, out=blocks[:, :cols.shape[1]])
+    return blocks
+
+@traced('bounding_box', 'analysis')
+def bounding_box(alpha):
+    """Tight (x, y, w, h) of the non-zero pixels, or None if there are none.
+
+    The blocks holding the car are found on the reduced plane; the exact
+    edges are then read from the full-resolution strips, one block wide,
+    along the sides of that block box.
+    """
+    factor = reduction_factor(alpha.shape)
+    blocks = block_max(alpha, factor)
+    cols = np.flatnonzero(blocks.max(axis=0))
+    if len(cols) == 0:
+        return None
+    rows = np.flatnonzero(blocks.max(axis=1))
+
+    x0, y0 = int(cols[0]) * factor, int(rows[0]) * factor
+    window = alpha[y0:(rows[-1] + 1) * factor, x0:(cols[-1] + 1) * factor]
+    last_col = (cols[-1] - cols[0]) * factor
+    last_row = (rows[-1] - rows[0]) * factor
+    left = np.flatnonzero(window[:, :factor].max(axis=0))[0]
+    right = last_col + np.flatnonzero(window[:, last_col:].max(axis=0))[-1]
+    top = np.flatnonzero(window[:factor].max(axis=1))[0]
+    bottom = last_row + np.flatnonzero(window[last_row:].max(axis=1))[-1]
+    return (x0 + int(left), y0 + int(top), int(right - left) + 1, int(bottom - top) + 1)
+
+@traced('center_of_mass', 'analysis')
+def center_of_mass(alpha, bbox=None):
+    """Alpha-weighted center of mass, truncated to whole pixels.
+
+    Pass the plane's bounding box to sum only that region. The moments are
+    whole numbers, so shifting them back to image coordinates is exact.
+    """
+    x, y = 0, 0
+    if bbox is not None:
+        x, y, w, h = bbox
+        alpha = alpha[y:y+h, x:x+w]
+    M = cv2.moments(alpha)
+    if M["m00"] == 0:
+        return None
+    return (int((M["m10"] + x * M["m00"]) / M["m00"]), int((M["m01"] + y * M["m00"]) / M["m00"]))
+
+@traced('area', 'analysis')
+def area(alpha, bbox=None):
+    """Number of non-zero pixels (inside bbox, which must hold them all, if given)"""
+    if bbox is not None:
+        x, y, w, h = bbox
+        alpha = alpha[y:y+h, x:x+w]
+    return cv2.countNonZero(alpha)
+
+@traced('largest_contour', 'analysis')
+def largest_contour(alpha, bbox=None):
+    """Centroid and bounding box of the largest outer contour.
+
+    Pass the plane's bounding box to trace only that region; the contours
+    are the same, shifted back to image coordinates.
+    """
+    offset = (0, 0)
+    if bbox is not None:
+        x, y, w, h = bbox
+        alpha = alpha[y:y+h, x:x+w]
+        offset = (x, y)
+
+    contours, _ = cv2.findContours(alpha, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE, offset=offset)
+    if contours:
+        largest = max(contours, key=cv2.contourArea)
+        M = cv2.moments(largest)
+        if M["m00"] != 0:
+            cx = int(M["m10"] / M["m00"])
+            cy = int(M["m01"] / M["m00"])
+            return (cx, cy), cv2.boundingRect(largest)
+    return None, None
+
+@traced('perceptual_hash', 'analysis')
+def perceptual_hash(image, size=8):
+    """DCT hash of the frame's luma and car mask as a hex string.
+
+    Each plane is shrunk to 32x32 and the lowest size x size DCT
+    frequencies are compared to their median (DC excluded), one bit each,
+    so the hash survives noise, recompression and small shifts. Luma is
+    weighted by alpha so hidden background color does not count.
+    """
+    factor = reduction_factor(image.shape)
+    if factor > 1:
+        # Every factor-th pixel is plenty for 32x32 and skips most of a large frame
+        image = image[::factor, ::factor]
+    mask = car_mask(image)
+    gray = cv2.cvtColor(np.ascontiguousarray(image[:, :, :3]), cv2.COLOR_BGR2GRAY)
+    if image.shape[2] == 4:
+        gray = cv2.multiply(gray, mask, scale=1 / 255)
+
+    bits = []
+    for plane in (gray, mask):
+        small = cv2.resize(plane, (32, 32), interpolation=cv2.INTER_AREA).astype(np.float32)
+        low = cv2.dct(small)[:size, :size].ravel()
+        bits.append(low > np.median(low[1:]))
+    return np.packbits(np.concatenate(bits)).tobytes().hex()
+
+def frame_stats(image):
+    """Every per-frame statistic the alignment stages need.
+
+    Images without alpha get a bbox and area from the thresholded gray plane
+    and no center of mass or contour.
+    """
+    alpha = alpha_channel(image)
+    mask = alpha if alpha is not None else car_mask(image)
+    bbox = bounding_box(mask)
+
+    if alpha is not None and bbox is not None:
+        visual_center, visual_bbox = largest_contour(alpha, bbox)
+        center = center_of_mass(alpha, bbox)
+    else:
+        visual_center, visual_bbox, center = None, None, None
+
+    return {
+        'bbox': bbox,
+        'center_of_mass': center,
+        'visual_center': visual_center,
+        'visual_bbox': visual_bbox,
+        'area': area(mask, bbox) if bbox is not None else 0,
+    }
+
+def batch_stats(frames):
+    """frame_stats() of every frame of an (N, H, W, 4) stack, such as a frame store's data.
+
+    Each frame is measured inside its own bounding box, which is faster
+    than reductions over the whole stack, so this is a loop over the frames.
+    """
+    return [frame_stats(frame) for frame in frames]
@@ -0,0 +1,280 @@
+import argparse
+import json
+import sqlite3
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from pathlib import Path
+
+import geometry_index
+from encoders import CODECS, FRAME_CODEC, is_available
+from parallel import WORKERS, call_frame, resolve_workers
+from pipeline import DEFAULT_VARIANTS, VARIANTS, frame_analysis, render_frame
+
+# Configuration
+JOURNAL_FILE = '.batch_journal.sqlite'  # Stored in the spin-set directory
+IN_FLIGHT = 2  # Work items queued per worker, so no worker waits on the scheduler
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS items (
+    spin_set TEXT NOT NULL,
+    stage TEXT NOT NULL,
+    frame TEXT NOT NULL,
+    state TEXT NOT NULL,
+    result TEXT,
+    error TEXT,
+    updated REAL,
+    PRIMARY KEY (spin_set, stage, frame)
+);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+"""
+
+def find_spin_sets(root):
+    """Sub-folders of root that hold frame_*.png inputs, one per car"""
+    return [folder for folder in sorted(Path(root).iterdir())
+            if folder.is_dir() and any(folder.glob('frame_*.png'))]
+
+# Journal: one row per (spin set, stage, frame) work item. Rows are written
+# by the scheduling process only; a work item without a 'done' row is run
+# again, so a crash loses at most the items that were in flight.
+
+def open_journal(path):
+    conn = sqlite3.connect(str(path))
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.executescript(SCHEMA)
+    return conn
+
+def load_items(conn):
+    """{(spin set, stage, frame): (state, result)}"""
+    rows = conn.execute('SELECT spin_set, stage, frame, state, result FROM items')
+    return {(spin_set, stage, frame): (state, result) for spin_set, stage, frame, state, result in rows}
+
+def save_items(conn, keys, state, result=None, error=None):
+    """Set the state of work items, committed before returning"""
+    now = time.time()
+    conn.executemany('INSERT OR REPLACE INTO items VALUES (?, ?, ?, ?, ?, ?, ?)',
+                     [key + (state, result, error, now) for key in keys])
+    conn.commit()
+
+def forget_items(conn, keys):
+    """Drop the rows of work items so they run again"""
+    conn.executemany('DELETE FROM items WHERE spin_set = ? AND stage = ? AND frame = ?', keys)
+    conn.commit()
+
+def sync_config(conn, config):
+    """Forget every prepare and render result when the variants or codec changed since the last run"""
+    value = json.dumps(config, sort_keys=True)
+    row = conn.execute("SELECT value FROM meta WHERE key = 'config'").fetchone()
+    if row is None or row[0] != value:
+        conn.execute("DELETE FROM items WHERE stage != 'analyze'")
+        conn.execute("INSERT OR REPLACE INTO meta VALUES ('config', ?)", (value,))
+        conn.commit()
+
+def prepare_set(analyses, variant_names):
+    """Set-wide parameters of every variant, as they come back from the journal (JSON)"""
+    params = {}
+    errors = {}
+    for name in variant_names:
+        prepare = VARIANTS[name]['prepare']
+        try:
+            params[name] = prepare(analyses) if prepare else None
+        except ValueError as e:
+            errors[name] = str(e)
+    return json.loads(json.dumps({'params': params, 'errors': errors}))
+
+def run_inline(func, args):
+    """Future already holding call_frame(func, args), for a serial run"""
+    future = Future()
+    future.set_result(call_frame(func, args))
+    return future
+
+def run_batch(root, variant_names=DEFAULT_VARIANTS, workers=WORKERS, codec=FRAME_CODEC, journal=None,
+              on_event=print):
+    """Analyze and render every spin set under root, resuming from the journal.
+
+    Work items are (set, stage, frame): 'analyze' measures one frame,
+    'prepare' computes a set's variant parameters once all of its frames
+    are analyzed, and 'render' writes one frame of every variant into the
+    set's folder. Items of all sets share one worker pool, and renders
+    are queued ahead of analysis, so while one set waits for its last
+    frames to be analyzed the workers move on to the next set instead of
+    idling. Items already done in the journal are skipped; frames that
+    were added, removed or changed make their set prepare and render
+    again. Returns {set: {'frames', 'rendered', 'failed'}}.
+    """
+    root = Path(root)
+    workers = resolve_workers(workers)
+    conn = open_journal(journal or root / JOURNAL_FILE)
+    sync_config(conn, {'variants': sorted(variant_names), 'codec': codec})
+    items = load_items(conn)
+
+    sets = {}
+    analyze_queue = deque()
+    render_queue = deque()
+
+    def schedule_renders(name):
+        spin_set = sets[name]
+        frames = [frame_path for frame_path in spin_set['frames'] if frame_path.name in spin_set['entries']]
+        analyses = [frame_analysis(geometry_index.as_geometry(spin_set['entries'][frame_path.name]))
+                    for frame_path in frames]
+
+        key = (name, 'prepare', '')
+        state, result = items.get(key, (None, None))
+        if state == 'done':
+            prepared = json.loads(result)
+        else:
+            prepared = prepare_set(analyses, variant_names)
+            save_items(conn, [key], 'done', json.dumps(prepared))
+        for variant, error in prepared['errors'].items():
+            on_event(f"⚠️  {name}: skipping {variant}: {error}")
+        for variant in prepared['params']:
+            (spin_set['folder'] / VARIANTS[variant]['output']).mkdir(exist_ok=True)
+
+        todo = [(frame_path, analysis) for frame_path, analysis in zip(frames, analyses)
+                if items.get((name, 'render', frame_path.name), (None,))[0] != 'done']
+        spin_set['rendered'] = len(frames) - len(todo)
+        spin_set['remaining'] = len(todo)
+        save_items(conn, [(name, 'render', frame_path.name) for frame_path, _ in todo], 'pending')
+        for frame_path, analysis in todo:
+            render_queue.append((name, frame_path, (frame_path, None, analysis, prepared['params'], codec, spin_set['folder'])))
+        if not todo:
+            on_event(f"✅ {name}: {spin_set['rendered']}/{len(spin_set['frames'])} frames, nothing to do")
+
+    for folder in find_spin_sets(root):
+        name = folder.name
+        frame_files = sorted(folder.glob('frame_*.png'))
+        entries = {}
+        pending = []
+        for frame_path in frame_files:
+            state, result = items.get((name, 'analyze', frame_path.name), (None, None))
+            entry = json.loads(result) if state == 'done' else None
+            # The journaled geometry is only good while the frame is unchanged
+            if entry is not None and geometry_index.lookup({frame_path.name: entry}, frame_path) is not None:
+                entries[frame_path.name] = entry
+            else:
+                pending.append(frame_path)
+
+        removed = {frame for spin_set, stage, frame in items if spin_set == name and stage == 'analyze'}
+        removed -= {frame_path.name for frame_path in frame_files}
+        if pending or removed:
+            # The set-wide parameters depend on every frame
+            stale = [key for key in items if key[0] == name and (key[1] != 'analyze' or key[2] in removed)]
+            forget_items(conn, stale)
+            for key in stale:
+                del items[key]
+            save_items(conn, [(name, 'analyze', frame_path.name) for frame_path in pending], 'pending')
+
+        sets[name] = {'folder': folder, 'frames': frame_files, 'entries': entries, 'waiting': len(pending),
+                      'rendered': 0, 'remaining': 0, 'failed': 0}
+        analyze_queue.extend((name, frame_path, (frame_path,)) for frame_path in pending)
+        if not pending:
+            schedule_renders(name)
+
+    on_event(f"{len(sets)} spin sets, {len(analyze_queue)} frames to analyze, "
+             f"{len(render_queue)} ready to render, workers: {workers}")
+
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    in_flight = {}
+    try:
+        while analyze_queue or render_queue or in_flight:
+            while len(in_flight) < workers * IN_FLIGHT and (render_queue or analyze_queue):
+                if render_queue:
+                    stage, func, (name, frame_path, args) = 'render', render_frame, render_queue.popleft()
+                else:
+                    stage, func, (name, frame_path, args) = 'analyze', geometry_index.measure_frame, analyze_queue.popleft()
+                future = executor.submit(call_frame, func, args) if executor else run_inline(func, args)
+                in_flight[future] = (name, stage, frame_path)
+
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                name, stage, frame_path = in_flight.pop(future)
+                result, error = future.result()
+                spin_set = sets[name]
+                key = (name, stage, frame_path.name)
+
+                if error:
+                    save_items(conn, [key], 'failed', error=error)
+                    on_event(f"✗ {name}/{frame_path.name} ({stage}): {error}")
+                else:
+                    save_items(conn, [key], 'done', json.dumps(result))
+
+                if stage == 'analyze':
+                    if error is None:
+                        spin_set['entries'][frame_path.name] = result
+                    spin_set['waiting'] -= 1
+                    if spin_set['waiting'] == 0:
+                        schedule_renders(name)
+                    continue
+
+                spin_set['remaining'] -= 1
+                if error:
+                    spin_set['failed'] += 1
+                else:
+                    spin_set['rendered'] += 1
+                if spin_set['remaining'] == 0:
+                    failed = f", {spin_set['failed']} failed" if spin_set['failed'] else ""
+                    on_event(f"✅ {name}: {spin_set['rendered']}/{len(spin_set['frames'])} frames{failed}")
+    finally:
+        if executor:
+            executor.shutdown()
+        conn.close()
+
+    return {name: {'frames': len(spin_set['frames']), 'rendered': spin_set['rendered'], 'failed': spin_set['failed']}
+            for name, spin_set in sets.items()}
+
+def print_status(root, journal=None):
+    """Per-set counts of journaled work items by stage and state"""
+    conn = open_journal(journal or Path(root) / JOURNAL_FILE)
+    rows = conn.execute('SELECT spin_set, stage, state, COUNT(*) FROM items GROUP BY spin_set, stage, state '
+                        'ORDER BY spin_set, stage, state').fetchall()
+    conn.close()
+    if not rows:
+        print("Journal is empty")
+        return
+    for spin_set, stage, state, count in rows:
+        print(f"{spin_set:30s} {stage:8s} {state:8s} {count}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the pipeline over a directory of spin sets, resumably")
+    parser.add_argument('root', help="Directory with one sub-folder of frame_*.png per spin set")
+    parser.add_argument('variants', nargs='*',
+                        help=f"Output variants to build (default: {' '.join(DEFAULT_VARIANTS)})")
+    parser.add_argument('--workers', type=int, default=WORKERS,
+                        help="Worker processes (1 = serial, 0 = one per CPU core)")
+    parser.add_argument('--codec', default=FRAME_CODEC, choices=list(CODECS),
+                        help=f"Output encoder (default: {FRAME_CODEC})")
+    parser.add_argument('--journal', help=f"SQLite journal (default: <root>/{JOURNAL_FILE})")
+    parser.add_argument('--status', action='store_true', help="Show the journal and exit")
+    parser.add_argument('--reset', action='store_true', help="Forget the journal and process everything again")
+    args = parser.parse_args()
+
+    variant_names = args.variants or DEFAULT_VARIANTS
+    unknown = [name for name in variant_names if name not in VARIANTS]
+    if unknown:
+        parser.error(f"unknown variants: {', '.join(unknown)}")
+    if not is_available(args.codec):
+        parser.error(f"codec {args.codec} is not supported by this OpenCV build")
+
+    if args.status:
+        print_status(args.root, args.journal)
+        return
+
+    if args.reset:
+        conn = open_journal(args.journal or Path(args.root) / JOURNAL_FILE)
+        conn.execute('DELETE FROM items')
+        conn.commit()
+        conn.close()
+
+    print(f"Batch: {args.root} -> {', '.join(variant_names)} ({args.codec})")
+    summary = run_batch(args.root, variant_names, args.workers, args.codec, args.journal)
+
+    rendered = sum(entry['rendered'] for entry in summary.values())
+    frames = sum(entry['frames'] for entry in summary.values())
+    failed = sum(entry['failed'] for entry in summary.values())
+    print(f"\n{'=' * 60}")
+    print(f"✅ {len(summary)} spin sets, {rendered}/{frames} frames rendered" + (f", {failed} failed" if failed else ""))
+    print(f"{'=' * 60}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,252 @@
+import argparse
+import json
+import time
+import cv2
+import numpy as np
+from pathlib import Path
+
+from alpha_stats import frame_stats
+from encoders import CODECS, FRAME_CODEC, encode_frame, is_available
+from final_fix import place_car
+from parallel import WORKERS, map_frames, resolve_workers
+from remove_bg_opencv import remove_background
+
+# Configuration
+DATA_FOLDER = 'benchmark_data'  # Generated datasets, reused between runs
+RESOLUTIONS = {
+    '720p': (1280, 720),
+    '1080p': (1920, 1080),
+    '1440p': (2560, 1440),
+    '4k': (3840, 2160),
+    '8k': (7680, 4320),
+}
+DEFAULT_RESOLUTIONS = ['720p', '1080p']
+DEFAULT_FRAMES = 36  # One frame every 10 degrees
+JPEG_QUALITY = 95
+STAGES = ['decode', 'background', 'analysis', 'composite', 'encode']
+
+# Synthetic turntable object: boxes of (center, size, BGR color) in car-like
+# proportions, y up, length along x
+OBJECT_BOXES = [
+    ((0.0, 0.55, 0.0), (4.6, 0.7, 1.9), (40, 40, 190)),     # Body
+    ((-0.2, 1.15, 0.0), (2.6, 0.5, 1.7), (80, 60, 50)),     # Cabin
+    ((1.45, 0.33, 0.9), (0.66, 0.66, 0.3), (30, 30, 30)),   # Wheels
+    ((1.45, 0.33, -0.9), (0.66, 0.66, 0.3), (30, 30, 30)),
+    ((-1.45, 0.33, 0.9), (0.66, 0.66, 0.3), (30, 30, 30)),
+    ((-1.45, 0.33, -0.9), (0.66, 0.66, 0.3), (30, 30, 30)),
+]
+CAMERA_ELEVATION = 15  # Degrees above the turntable
+OBJECT_SCALE = 0.2  # Pixels per object unit, as a fraction of the frame height
+LIGHT_DIRECTION = (0.4, 0.7, 0.6)  # In camera space, so shading changes as the object turns
+
+# Faces of a unit box: corner sign patterns and outward normal
+BOX_FACES = [
+    ([(1, -1, -1), (1, 1, -1), (1, 1, 1), (1, -1, 1)], (1, 0, 0)),
+    ([(-1, -1, -1), (-1, -1, 1), (-1, 1, 1), (-1, 1, -1)], (-1, 0, 0)),
+    ([(-1, 1, -1), (-1, 1, 1), (1, 1, 1), (1, 1, -1)], (0, 1, 0)),
+    ([(-1, -1, -1), (1, -1, -1), (1, -1, 1), (-1, -1, 1)], (0, -1, 0)),
+    ([(-1, -1, 1), (1, -1, 1), (1, 1, 1), (-1, 1, 1)], (0, 0, 1)),
+    ([(-1, -1, -1), (-1, 1, -1), (1, 1, -1), (1, -1, -1)], (0, 0, -1)),
+]
+
+def parse_resolution(value):
+    """(width, height) of a preset name or a WxH string"""
+    if value.lower() in RESOLUTIONS:
+        return RESOLUTIONS[value.lower()]
+    try:
+        width, height = (int(part) for part in value.lower().split('x'))
+    except ValueError:
+        raise ValueError(f"Unknown resolution: {value} (use {', '.join(RESOLUTIONS)} or WxH)")
+    return width, height
+
+def render_turntable_frame(width, height, angle, seed):
+    """BGR frame of the object turned by angle degrees on a light studio background.
+
+    Flat-shaded boxes drawn back to front with an orthographic camera. The
+    background is a soft vertical gradient with seeded noise, so the same
+    arguments always give the same pixels.
+    """
+    rng = np.random.default_rng(seed)
+    gradient = np.linspace(250, 232, height, dtype=np.float32)[:, None, None]
+    noise = rng.integers(-3, 4, size=(height, width, 1), dtype=np.int8)
+    frame = np.clip(gradient + noise, 0, 255).astype(np.uint8).repeat(3, axis=2)
+
+    theta = np.radians(angle)
+    phi = np.radians(CAMERA_ELEVATION)
+    # Turn about the vertical axis, then tilt the view down by the elevation
+    turn = np.array([[np.cos(theta), 0, np.sin(theta)], [0, 1, 0], [-np.sin(theta), 0, np.cos(theta)]])
+    tilt = np.array([[1, 0, 0], [0, np.cos(phi), -np.sin(phi)], [0, np.sin(phi), np.cos(phi)]])
+    view = tilt @ turn
+    light = np.array(LIGHT_DIRECTION) / np.linalg.norm(LIGHT_DIRECTION)
+
+    scale = height * OBJECT_SCALE
+    origin = np.array([width / 2, height * 0.6])
+
+    faces = []
+    for center, size, color in OBJECT_BOXES:
+        for corners, normal in BOX_FACES:
+            n = view @ np.array(normal, dtype=np.float64)
+            if n[2] <= 0:
+                continue  # Facing away from the camera
+            points = (view @ (np.array(center) + np.array(corners) * np.array(size) / 2).T).T
+            screen = origin + points[:, :2] * [scale, -scale]
+            shade = 0.35 + 0.65 * max(0.0, float(n @ light))
+            faces.append((points[:, 2].mean(), screen, tuple(int(c * shade) for c in color)))
+
+    for _, screen, color in sorted(faces, key=lambda face: face[0]):
+        cv2.fillConvexPoly(frame, np.round(screen * 16).astype(np.int32), color, cv2.LINE_AA, shift=4)
+
+    return frame
+
+def write_turntable_frame(output_path, width, height, angle, seed):
+    """Render one frame and save it as a JPEG, like frames extracted from a video"""
+    frame = render_turntable_frame(width, height, angle, seed)
+    if not cv2.imwrite(str(output_path), frame, [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY]):
+        raise ValueError(f"Could not write {output_path}")
+
+def generate_turntable(width, height, frames, workers=WORKERS, data_folder=DATA_FOLDER):
+    """Folder of a synthetic turntable set, rendered only if it is not there yet"""
+    folder = Path(data_folder) / f"turntable_{width}x{height}_{frames}"
+    frame_files = [folder / f"frame_{i:03d}.jpg" for i in range(1, frames + 1)]
+    if all(frame_path.exists() for frame_path in frame_files):
+        return folder
+
+    folder.mkdir(parents=True, exist_ok=True)
+    print(f"Rendering {frames} turntable frames at {width}x{height} into {folder}...")
+    results = map_frames(write_turntable_frame,
+                         [(frame_path, width, height, 360 * i / frames, i)
+                          for i, frame_path in enumerate(frame_files)],
+                         workers)
+    errors = [error for _, error in results if error]
+    if errors:
+        raise ValueError(errors[0])
+    return folder
+
+def bench_frame(frame_path, codec=FRAME_CODEC):
+    """Seconds each stage takes on one frame, from JPEG to encoded viewer frame"""
+    marks = [time.perf_counter()]
+
+    img = cv2.imread(str(frame_path), cv2.IMREAD_COLOR)
+    if img is None:
+        raise ValueError(f"Failed to load: {Path(frame_path).name}")
+    marks.append(time.perf_counter())
+
+    rgba = remove_background(img)
+    marks.append(time.perf_counter())
+
+    stats = frame_stats(rgba)
+    if stats['bbox'] is None:
+        raise ValueError(f"No object detected: {Path(frame_path).name}")
+    marks.append(time.perf_counter())
+
+    canvas = place_car(rgba, stats['bbox'])
+    marks.append(time.perf_counter())
+
+    encode_frame(canvas, codec)
+    marks.append(time.perf_counter())
+
+    return dict(zip(STAGES, np.diff(marks)))
+
+def run_benchmark(width, height, frames, workers=WORKERS, codec=FRAME_CODEC):
+    """Time every stage on a synthetic set; per-frame latencies and total throughput"""
+    folder = generate_turntable(width, height, frames, workers)
+    frame_files = sorted(folder.glob('frame_*.jpg'))[:frames]
+
+    start = time.perf_counter()
+    results = map_frames(bench_frame, [(frame_path, codec) for frame_path in frame_files], workers)
+    wall = time.perf_counter() - start
+
+    timings = [result for result, error in results if error is None]
+    errors = [error for _, error in results if error]
+    if not timings:
+        raise ValueError(errors[0] if errors else "No frames were processed")
+
+    stages = {}
+    for stage in STAGES + ['total']:
+        ms = np.array([sum(t.values()) if stage == 'total' else t[stage] for t in timings]) * 1000
+        stages[stage] = {
+            'mean_ms': float(ms.mean()),
+            'p50_ms': float(np.percentile(ms, 50)),
+            'p95_ms': float(np.percentile(ms, 95)),
+        }
+
+    return {
+        'resolution': f"{width}x{height}",
+        'frames': len(timings),
+        'failed': len(errors),
+        'workers': resolve_workers(workers),
+        'codec': codec,
+        'wall_s': wall,
+        'frames_per_s': len(timings) / wall,
+        'megapixels_per_s': len(timings) * width * height / 1e6 / wall,
+        'stages': stages,
+    }
+
+def print_report(report, baseline=None):
+    """Stage table of one run, with the change against a matching baseline run"""
+    print(f"\n{report['resolution']}, {report['frames']} frames, {report['workers']} workers, "
+          f"codec {report['codec']}")
+    print("=" * 60)
+    print(f"{'stage':<12}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'share':>8}{'vs base':>10}")
+
+    total = report['stages']['total']['mean_ms']
+    for stage, ms in report['stages'].items():
+        change = ''
+        if baseline and stage in baseline['stages']:
+            change = f"{ms['mean_ms'] / baseline['stages'][stage]['mean_ms'] - 1:+.0%}"
+        print(f"{stage:<12}{ms['mean_ms']:>10.1f}{ms['p50_ms']:>10.1f}{ms['p95_ms']:>10.1f}"
+              f"{ms['mean_ms'] / total:>8.0%}{change:>10}")
+
+    print("=" * 60)
+    print(f"Throughput: {report['frames_per_s']:.1f} frames/s, {report['megapixels_per_s']:.0f} MP/s "
+          f"({report['wall_s']:.1f} s wall)")
+    if report['failed']:
+        print(f"⚠️  {report['failed']} frames failed")
+
+def main():
+    parser = argparse.ArgumentParser(description="Time every frame stage on synthetic turntable sets")
+    parser.add_argument('--resolution', nargs='+', default=DEFAULT_RESOLUTIONS,
+                        help=f"Presets ({', '.join(RESOLUTIONS)}) or WxH (default: {' '.join(DEFAULT_RESOLUTIONS)})")
+    parser.add_argument('--frames', type=int, default=DEFAULT_FRAMES,
+                        help=f"Frames per turntable revolution (default: {DEFAULT_FRAMES})")
+    parser.add_argument('--workers', type=int, default=WORKERS,
+                        help="Worker processes (1 = serial, 0 = one per CPU core)")
+    parser.add_argument('--codec', default=FRAME_CODEC, choices=list(CODECS),
+                        help=f"Encoder for the encode stage (default: {FRAME_CODEC})")
+    parser.add_argument('--json', help="Write the results to this file")
+    parser.add_argument('--baseline', help="Results file of an earlier run to compare against")
+    args = parser.parse_args()
+
+    try:
+        sizes = [parse_resolution(value) for value in args.resolution]
+    except ValueError as e:
+        parser.error(str(e))
+    if args.frames < 1:
+        parser.error("--frames must be at least 1")
+    if not is_available(args.codec):
+        parser.error(f"codec {args.codec} is not supported by this OpenCV build")
+
+    baseline = {}
+    if args.baseline:
+        for run in json.loads(Path(args.baseline).read_text())['runs']:
+            baseline[(run['resolution'], run['frames'], run['codec'])] = run
+
+    print(f"Benchmarking {', '.join(f'{w}x{h}' for w, h in sizes)} with {args.frames} frames...")
+    print(f"Stages: {' -> '.join(STAGES)}")
+
+    runs = []
+    for width, height in sizes:
+        try:
+            report = run_benchmark(width, height, args.frames, args.workers, args.codec)
+        except ValueError as e:
+            print(f"✗ {width}x{height}: {e}")
+            continue
+        runs.append(report)
+        print_report(report, baseline.get((report['resolution'], report['frames'], report['codec'])))
+
+    if args.json:
+        Path(args.json).write_text(json.dumps({'runs': runs}, indent=1))
+        print(f"\nResults: {args.json}")
+
+if __name__ == '__main__':
+    main()
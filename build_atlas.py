@@ -0,0 +1,101 @@
+import json
+import cv2
+import numpy as np
+from pathlib import Path
+
+from crop_frames import MANIFEST_FILE, load_references
+from encoders import FRAME_CODEC, codec_extension, save_frame
+from geometry_index import build_index
+from parallel import WORKERS
+
+# Configuration
+INPUT_FOLDER = 'car_frames_final'
+OUTPUT_FOLDER = 'car_frames_final_atlas'
+MAX_SHEET_SIZE = 4096  # Largest sheet side; keep at or below 4096 for mobile browsers
+
+def pack_shelves(sizes, max_size):
+    """Place (w, h) boxes in rows on as few sheets as needed.
+
+    Returns ([(sheet, x, y)] per box, [(width, height)] per sheet). Boxes keep
+    their order, so consecutive frames end up next to each other.
+    """
+    placements = []
+    sheets = []
+    sheet = x = y = shelf_h = width = 0
+
+    for w, h in sizes:
+        if w > max_size or h > max_size:
+            raise ValueError(f"Frame of {w}x{h} does not fit on a {max_size}px sheet")
+
+        # Start a new shelf, then a new sheet, when the box does not fit
+        if x + w > max_size:
+            x, y, shelf_h = 0, y + shelf_h, 0
+        if y + h > max_size:
+            sheets.append((width, y))
+            sheet, x, y, shelf_h, width = sheet + 1, 0, 0, 0, 0
+
+        placements.append((sheet, x, y))
+        x += w
+        shelf_h = max(shelf_h, h)
+        width = max(width, x)
+
+    sheets.append((width, y + shelf_h))
+    return placements, sheets
+
+def build_atlas(input_folder, output_folder, max_size=MAX_SHEET_SIZE, workers=WORKERS, codec=FRAME_CODEC):
+    """Pack the tight-cropped frames of a folder into atlas sheets plus a manifest"""
+    input_folder = Path(input_folder)
+    output_folder = Path(output_folder)
+    output_folder.mkdir(exist_ok=True)
+
+    extension = codec_extension(codec)
+    frame_files = sorted(input_folder.glob(f'frame_*{extension}'))
+    geometry = build_index(input_folder, workers, extension)
+    frame_files = [frame_path for frame_path in frame_files if frame_path.name in geometry]
+    if not frame_files:
+        raise ValueError(f"No frames found in {input_folder}")
+
+    # Empty frames still get a (transparent) one-pixel slot
+    bboxes = [geometry[frame_path.name]['bbox'] or (0, 0, 1, 1) for frame_path in frame_files]
+    placements, sheet_sizes = pack_shelves([(w, h) for _, _, w, h in bboxes], max_size)
+
+    sheets = [np.zeros((h, w, 4), dtype=np.uint8) for w, h in sheet_sizes]
+    canvas_size = None
+    for frame_path, (x, y, w, h), (sheet, sx, sy) in zip(frame_files, bboxes, placements):
+        img = cv2.imread(str(frame_path), cv2.IMREAD_UNCHANGED)
+        if img is None or img.ndim != 3 or img.shape[2] != 4:
+            raise ValueError(f"Not an RGBA frame: {frame_path.name}")
+        canvas_size = canvas_size or [img.shape[1], img.shape[0]]
+        sheets[sheet][sy:sy+h, sx:sx+w] = img[y:y+h, x:x+w]
+
+    sheet_files = [save_frame(output_folder / f"atlas_{i}", sheet, codec).name for i, sheet in enumerate(sheets)]
+
+    # Same layout as crop_frames.py, plus where each crop sits in the sheets
+    manifest = {
+        'canvas': canvas_size,
+        'mode': 'atlas',
+        'sheets': sheet_files,
+        'frames': {frame_path.stem + extension: list(bbox) for frame_path, bbox in zip(frame_files, bboxes)},
+        'atlas': {frame_path.stem + extension: list(placement) for frame_path, placement in zip(frame_files, placements)},
+    }
+    references = load_references(input_folder, extension)
+    if references:
+        manifest['references'] = references
+    (output_folder / MANIFEST_FILE).write_text(json.dumps(manifest, indent=1))
+    return manifest
+
+def main():
+    print(f"Packing {INPUT_FOLDER} into {FRAME_CODEC} atlas sheets of at most {MAX_SHEET_SIZE}px...")
+
+    try:
+        manifest = build_atlas(INPUT_FOLDER, OUTPUT_FOLDER)
+    except ValueError as e:
+        print(e)
+        return
+
+    size = sum((Path(OUTPUT_FOLDER) / sheet_file).stat().st_size for sheet_file in manifest['sheets'])
+    print(f"\n✅ {len(manifest['frames'])} frames -> {len(manifest['sheets'])} sheets in {OUTPUT_FOLDER}")
+    print(f"Size: {size / 1e6:.1f} MB")
+
+if __name__ == '__main__':
+    main()
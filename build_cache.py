@@ -0,0 +1,68 @@
+import hashlib
+import inspect
+import json
+import os
+from pathlib import Path
+
+# Configuration
+CACHE_FILE = '.build_cache.json'  # Manifest stored next to the outputs
+CACHE_VERSION = 1
+
+def file_digest(path):
+    """SHA-1 of a file's bytes"""
+    return hashlib.sha1(Path(path).read_bytes()).hexdigest()
+
+def source_digest(module):
+    """SHA-1 of a module's source, so code and constant edits invalidate outputs"""
+    return file_digest(inspect.getsourcefile(module))
+
+def output_key(input_digest, stage, params=None, source=None):
+    """Content address of one output: input bytes + stage + its parameters.
+
+    source is the source_digest() of the code implementing the stage.
+    """
+    parts = [input_digest, stage, repr(params), source]
+    return hashlib.sha1(json.dumps(parts).encode()).hexdigest()
+
+def load_cache(folder):
+    """Manifest of an output folder, keyed by output file name"""
+    cache_path = Path(folder) / CACHE_FILE
+    try:
+        data = json.loads(cache_path.read_text())
+    except (OSError, ValueError):
+        return {}
+    if data.get('version') != CACHE_VERSION:
+        return {}
+    return data.get('outputs', {})
+
+def save_cache(folder, outputs):
+    """Write the manifest atomically"""
+    cache_path = Path(folder) / CACHE_FILE
+    tmp_path = cache_path.with_name(cache_path.name + '.tmp')
+    tmp_path.write_text(json.dumps({'version': CACHE_VERSION, 'outputs': outputs}, indent=1, sort_keys=True))
+    os.replace(tmp_path, cache_path)
+
+def is_fresh(outputs, folder, name, key):
+    """True if the output was built from this key and has not been touched since.
+
+    An entry recorded without a file (the stage produced nothing for that
+    input) is fresh as long as the key matches.
+    """
+    entry = outputs.get(name)
+    if entry is None or entry['key'] != key:
+        return False
+    if entry['size'] is None:
+        return True
+    try:
+        stat = os.stat(Path(folder) / name)
+    except OSError:
+        return False
+    return entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns
+
+def record(outputs, folder, name, key, written=True):
+    """Remember that an output was (or deliberately was not) built from key"""
+    if written:
+        stat = os.stat(Path(folder) / name)
+        outputs[name] = {'key': key, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+    else:
+        outputs[name] = {'key': key, 'size': None, 'mtime_ns': None}
@@ -0,0 +1,112 @@
+import json
+import cv2
+import numpy as np
+from pathlib import Path
+
+from crop_frames import MANIFEST_FILE, load_references
+from encoders import FRAME_CODEC, codec_extension, save_frame
+from parallel import WORKERS, map_frames
+
+# Configuration
+INPUT_FOLDER = 'car_frames_final'
+OUTPUT_FOLDER = 'car_frames_final_pyramid'
+LEVELS = 3  # Full, 1/2 and 1/4 resolution
+
+def level_folder(level):
+    """Sub-folder of a pyramid level (0 = full resolution)"""
+    return f"scale_{1 / 2 ** level:g}"
+
+def premultiply(img):
+    """float32 BGRA with the color scaled by alpha"""
+    premultiplied = img.astype(np.float32)
+    premultiplied[..., :3] *= premultiplied[..., 3:] / 255
+    return premultiplied
+
+def unpremultiply(premultiplied):
+    """uint8 BGRA back from premultiplied float32; fully transparent pixels get black"""
+    alpha = premultiplied[..., 3:]
+    img = np.zeros_like(premultiplied)
+    np.divide(premultiplied[..., :3] * 255, alpha, out=img[..., :3], where=alpha >= 0.5)
+    img[..., 3:] = alpha
+    return np.clip(np.rint(img), 0, 255).astype(np.uint8)
+
+def build_levels(img, levels):
+    """Full-resolution image followed by each halving, every level made from the previous one.
+
+    BGRA frames are halved premultiplied, so the colors of transparent
+    pixels do not bleed into the car's edges.
+    """
+    pyramid = [img]
+    if img.ndim == 3 and img.shape[2] == 4:
+        level = premultiply(img)
+        for _ in range(levels - 1):
+            level = cv2.pyrDown(level)
+            pyramid.append(unpremultiply(level))
+        return pyramid
+    for _ in range(levels - 1):
+        pyramid.append(cv2.pyrDown(pyramid[-1]))
+    return pyramid
+
+def process_frame(frame_path, output_folder, levels, codec=FRAME_CODEC):
+    """Load one frame and save every pyramid level of it; returns the full size"""
+    img = cv2.imread(str(frame_path), cv2.IMREAD_UNCHANGED)
+
+    if img is None:
+        raise ValueError(f"Failed to load: {frame_path.name}")
+
+    for level, level_img in enumerate(build_levels(img, levels)):
+        save_frame(output_folder / level_folder(level) / frame_path.name, level_img, codec)
+
+    return img.shape[1], img.shape[0]
+
+def main():
+    input_folder = Path(INPUT_FOLDER)
+    output_folder = Path(OUTPUT_FOLDER)
+    for level in range(LEVELS):
+        (output_folder / level_folder(level)).mkdir(parents=True, exist_ok=True)
+
+    frame_files = sorted(input_folder.glob('frame_*.png'))
+
+    if not frame_files:
+        print(f"No frames found in {INPUT_FOLDER}")
+        return
+
+    print(f"Building {LEVELS}-level {FRAME_CODEC} pyramids for {len(frame_files)} frames...")
+    print(f"Workers: {WORKERS}")
+
+    def report(i, result, error):
+        if error:
+            print(f"✗ {error}")
+        if i % 10 == 0:
+            print(f"✓ {i}/{len(frame_files)} frames")
+
+    results = map_frames(process_frame, [(frame_path, output_folder, LEVELS, FRAME_CODEC) for frame_path in frame_files],
+                         WORKERS, report)
+    sizes = [size for size, error in results if error is None]
+
+    if not sizes:
+        print("No frames could be processed!")
+        return
+
+    # Smallest level first: the viewer becomes interactive once it is loaded
+    manifest = {
+        'canvas': list(sizes[0]),
+        'mode': 'pyramid',
+        'levels': [
+            {'folder': level_folder(level), 'scale': 1 / 2 ** level}
+            for level in reversed(range(LEVELS))
+        ],
+    }
+    references = load_references(input_folder, codec_extension())
+    if references:
+        manifest['references'] = references
+    (output_folder / MANIFEST_FILE).write_text(json.dumps(manifest, indent=1))
+
+    print(f"\n✅ {len(sizes)}/{len(frame_files)} frames saved to {OUTPUT_FOLDER}")
+    for level in reversed(range(LEVELS)):
+        folder = output_folder / level_folder(level)
+        size = sum(path.stat().st_size for path in folder.glob(f'frame_*{codec_extension()}'))
+        print(f"   {level_folder(level)}: {size / 1e6:.1f} MB")
+
+if __name__ == '__main__':
+    main()
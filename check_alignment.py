@@ -1,80 +1,184 @@
+import argparse
+import json
+import sys
 import cv2
 import numpy as np
 from pathlib import Path
 
-# Let's check the actual positions in our "stable" frames
-FOLDER = 'car_frames_stable'
-OUTPUT_FILE = 'frame_analysis.txt'
-
-def analyze_frame(frame_path):
-    """Analyze where the car actually is in a frame"""
-    img = cv2.imread(str(frame_path), cv2.IMREAD_UNCHANGED)
-    
-    if img is None or img.shape[2] != 4:
-        return None
-    
-    alpha = img[:, :, 3]
-    
-    # Find all non-zero pixels
-    y_coords, x_coords = np.where(alpha > 0)
-    
-    if len(x_coords) == 0:
-        return None
-    
-    # Calculate statistics
-    min_x, max_x = x_coords.min(), x_coords.max()
-    min_y, max_y = y_coords.min(), y_coords.max()
-    
-    # Center of mass
-    weights = alpha[alpha > 0].astype(float)
-    center_x = int(np.average(x_coords, weights=weights))
-    center_y = int(np.average(y_coords, weights=weights))
-    
-    # Bounding box
-    bbox_w = max_x - min_x + 1
-    bbox_h = max_y - min_y + 1
-    
+import register_frames
+import resample_frames
+from alpha_stats import bounding_box, car_mask
+from crop_frames import load_references
+from encoders import CODECS, FRAME_CODEC, codec_extension
+from frame_store import load_frame
+from parallel import WORKERS, map_frames
+from pipeline import VARIANTS
+
+# Configuration
+REPORT_FILE = 'alignment_report.json'
+MASK_SIZE = 1024  # Longest side silhouettes are compared at, so large frames stay cheap to hold
+# Pass/fail limits, as fractions of the frame height (the IoU is a plain ratio).
+# A folder fails when any frame goes over a limit (under it, for the IoU).
+THRESHOLDS = {
+    'center_jitter': 0.01,  # Move of the car's bbox center from one frame to the next
+    'scale_jitter': 0.05,   # Relative change of the car's height from one frame to the next
+    'bbox_drift': 0.03,     # Distance of the bbox center or ground line from its median over the set
+    'alpha_iou': 0.80,      # Overlap of the silhouettes of neighboring frames
+}
+# Set bits of every byte value, for counting silhouette pixels
+POPCOUNT = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).sum(axis=1)
+
+def default_folders(codec=FRAME_CODEC):
+    """Every output folder of the pipeline and the standalone aligners that has frames written with codec"""
+    folders = [variant['output'] for variant in VARIANTS.values()]
+    folders += [register_frames.OUTPUT_FOLDER, resample_frames.OUTPUT_FOLDER]
+    return [folder for folder in folders if any(Path(folder).glob('frame_*' + codec_extension(codec)))]
+
+def frame_sequence(folder, codec=FRAME_CODEC):
+    """(frame name, file to read) in viewing order; deduped frames read their source.
+
+    Only frames written with codec count, so files left over from an
+    earlier codec are not scored twice.
+    """
+    folder = Path(folder)
+    extension = codec_extension(codec)
+    references = load_references(folder, extension)
+    names = sorted({frame_path.name for frame_path in folder.glob('frame_*' + extension)} | set(references))
+    return [(name, folder / references.get(name, name)) for name in names]
+
+def measure_frame(frame_path):
+    """(height, width), car bbox and packed silhouette at MASK_SIZE of one frame"""
+    img = load_frame(frame_path)
+    if img is None:
+        raise ValueError(f"Failed to load: {frame_path}")
+
+    mask = car_mask(img)
+    bbox = bounding_box(mask)
+    h, w = mask.shape
+    factor = min(1.0, MASK_SIZE / max(h, w))
+    if factor < 1.0:
+        mask = cv2.resize(mask, (max(1, round(w * factor)), max(1, round(h * factor))),
+                          interpolation=cv2.INTER_AREA)
+    return (h, w), bbox, np.packbits(mask > 127)
+
+def alpha_iou(a, b):
+    """Intersection over union of two packed silhouettes"""
+    union = POPCOUNT[a | b].sum()
+    return float(POPCOUNT[a & b].sum() / union) if union else 1.0
+
+def score_folder(names, measurements, thresholds=THRESHOLDS):
+    """Per-frame metrics and pass/fail of one folder.
+
+    names are in viewing order and measurements holds measure_frame()
+    results (None for frames that failed to load). The set is a loop, so
+    the first frame's jitter and IoU are measured against the last frame.
+    That IoU is reported as the loop closure but does not fail the folder:
+    how well the silhouettes meet there depends on where the shoot stopped,
+    which alignment cannot change.
+    """
+    problems = [f"{name}: could not be read" for name, m in zip(names, measurements) if m is None]
+    problems += [f"{name}: no car" for name, m in zip(names, measurements) if m is not None and m[1] is None]
+    sizes = {m[0] for m in measurements if m is not None}
+    if len(sizes) > 1:
+        problems.append(f"frame sizes differ: {sorted(sizes)}")
+    if problems:
+        return {'frames': len(names), 'passed': False, 'problems': problems}
+
+    height = sizes.pop()[0]
+    boxes = np.array([m[1] for m in measurements], dtype=np.float64)
+    centers = boxes[:, :2] + boxes[:, 2:] / 2
+    ground = boxes[:, 1] + boxes[:, 3]
+    silhouettes = [m[2] for m in measurements]
+
+    previous = np.roll(np.arange(len(names)), 1)
+    center_jitter = np.linalg.norm(centers - centers[previous], axis=1) / height
+    scale_jitter = np.abs(np.log(boxes[:, 3] / boxes[previous, 3]))
+    bbox_drift = np.maximum(np.linalg.norm(centers - np.median(centers, axis=0), axis=1),
+                            np.abs(ground - np.median(ground))) / height
+    iou = np.array([alpha_iou(silhouettes[i], silhouettes[j]) for i, j in enumerate(previous)])
+
+    metrics = {'center_jitter': center_jitter, 'scale_jitter': scale_jitter, 'bbox_drift': bbox_drift, 'alpha_iou': iou}
+    summary = {}
+    for metric, values in metrics.items():
+        lower_is_worse = metric == 'alpha_iou'
+        scored = np.arange(1 if lower_is_worse and len(names) > 1 else 0, len(names))
+        worst = int(scored[values[scored].argmin() if lower_is_worse else values[scored].argmax()])
+        failing = values < thresholds[metric] if lower_is_worse else values > thresholds[metric]
+        summary[metric] = {
+            'worst': round(float(values[worst]), 4),
+            'worst_frame': names[worst],
+            'mean': round(float(values[scored].mean()), 4),
+            'limit': thresholds[metric],
+            'failing_frames': [names[i] for i in scored if failing[i]],
+        }
+
     return {
-        'center': (center_x, center_y),
-        'bbox': (min_x, min_y, max_x, max_y),
-        'width': bbox_w,
-        'height': bbox_h
+        'frames': len(names),
+        'passed': not any(entry['failing_frames'] for entry in summary.values()),
+        'loop_closure_iou': round(float(iou[0]), 4),
+        'metrics': summary,
+        'per_frame': {
+            name: {metric: round(float(values[i]), 4) for metric, values in metrics.items()}
+            for i, name in enumerate(names)
+        },
     }
 
+def check_folders(folders, thresholds=THRESHOLDS, workers=WORKERS, on_result=None, codec=FRAME_CODEC):
+    """QA report for every folder; the frames of all folders are measured in one worker pool"""
+    sequences = {folder: frame_sequence(folder, codec) for folder in folders}
+    files = sorted({path for sequence in sequences.values() for _, path in sequence})
+    results = map_frames(measure_frame, [(path,) for path in files], workers, on_result)
+    measured = {path: result for path, (result, error) in zip(files, results) if error is None}
+
+    report = {'thresholds': thresholds, 'folders': {}}
+    for folder, sequence in sequences.items():
+        names = [name for name, _ in sequence]
+        report['folders'][str(folder)] = score_folder(names, [measured.get(path) for _, path in sequence], thresholds)
+    report['passed'] = all(entry['passed'] for entry in report['folders'].values())
+    return report
+
 def main():
-    folder = Path(FOLDER)
-    frame_files = sorted(folder.glob('frame_*.png'))[:10]  # Check first 10 frames
-    
-    print("Analyzing frame positions...")
+    parser = argparse.ArgumentParser(description="Score the alignment of every frame of the output folders")
+    parser.add_argument('folders', nargs='*', help="Frame folders to check (default: every output folder)")
+    parser.add_argument('--codec', default=FRAME_CODEC, choices=list(CODECS),
+                        help=f"Codec the frames were written with (default: {FRAME_CODEC})")
+    parser.add_argument('--report', default=REPORT_FILE, help=f"JSON report to write (default: {REPORT_FILE})")
+    parser.add_argument('--workers', type=int, default=WORKERS,
+                        help="Worker processes (1 = serial, 0 = one per CPU core)")
+    args = parser.parse_args()
+
+    folders = args.folders or default_folders(args.codec)
+    if not folders:
+        print("No frame folders to check")
+        return
+
+    print(f"Checking {len(folders)} folders: {', '.join(map(str, folders))}")
+
+    def report_progress(i, result, error):
+        if error:
+            print(f"✗ {error}")
+        if i % 50 == 0:
+            print(f"✓ {i} frames measured")
+
+    report = check_folders(folders, THRESHOLDS, args.workers, report_progress, args.codec)
+    Path(args.report).write_text(json.dumps(report, indent=1))
+
     print("=" * 80)
-    
-    results = []
-    for frame_path in frame_files:
-        info = analyze_frame(frame_path)
-        if info:
-            results.append((frame_path.name, info))
-            print(f"{frame_path.name}:")
-            print(f"  Center: {info['center']}")
-            print(f"  BBox: ({info['bbox'][0]}, {info['bbox'][1]}) to ({info['bbox'][2]}, {info['bbox'][3]})")
-            print(f"  Size: {info['width']}x{info['height']}")
-            print()
-    
-    # Check variance
-    if len(results) > 1:
-        centers = [r[1]['center'] for r in results]
-        center_xs = [c[0] for c in centers]
-        center_ys = [c[1] for c in centers]
-        
-        print("=" * 80)
-        print("VARIANCE ANALYSIS:")
-        print(f"Center X range: {min(center_xs)} to {max(center_xs)} (variance: {max(center_xs) - min(center_xs)} pixels)")
-        print(f"Center Y range: {min(center_ys)} to {max(center_ys)} (variance: {max(center_ys) - min(center_ys)} pixels)")
-        print()
-        
-        if max(center_xs) - min(center_xs) > 5 or max(center_ys) - min(center_ys) > 5:
-            print("❌ PROBLEM DETECTED: Car centers vary by more than 5 pixels!")
-        else:
-            print("✓ Car centers are well-aligned (< 5 pixel variance)")
+    for folder, entry in report['folders'].items():
+        print(f"{'✓' if entry['passed'] else '❌'} {folder} ({entry['frames']} frames)")
+        for problem in entry.get('problems', []):
+            print(f"    {problem}")
+        for metric, summary in entry.get('metrics', {}).items():
+            flag = f"  {len(summary['failing_frames'])} frames past {summary['limit']}" if summary['failing_frames'] else ""
+            print(f"    {metric:14s} worst {summary['worst']:.4f} ({summary['worst_frame']}){flag}")
+        if 'loop_closure_iou' in entry:
+            print(f"    {'loop closure':14s} alpha_iou {entry['loop_closure_iou']:.4f} (last frame to first, not scored)")
+    print("=" * 80)
+    print(f"{'✅ All folders pass' if report['passed'] else '❌ Alignment check failed'}; report: {args.report}")
+
+    # Non-zero exit so a publishing job can gate on the check
+    if not report['passed']:
+        sys.exit(1)
 
 if __name__ == '__main__':
     main()
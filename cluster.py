@@ -0,0 +1,346 @@
+import argparse
+import json
+import multiprocessing
+import os
+import socket
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+import geometry_index
+from batch import find_spin_sets, prepare_set
+from encoders import CODECS, FRAME_CODEC, is_available
+from parallel import call_frame
+from pipeline import DEFAULT_VARIANTS, VARIANTS, frame_analysis, render_frame
+
+# Configuration
+QUEUE_FILE = '.job_queue.sqlite'  # Kept on the shared storage, next to the spin sets
+# A task is handed to another node when its lease is not renewed for this
+# long (FRAME_LEASE_SECONDS overrides); leases are renewed every quarter of it
+LEASE_SECONDS = float(os.environ.get('FRAME_LEASE_SECONDS', 60))
+HEARTBEAT_SECONDS = LEASE_SECONDS / 4
+POLL_SECONDS = 1.0  # Wait before asking again while other nodes hold the remaining tasks
+MAX_ATTEMPTS = 3  # Leases per task before it is marked failed
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    id INTEGER PRIMARY KEY,
+    spin_set TEXT NOT NULL,
+    stage TEXT NOT NULL,
+    frame TEXT NOT NULL,
+    state TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    owner TEXT,
+    lease_expires REAL,
+    result TEXT,
+    error TEXT,
+    UNIQUE (spin_set, stage, frame)
+);
+CREATE INDEX IF NOT EXISTS tasks_state ON tasks (state);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+"""
+
+# prepare unblocks a whole set and renders finish one, so both go before analysis
+STAGE_ORDER = "CASE stage WHEN 'prepare' THEN 0 WHEN 'render' THEN 1 ELSE 2 END"
+
+def open_queue(path):
+    """Connection to the queue database; writes go through transaction()"""
+    conn = sqlite3.connect(str(path), timeout=60, isolation_level=None)
+    # Rollback journal rather than WAL: WAL needs shared memory, which a
+    # network file system cannot provide across machines
+    conn.execute('PRAGMA journal_mode=DELETE')
+    conn.executescript(SCHEMA)
+    return conn
+
+@contextmanager
+def transaction(conn):
+    """Take the database write lock up front, so nodes never interleave a read-then-write"""
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        yield
+    except BaseException:
+        conn.execute('ROLLBACK')
+        raise
+    conn.execute('COMMIT')
+
+def queue_config(conn):
+    row = conn.execute("SELECT value FROM meta WHERE key = 'config'").fetchone()
+    return json.loads(row[0]) if row else None
+
+def submit(root, variant_names=DEFAULT_VARIANTS, codec=FRAME_CODEC, queue=None):
+    """Queue an analyze task for every frame of every spin set under root.
+
+    Frames already analyzed are kept unless the file changed. A set with
+    new, changed, removed or failed frames has its prepare and render
+    tasks dropped so they are queued again; a different variant list or
+    codec drops them for every set. Failed prepare and render tasks of
+    the other sets get MAX_ATTEMPTS more tries. Returns the number of
+    tasks queued.
+    """
+    root = Path(root)
+    conn = open_queue(queue or root / QUEUE_FILE)
+    config = {'variants': sorted(variant_names), 'codec': codec}
+    queued = 0
+
+    with transaction(conn):
+        if queue_config(conn) != config:
+            conn.execute("DELETE FROM tasks WHERE stage != 'analyze'")
+            conn.execute("INSERT OR REPLACE INTO meta VALUES ('config', ?)", (json.dumps(config),))
+
+        for folder in find_spin_sets(root):
+            name = folder.name
+            frame_files = {frame_path.name: frame_path for frame_path in folder.glob('frame_*.png')}
+            analyzed = dict(conn.execute("SELECT frame, result FROM tasks WHERE spin_set = ? AND stage = 'analyze' "
+                                         "AND state = 'done'", (name,)).fetchall())
+            known = {frame for (frame,) in conn.execute(
+                "SELECT frame FROM tasks WHERE spin_set = ? AND stage = 'analyze'", (name,))}
+
+            changed = [frame for frame, result in analyzed.items() if frame in frame_files and
+                       geometry_index.lookup({frame: json.loads(result)}, frame_files[frame]) is None]
+            changed += [frame for (frame,) in conn.execute(
+                "SELECT frame FROM tasks WHERE spin_set = ? AND stage = 'analyze' AND state = 'failed'", (name,))
+                if frame in frame_files]
+            removed = known - set(frame_files)
+            added = set(frame_files) - known
+            if not (changed or removed or added):
+                cursor = conn.execute("UPDATE tasks SET state = 'ready', attempts = 0, error = NULL "
+                                      "WHERE spin_set = ? AND state = 'failed'", (name,))
+                queued += cursor.rowcount
+                # Requeues prepare when a new config dropped it
+                unlock_next(conn, name, 'analyze')
+                continue
+
+            conn.executemany("DELETE FROM tasks WHERE spin_set = ? AND stage = 'analyze' AND frame = ?",
+                             [(name, frame) for frame in changed + sorted(removed)])
+            conn.execute("DELETE FROM tasks WHERE spin_set = ? AND stage != 'analyze'", (name,))
+            new = sorted(changed + sorted(added))
+            conn.executemany("INSERT INTO tasks (spin_set, stage, frame, state) VALUES (?, 'analyze', ?, 'ready')",
+                             [(name, frame) for frame in new])
+            queued += len(new)
+
+    conn.close()
+    return queued
+
+def lease_task(conn, node):
+    """Lease the next ready task, or one whose node stopped renewing it; None when there is none"""
+    now = time.time()
+    with transaction(conn):
+        expired = conn.execute("SELECT id, spin_set, stage FROM tasks WHERE state = 'leased' AND lease_expires < ? "
+                               "AND attempts >= ?", (now, MAX_ATTEMPTS)).fetchall()
+        for task_id, spin_set, stage in expired:
+            conn.execute("UPDATE tasks SET state = 'failed', error = 'lease expired ' || attempts || ' times' "
+                         "WHERE id = ?", (task_id,))
+            settle_task(conn, spin_set, stage, 'failed')
+        row = conn.execute(f"SELECT id, spin_set, stage, frame FROM tasks "
+                           f"WHERE state = 'ready' OR (state = 'leased' AND lease_expires < ?) "
+                           f"ORDER BY {STAGE_ORDER}, id LIMIT 1", (now,)).fetchone()
+        if row is None:
+            return None
+        conn.execute("UPDATE tasks SET state = 'leased', owner = ?, lease_expires = ?, attempts = attempts + 1 "
+                     "WHERE id = ?", (node, now + LEASE_SECONDS, row[0]))
+    return row
+
+def renew_lease(conn, task_id, node):
+    """Extend a lease this node still holds; False if it was lost"""
+    with transaction(conn):
+        cursor = conn.execute("UPDATE tasks SET lease_expires = ? WHERE id = ? AND owner = ? AND state = 'leased'",
+                              (time.time() + LEASE_SECONDS, task_id, node))
+    return cursor.rowcount == 1
+
+def unlock_next(conn, spin_set, stage):
+    """Queue the tasks that the finished stage of a set was holding back"""
+    if stage == 'analyze':
+        open_tasks = conn.execute("SELECT COUNT(*) FROM tasks WHERE spin_set = ? AND stage = 'analyze' "
+                                  "AND state IN ('ready', 'leased')", (spin_set,)).fetchone()[0]
+        if open_tasks == 0:
+            conn.execute("INSERT OR IGNORE INTO tasks (spin_set, stage, frame, state) VALUES (?, 'prepare', '', 'ready')",
+                         (spin_set,))
+    elif stage == 'prepare':
+        conn.execute("INSERT OR IGNORE INTO tasks (spin_set, stage, frame, state) "
+                     "SELECT spin_set, 'render', frame, 'ready' FROM tasks "
+                     "WHERE spin_set = ? AND stage = 'analyze' AND state = 'done'", (spin_set,))
+
+def settle_task(conn, spin_set, stage, state):
+    """Queue what a task that ended as state ('done' or 'failed') was holding back.
+
+    A failed analyze still finishes its stage: the set goes on without
+    that frame, as in batch.py. A failed prepare leaves the set without
+    renders until submit retries it.
+    """
+    if state == 'done' or stage == 'analyze':
+        unlock_next(conn, spin_set, stage)
+
+def complete_task(conn, task, node, result, error):
+    """Record the outcome of a leased task; False if the lease had passed to another node.
+
+    A failed task is queued again until it has been tried MAX_ATTEMPTS
+    times. Outputs are already in place (written atomically) when this
+    runs, so a node that dies in between only costs a repeat of the task.
+    """
+    task_id, spin_set, stage, _ = task
+    with transaction(conn):
+        row = conn.execute("SELECT attempts FROM tasks WHERE id = ? AND owner = ? AND state = 'leased'",
+                           (task_id, node)).fetchone()
+        if row is None:
+            return False
+        if error is None:
+            state = 'done'
+            conn.execute("UPDATE tasks SET state = 'done', result = ?, error = NULL WHERE id = ?",
+                         (json.dumps(result), task_id))
+        else:
+            state = 'failed' if row[0] >= MAX_ATTEMPTS else 'ready'
+            conn.execute("UPDATE tasks SET state = ?, error = ? WHERE id = ?", (state, error, task_id))
+        if state != 'ready':
+            settle_task(conn, spin_set, stage, state)
+    return True
+
+def prepare_task(analyses, variant_names, folder):
+    """Variant parameters of a set, with its output folders created"""
+    prepared = prepare_set(analyses, variant_names)
+    for variant in prepared['params']:
+        (folder / VARIANTS[variant]['output']).mkdir(exist_ok=True)
+    return prepared
+
+def task_call(conn, root, task, config):
+    """(function, args) that carries out a task, with its inputs read from the queue"""
+    _, spin_set, stage, frame = task
+    folder = Path(root) / spin_set
+
+    def analysis(frame_name):
+        row = conn.execute("SELECT result FROM tasks WHERE spin_set = ? AND stage = 'analyze' AND frame = ?",
+                           (spin_set, frame_name)).fetchone()
+        return frame_analysis(geometry_index.as_geometry(json.loads(row[0])))
+
+    if stage == 'analyze':
+        return geometry_index.measure_frame, (folder / frame,)
+    if stage == 'prepare':
+        frames = [name for (name,) in conn.execute("SELECT frame FROM tasks WHERE spin_set = ? AND stage = 'analyze' "
+                                                   "AND state = 'done' ORDER BY frame", (spin_set,))]
+        return prepare_task, ([analysis(name) for name in frames], config['variants'], folder)
+
+    row = conn.execute("SELECT result FROM tasks WHERE spin_set = ? AND stage = 'prepare'", (spin_set,)).fetchone()
+    params = json.loads(row[0])['params']
+    return render_frame, (folder / frame, None, analysis(frame), params, config['codec'], folder)
+
+def heartbeat(queue_path, node, current, stop):
+    """Renew the lease of the task in current['id'] until stop is set"""
+    conn = open_queue(queue_path)
+    while not stop.wait(HEARTBEAT_SECONDS):
+        task_id = current.get('id')
+        if task_id is not None:
+            # A lost lease is noticed when the task completes
+            renew_lease(conn, task_id, node)
+    conn.close()
+
+def run_node(root, queue=None, node=None, on_event=print):
+    """Lease and run tasks until the queue has nothing left that is ready or leased.
+
+    Returns the number of tasks this node completed.
+    """
+    queue_path = Path(queue or Path(root) / QUEUE_FILE)
+    node = node or f"{socket.gethostname()}:{os.getpid()}"
+    conn = open_queue(queue_path)
+    config = queue_config(conn)
+    if config is None:
+        raise ValueError(f"Nothing submitted to {queue_path}")
+
+    current = {}
+    stop = threading.Event()
+    thread = threading.Thread(target=heartbeat, args=(queue_path, node, current, stop), daemon=True)
+    thread.start()
+    completed = 0
+    try:
+        while True:
+            task = lease_task(conn, node)
+            if task is None:
+                open_tasks = conn.execute("SELECT COUNT(*) FROM tasks WHERE state IN ('ready', 'leased')").fetchone()[0]
+                if open_tasks == 0:
+                    break
+                time.sleep(POLL_SECONDS)
+                continue
+
+            task_id, spin_set, stage, frame = task
+            current['id'] = task_id
+            func, args = task_call(conn, root, task, config)
+            result, error = call_frame(func, args)
+            current['id'] = None
+
+            label = f"{spin_set}/{frame}" if frame else spin_set
+            if not complete_task(conn, task, node, result, error):
+                on_event(f"⚠️  {node}: lease on {stage} {label} expired, result dropped")
+            elif error:
+                on_event(f"✗ {node}: {stage} {label}: {error}")
+            else:
+                completed += 1
+    finally:
+        stop.set()
+        thread.join()
+        conn.close()
+    return completed
+
+def node_main(root, queue, index):
+    """Entry point of a local node process"""
+    node = f"{socket.gethostname()}:{os.getpid()}"
+    done = run_node(root, queue, node)
+    print(f"✓ node {index} ({node}): {done} tasks")
+
+def print_status(root, queue=None):
+    conn = open_queue(queue or Path(root) / QUEUE_FILE)
+    rows = conn.execute("SELECT spin_set, stage, state, COUNT(*) FROM tasks GROUP BY spin_set, stage, state "
+                        "ORDER BY spin_set, stage, state").fetchall()
+    leases = conn.execute("SELECT owner, COUNT(*), MIN(lease_expires) FROM tasks WHERE state = 'leased' "
+                          "GROUP BY owner").fetchall()
+    conn.close()
+    if not rows:
+        print("Queue is empty")
+        return
+    for spin_set, stage, state, count in rows:
+        print(f"{spin_set:30s} {stage:8s} {state:8s} {count}")
+    now = time.time()
+    for owner, count, expires in leases:
+        status = f"expires in {expires - now:.0f}s" if expires > now else f"expired {now - expires:.0f}s ago"
+        print(f"🔒 {owner}: {count} leased, {status}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Process spin sets on several machines through a shared task queue")
+    parser.add_argument('command', choices=['submit', 'work', 'status'],
+                        help="submit: queue the spin sets; work: run nodes here; status: show the queue")
+    parser.add_argument('root', help="Shared directory with one sub-folder of frame_*.png per spin set")
+    parser.add_argument('variants', nargs='*',
+                        help=f"Output variants to build, for submit (default: {' '.join(DEFAULT_VARIANTS)})")
+    parser.add_argument('--queue', help=f"Queue database (default: <root>/{QUEUE_FILE})")
+    parser.add_argument('--codec', default=FRAME_CODEC, choices=list(CODECS),
+                        help=f"Output encoder, for submit (default: {FRAME_CODEC})")
+    parser.add_argument('--nodes', type=int, default=1,
+                        help="Node processes to run on this machine, for work (default: 1)")
+    args = parser.parse_args()
+
+    if args.command == 'status':
+        print_status(args.root, args.queue)
+        return
+
+    if args.command == 'submit':
+        variant_names = args.variants or DEFAULT_VARIANTS
+        unknown = [name for name in variant_names if name not in VARIANTS]
+        if unknown:
+            parser.error(f"unknown variants: {', '.join(unknown)}")
+        if not is_available(args.codec):
+            parser.error(f"codec {args.codec} is not supported by this OpenCV build")
+        queued = submit(args.root, variant_names, args.codec, args.queue)
+        print(f"✅ Queued {queued} tasks from {args.root} ({', '.join(variant_names)}, {args.codec})")
+        print(f"Start nodes with: python cluster.py work {args.root}")
+        return
+
+    print(f"Starting {args.nodes} nodes on {socket.gethostname()} (lease {LEASE_SECONDS:g}s)...")
+    processes = [multiprocessing.Process(target=node_main, args=(args.root, args.queue, i))
+                 for i in range(1, args.nodes + 1)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    print_status(args.root, args.queue)
+
+if __name__ == '__main__':
+    main()
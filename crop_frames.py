@@ -0,0 +1,123 @@
+import json
+import os
+import cv2
+import numpy as np
+from pathlib import Path
+
+from encoders import FRAME_CODEC, codec_extension, save_frame
+from geometry_index import build_index
+from parallel import WORKERS, map_frames
+
+# Configuration
+INPUT_FOLDER = 'car_frames_final'
+OUTPUT_FOLDER = 'car_frames_final_cropped'
+MANIFEST_FILE = 'manifest.json'  # Canvas size + per-frame paste rectangles for the viewer
+# 'tight' crops every frame to its own car, 'union' crops all frames to one shared box
+CROP_MODE = os.environ.get('CROP_MODE', 'tight')
+
+def load_references(folder, extension=None):
+    """Frames dedupe_frames.py collapsed in a folder: {frame name: name of the frame shown instead}.
+
+    With extension, both names get that suffix, for a copy of the folder
+    written with another codec.
+    """
+    try:
+        references = json.loads((Path(folder) / MANIFEST_FILE).read_text()).get('references', {})
+    except (OSError, ValueError):
+        return {}
+    if extension:
+        references = {Path(name).stem + extension: Path(source).stem + extension
+                      for name, source in references.items()}
+    return references
+
+def union_bbox(bboxes):
+    """Smallest box containing every (x, y, w, h) box"""
+    x1 = min(x for x, _, _, _ in bboxes)
+    y1 = min(y for _, y, _, _ in bboxes)
+    x2 = max(x + w for x, _, w, _ in bboxes)
+    y2 = max(y + h for _, y, _, h in bboxes)
+    return (x1, y1, x2 - x1, y2 - y1)
+
+def crop_frame(frame_path, output_folder, bbox, codec=FRAME_CODEC):
+    """Save the bbox region of a rendered canvas; an empty frame becomes one transparent pixel.
+
+    Returns the name of the file written.
+    """
+    img = cv2.imread(str(frame_path), cv2.IMREAD_UNCHANGED)
+
+    if img is None:
+        raise ValueError(f"Failed to load: {frame_path.name}")
+
+    if bbox is None:
+        crop = np.zeros((1, 1, 4), dtype=np.uint8)
+    else:
+        x, y, w, h = bbox
+        crop = img[y:y+h, x:x+w]
+
+    return save_frame(output_folder / frame_path.name, crop, codec).name
+
+def main():
+    input_folder = Path(INPUT_FOLDER)
+    output_folder = Path(OUTPUT_FOLDER)
+    output_folder.mkdir(exist_ok=True)
+
+    # The input folder was rendered with the same codec the crops are written with
+    extension = codec_extension(FRAME_CODEC)
+    frame_files = sorted(input_folder.glob(f'frame_*{extension}'))
+
+    if not frame_files:
+        print(f"No frames found in {INPUT_FOLDER}")
+        return
+
+    if CROP_MODE not in ('tight', 'union'):
+        print(f"Unknown CROP_MODE: {CROP_MODE} (use 'tight' or 'union')")
+        return
+
+    # Every rendered frame shares the canvas size, so the first one gives it
+    canvas_h, canvas_w = cv2.imread(str(frame_files[0]), cv2.IMREAD_UNCHANGED).shape[:2]
+
+    print(f"Cropping {len(frame_files)} frames from {INPUT_FOLDER} ({CROP_MODE}, {FRAME_CODEC})...")
+    geometry = build_index(input_folder, WORKERS, extension)
+    bboxes = [geometry[frame_path.name]['bbox'] if frame_path.name in geometry else None
+              for frame_path in frame_files]
+
+    if CROP_MODE == 'union':
+        found = [bbox for bbox in bboxes if bbox is not None]
+        if not found:
+            print("No car found in any frame!")
+            return
+        shared = union_bbox(found)
+        bboxes = [shared] * len(frame_files)
+        print(f"Union bounding box: {shared}")
+
+    def report(i, result, error):
+        if error:
+            print(f"✗ {error}")
+        if i % 10 == 0:
+            print(f"✓ {i}/{len(frame_files)} frames")
+
+    results = map_frames(crop_frame, [(frame_path, output_folder, bbox, FRAME_CODEC) for frame_path, bbox in zip(frame_files, bboxes)],
+                         WORKERS, report)
+
+    # The viewer pastes each crop back at its offset on a canvas of this size
+    manifest = {
+        'canvas': [canvas_w, canvas_h],
+        'mode': CROP_MODE,
+        'frames': {
+            name: list(bbox) if bbox is not None else [0, 0, 1, 1]
+            for bbox, (name, error) in zip(bboxes, results)
+            if error is None
+        }
+    }
+    references = load_references(input_folder, extension)
+    if references:
+        manifest['references'] = references
+    (output_folder / MANIFEST_FILE).write_text(json.dumps(manifest, indent=1))
+
+    before = sum(frame_path.stat().st_size for frame_path in frame_files)
+    after = sum((output_folder / name).stat().st_size for name in manifest['frames'])
+    print(f"\n✅ {len(manifest['frames'])}/{len(frame_files)} frames saved to {OUTPUT_FOLDER}")
+    print(f"Size: {before / 1e6:.1f} MB -> {after / 1e6:.1f} MB")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+import argparse
+import json
+import os
+import shutil
+import numpy as np
+from pathlib import Path
+
+from crop_frames import MANIFEST_FILE, load_references
+from geometry_index import build_index
+from parallel import WORKERS
+
+# Configuration
+INPUT_FOLDER = 'car_frames_final'
+# Perceptual hash bits (of 128) two frames may differ in and still count as
+# one (FRAME_DEDUPE_DISTANCE overrides); neighbors 4-5 degrees apart differ in 2 or more
+MAX_DISTANCE = int(os.environ.get('FRAME_DEDUPE_DISTANCE', 1))
+
+def hash_bits(hashes):
+    """(N, bits) array of 0/1 from hex perceptual hashes (alpha_stats.perceptual_hash)"""
+    packed = np.array([np.frombuffer(bytes.fromhex(h), dtype=np.uint8) for h in hashes])
+    return np.unpackbits(packed, axis=1)
+
+def find_references(names, hashes, max_distance=MAX_DISTANCE):
+    """{name: name of the frame it repeats} for frames in order.
+
+    A run of near-identical frames (a paused turntable, copies made by
+    fill_missing_frames.py) collapses onto its first frame. Each frame is
+    compared with that first frame rather than its predecessor, so a slow
+    turn cannot creep through in steps below max_distance.
+    """
+    if not names:
+        return {}
+    bits = hash_bits(hashes)
+    references = {}
+    anchor = 0
+    for i in range(1, len(names)):
+        if np.count_nonzero(bits[i] != bits[anchor]) <= max_distance:
+            references[names[i]] = names[anchor]
+        else:
+            anchor = i
+    return references
+
+def save_references(folder, references):
+    """Record references in the folder's manifest, or clear them when there are none.
+
+    Other manifest keys are kept; a manifest left empty is removed.
+    """
+    manifest_path = Path(folder) / MANIFEST_FILE
+    try:
+        manifest = json.loads(manifest_path.read_text())
+    except (OSError, ValueError):
+        manifest = {}
+
+    manifest.pop('references', None)
+    if references:
+        manifest['references'] = references
+
+    if manifest:
+        manifest_path.write_text(json.dumps(manifest, indent=1))
+    elif manifest_path.exists():
+        manifest_path.unlink()
+
+def dedupe_folder(input_folder, output_folder, max_distance=MAX_DISTANCE, workers=WORKERS):
+    """Copy a frame folder keeping one frame of every near-duplicate run.
+
+    The dropped frames are listed as references in the output manifest,
+    which the viewer resolves to the frame they repeat. Crop manifests are
+    carried over. Returns the references.
+    """
+    input_folder = Path(input_folder)
+    output_folder = Path(output_folder)
+    if input_folder.resolve() == output_folder.resolve():
+        raise ValueError("Dedupe into a new folder; the input frames are pipeline outputs")
+
+    try:
+        manifest = json.loads((input_folder / MANIFEST_FILE).read_text())
+    except (OSError, ValueError):
+        manifest = {}
+    if 'sheets' in manifest or 'levels' in manifest:
+        raise ValueError(f"{input_folder} is an atlas or pyramid; dedupe the frames it was built from")
+
+    geometry = build_index(input_folder, workers)
+    names = sorted(geometry)
+    if not names:
+        raise ValueError(f"No frames found in {input_folder}")
+
+    references = find_references(names, [geometry[name]['phash'] for name in names], max_distance)
+    # Frames already collapsed in the input may point at a frame collapsed now
+    references.update(load_references(input_folder))
+    for name, source in references.items():
+        while source in references:
+            source = references[source]
+        references[name] = source
+
+    output_folder.mkdir(exist_ok=True)
+    for stale in output_folder.glob('frame_*.*'):
+        stale.unlink()
+    kept = [name for name in names if name not in references]
+    for name in kept:
+        shutil.copy2(input_folder / name, output_folder / name)
+
+    if 'frames' in manifest:
+        manifest['frames'] = {name: rect for name, rect in manifest['frames'].items() if name not in references}
+    (output_folder / MANIFEST_FILE).unlink(missing_ok=True)
+    if manifest:
+        (output_folder / MANIFEST_FILE).write_text(json.dumps(manifest, indent=1))
+    save_references(output_folder, references)
+    return references
+
+def main():
+    parser = argparse.ArgumentParser(description="Collapse near-duplicate frames into manifest references")
+    parser.add_argument('--input', default=INPUT_FOLDER, help=f"Frame folder (default: {INPUT_FOLDER})")
+    parser.add_argument('--output', help="Output folder (default: <input>_dedup)")
+    parser.add_argument('--distance', type=int, default=MAX_DISTANCE,
+                        help=f"Hash bits frames may differ in and still be duplicates (default: {MAX_DISTANCE})")
+    args = parser.parse_args()
+    output = args.output or f"{args.input}_dedup"
+
+    print(f"Hashing the frames of {args.input} (duplicates within {args.distance} bits)...")
+    try:
+        references = dedupe_folder(args.input, output, args.distance)
+    except ValueError as e:
+        print(e)
+        return
+
+    for name, source in sorted(references.items()):
+        print(f"🔗 {name} -> {source}")
+    frame_files = sorted(Path(output).glob('frame_*.*'))
+    size = sum(frame_path.stat().st_size for frame_path in frame_files)
+    print(f"\n✅ {len(frame_files)} frames kept, {len(references)} references in {output}/{MANIFEST_FILE}")
+    print(f"Size: {size / 1e6:.1f} MB")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+import os
+import secrets
+import socket
+import time
+import cv2
+import numpy as np
+from pathlib import Path
+
+from tracing import span
+
+# Configuration
+# Output codec for rendered frames (FRAME_CODEC overrides); 'png' is what
+# the stages always wrote
+FRAME_CODEC = os.environ.get('FRAME_CODEC', 'png')
+BENCHMARK_FOLDER = 'car_frames_final'
+BENCHMARK_FRAMES = 10  # Frames encoded per codec in the report
+
+# name: (extension, cv2.imwrite parameters)
+CODECS = {
+    'png': ('.png', []),
+    'png-balanced': ('.png', [cv2.IMWRITE_PNG_COMPRESSION, 6,
+                              cv2.IMWRITE_PNG_FILTER, cv2.IMWRITE_PNG_ALL_FILTERS]),
+    'png-max': ('.png', [cv2.IMWRITE_PNG_COMPRESSION, 9]),
+    'webp-lossless': ('.webp', [cv2.IMWRITE_WEBP_QUALITY, 101]),  # Quality above 100 is lossless
+    'webp': ('.webp', [cv2.IMWRITE_WEBP_QUALITY, 90]),
+}
+# Builds without AVIF support lack the constant as well as the encoder
+if getattr(cv2, 'IMWRITE_AVIF_QUALITY', None) is not None:
+    CODECS['avif'] = ('.avif', [cv2.IMWRITE_AVIF_QUALITY, 80])
+
+def is_available(codec):
+    """True if the local OpenCV build can encode BGRA images with codec"""
+    extension, params = CODECS[codec]
+    try:
+        ok, _ = cv2.imencode(extension, np.zeros((8, 8, 4), dtype=np.uint8), params)
+    except cv2.error:
+        return False
+    return bool(ok)
+
+def codec_extension(codec=FRAME_CODEC):
+    """File extension written by codec"""
+    if codec not in CODECS:
+        raise ValueError(f"Unknown codec: {codec} (choose from {', '.join(CODECS)})")
+    return CODECS[codec][0]
+
+def encode_frame(img, codec=FRAME_CODEC):
+    """Encoded bytes of one frame"""
+    extension = codec_extension(codec)
+    ok, buffer = cv2.imencode(extension, img, CODECS[codec][1])
+    if not ok:
+        raise ValueError(f"Could not encode with {codec}")
+    return buffer.tobytes()
+
+def temporary_path(path):
+    """Hidden name next to path for writing it before a rename.
+
+    Frame globs do not match it, and it carries the host, process and a
+    random token, so writers sharing a folder over a network mount never
+    pick the same name.
+    """
+    path = Path(path)
+    name = path.name.lstrip('.')
+    return path.with_name(f".{name}.{socket.gethostname()}.{os.getpid()}.{secrets.token_hex(4)}.tmp")
+
+def write_atomic(path, data):
+    """Write bytes so that readers see the old file or the whole new one, never a partial write.
+
+    The data goes to a temporary_path() file, created exclusively, which
+    is then renamed over path.
+    """
+    path = Path(path)
+    tmp_path = temporary_path(path)
+    f = open(tmp_path, 'xb')
+    try:
+        with f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+
+def save_frame(output_path, img, codec=FRAME_CODEC):
+    """Write a frame with codec, replacing the file extension; returns the path written"""
+    output_path = Path(output_path).with_suffix(codec_extension(codec))
+    with span('imwrite', 'io', frame=output_path.name, codec=codec):
+        write_atomic(output_path, encode_frame(img, codec))
+    return output_path
+
+def benchmark(images, codecs=None):
+    """Bytes and encode milliseconds per frame for every available codec"""
+    report = []
+    for codec in codecs or CODECS:
+        if not is_available(codec):
+            report.append((codec, None, None))
+            continue
+        start = time.perf_counter()
+        total = sum(len(encode_frame(img, codec)) for img in images)
+        elapsed = time.perf_counter() - start
+        report.append((codec, total / len(images), elapsed / len(images) * 1000))
+    return report
+
+def main():
+    all_files = sorted(Path(BENCHMARK_FOLDER).glob('frame_*.png'))
+    frame_files = all_files[:BENCHMARK_FRAMES]
+
+    if not frame_files:
+        print(f"No frames found in {BENCHMARK_FOLDER}")
+        return
+
+    images = [cv2.imread(str(frame_path), cv2.IMREAD_UNCHANGED) for frame_path in frame_files]
+    h, w = images[0].shape[:2]
+
+    print(f"Encoding {len(images)} frames ({w}x{h}) from {BENCHMARK_FOLDER} with each codec...")
+    print("=" * 60)
+    print(f"{'codec':<16}{'KB/frame':>12}{'ms/frame':>12}{f'MB/{len(all_files)} frames':>16}")
+
+    for codec, size, ms in benchmark(images):
+        if size is None:
+            print(f"{codec:<16}{'not supported by this OpenCV build':>40}")
+        else:
+            print(f"{codec:<16}{size / 1024:>12.1f}{ms:>12.1f}{size * len(all_files) / 1e6:>16.1f}")
+
+    print("=" * 60)
+    print(f"Current FRAME_CODEC: {FRAME_CODEC}")
+
+if __name__ == '__main__':
+    main()
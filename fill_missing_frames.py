@@ -1,43 +1,76 @@
+from bisect import bisect_left
 from pathlib import Path
 import shutil
 
+import cv2
+
+from encoders import save_frame
+from resample_frames import dense_flow, interpolate
+
 # Directories
 output_dir = Path("car_frames_nobg")
+TOTAL_FRAMES = 77  # totalFrames in script.js
+
+def frame_path(frame_num):
+    # The spin is a loop: frame TOTAL_FRAMES + 1 is frame 1 again
+    return output_dir / f"frame_{str((frame_num - 1) % TOTAL_FRAMES + 1).zfill(3)}.png"
+
+def load_frame(frame_num):
+    img = cv2.imread(str(frame_path(frame_num)), cv2.IMREAD_UNCHANGED)
+    if img is None:
+        raise ValueError(f"Failed to load: {frame_path(frame_num)}")
+    return img
 
 # Get list of existing frames
 existing_frames = set()
 for png_file in output_dir.glob("frame_*.png"):
     frame_num = int(png_file.stem.split('_')[1])
     existing_frames.add(frame_num)
+existing = sorted(existing_frames)
 
 print(f"📊 Found {len(existing_frames)} existing frames with background removed")
-print(f"🔧 Filling gaps by duplicating nearby frames...\n")
+print(f"🔧 Filling gaps by interpolating between the frames on either side...\n")
 
 # Fill missing frames
 filled_count = 0
-for frame_num in range(1, 78):
-    output_path = output_dir / f"frame_{str(frame_num).zfill(3)}.png"
-    
+flows = {}  # (before, after) -> optical flow both ways, shared by a whole gap
+for frame_num in range(1, TOTAL_FRAMES + 1):
+    output_path = frame_path(frame_num)
+
     if frame_num in existing_frames:
         print(f"✓ Frame {frame_num}: Already exists")
-    else:
-        # Find nearest existing frame
-        nearest_frame = None
-        min_distance = float('inf')
-        
-        for existing in existing_frames:
-            distance = abs(existing - frame_num)
-            if distance < min_distance:
-                min_distance = distance
-                nearest_frame = existing
-        
-        if nearest_frame:
-            source_path = output_dir / f"frame_{str(nearest_frame).zfill(3)}.png"
-            shutil.copy(source_path, output_path)
-            print(f"📋 Frame {frame_num}: Copied from frame {nearest_frame} (distance: {min_distance})")
+        continue
+    if not existing:
+        continue
+
+    # Nearest existing frames before and after the gap; a gap at either end
+    # of the set lies between the last frame and the first one
+    i = bisect_left(existing, frame_num)
+    before = existing[i - 1] if i > 0 else existing[-1] - TOTAL_FRAMES
+    after = existing[i] if i < len(existing) else existing[0] + TOTAL_FRAMES
+
+    if frame_path(before) != frame_path(after):
+        a = load_frame(before)
+        b = load_frame(after)
+        t = (frame_num - before) / (after - before)
+        pair = (frame_path(before).name, frame_path(after).name)
+        try:
+            if pair not in flows:
+                flows[pair] = dense_flow(a, b), dense_flow(b, a)
+            save_frame(output_path, interpolate(a, b, t, *flows[pair]))
+            print(f"🎞️  Frame {frame_num}: Interpolated between {pair[0]} and {pair[1]}")
             filled_count += 1
+            continue
+        except ValueError as e:
+            print(f"⚠️  Frame {frame_num}: Cannot interpolate ({e}), copying nearest frame")
+
+    # A single frame in the set (or frames that cannot be blended): copy the nearest frame
+    nearest_frame = min((before, after), key=lambda n: abs(n - frame_num))
+    shutil.copy(frame_path(nearest_frame), output_path)
+    print(f"📋 Frame {frame_num}: Copied from {frame_path(nearest_frame).name} (distance: {abs(nearest_frame - frame_num)})")
+    filled_count += 1
 
 print(f"\n{'='*60}")
 print(f"✅ Complete! Filled {filled_count} missing frames")
-print(f"📊 Total frames now: {len(list(output_dir.glob('frame_*.png')))} / 77")
+print(f"📊 Total frames now: {len(list(output_dir.glob('frame_*.png')))} / {TOTAL_FRAMES}")
 print(f"{'='*60}")
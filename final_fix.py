@@ -1,25 +1,58 @@
-import cv2
 import numpy as np
 from pathlib import Path
 
+from alpha_stats import alpha_channel, bounding_box
+from encoders import save_frame
+from frame_store import load_frame
+from parallel import WORKERS, map_frames
+from tiles import resize_into
+from tracing import span, traced
+
 INPUT_FOLDER = 'car_frames_nobg'
 OUTPUT_FOLDER = 'car_frames_final'
 CANVAS_SIZE = (800, 600)
 EXACT_CAR_SIZE = (480, 360)  # Every car will be EXACTLY this size
 EXACT_CAR_POSITION = (160, 120)  # Every car top-left corner at this exact position
 
-def get_car_bbox(image):
-    """Get tight bounding box"""
-    if image.shape[2] != 4:
-        return None
+@traced('composite', 'render')
+def place_car(img, bbox):
+    """Crop the car and place it at the exact size and position"""
+    x, y, w, h = bbox
+    
+    # Crop car
+    car = img[y:y+h, x:x+w]
+    
+    # Create canvas
+    canvas = np.zeros((CANVAS_SIZE[1], CANVAS_SIZE[0], 4), dtype=np.uint8)
     
-    alpha = image[:, :, 3]
-    coords = cv2.findNonZero(alpha)
+    # Place at EXACT position - no calculations, no center-of-mass, just exact placement
+    paste_x = EXACT_CAR_POSITION[0]
+    paste_y = EXACT_CAR_POSITION[1]
     
-    if coords is None:
-        return None
+    # Resize to EXACT size straight into place - every single car will be identical dimensions
+    with span('resize', 'render'):
+        resize_into(canvas[paste_y:paste_y+EXACT_CAR_SIZE[1],
+                           paste_x:paste_x+EXACT_CAR_SIZE[0]], car)
     
-    return cv2.boundingRect(coords)
+    return canvas
+
+def process_frame(frame_path, output_folder):
+    """Load one frame, place the car and save it"""
+    img = load_frame(frame_path)
+    
+    if img is None:
+        raise ValueError(f"Failed to load: {frame_path.name}")
+    
+    alpha = alpha_channel(img)
+    bbox = bounding_box(alpha) if alpha is not None else None
+    if bbox is None:
+        raise ValueError(f"No car detected: {frame_path.name}")
+    
+    canvas = place_car(img, bbox)
+    
+    # Save
+    output_path = output_folder / frame_path.name
+    save_frame(output_path, canvas)
 
 def main():
     input_folder = Path(INPUT_FOLDER)
@@ -32,45 +65,19 @@ def main():
     print(f"Canvas: {CANVAS_SIZE}")
     print(f"EVERY car will be: {EXACT_CAR_SIZE}")
     print(f"EVERY car positioned at: {EXACT_CAR_POSITION}")
+    print(f"Workers: {WORKERS}")
     print()
     
-    success = 0
-    for i, frame_path in enumerate(frame_files, 1):
-        img = cv2.imread(str(frame_path), cv2.IMREAD_UNCHANGED)
-        
-        if img is None:
-            continue
-        
-        bbox = get_car_bbox(img)
-        if bbox is None:
-            continue
-        
-        x, y, w, h = bbox
-        
-        # Crop car
-        car = img[y:y+h, x:x+w]
-        
-        # Resize to EXACT size - every single car will be identical dimensions
-        car_resized = cv2.resize(car, EXACT_CAR_SIZE, interpolation=cv2.INTER_LANCZOS4)
-        
-        # Create canvas
-        canvas = np.zeros((CANVAS_SIZE[1], CANVAS_SIZE[0], 4), dtype=np.uint8)
-        
-        # Place at EXACT position - no calculations, no center-of-mass, just exact placement
-        paste_x = EXACT_CAR_POSITION[0]
-        paste_y = EXACT_CAR_POSITION[1]
-        
-        canvas[paste_y:paste_y+EXACT_CAR_SIZE[1], 
-               paste_x:paste_x+EXACT_CAR_SIZE[0]] = car_resized
-        
-        # Save
-        output_path = output_folder / frame_path.name
-        cv2.imwrite(str(output_path), canvas)
-        success += 1
-        
+    def report(i, result, error):
+        if error:
+            print(f"✗ {error}")
         if i % 10 == 0:
             print(f"✓ {i}/{len(frame_files)} frames")
     
+    results = map_frames(process_frame, [(frame_path, output_folder) for frame_path in frame_files],
+                         WORKERS, report)
+    success = sum(1 for _, error in results if error is None)
+    
     print(f"\n✅ DONE!")
     print(f"All {success} cars are now:")
     print(f"   - EXACTLY {EXACT_CAR_SIZE[0]}x{EXACT_CAR_SIZE[1]} pixels")
@@ -0,0 +1,126 @@
+import argparse
+import json
+import numpy as np
+from pathlib import Path
+
+from frame_store import load_frame
+from parallel import WORKERS, map_frames
+from resample_frames import dense_flow
+
+# Configuration
+INPUT_FOLDER = 'car_frames_final'
+ANGLES_FILE = 'angles.json'  # Read by script.js from FRAME_FOLDER
+ANGLE_BINS = 360  # Entries in the angle -> frame lookup table (1 degree each)
+MIN_STEP = 2.0  # Degrees; a frame closer than this to the previous kept one is redundant
+CLOSURE_WARNING = 3.0  # Warn when the last -> first step is this many times the median step
+
+def step_motion(a_path, b_path):
+    """How far the car turns from frame a to frame b, in car widths.
+
+    The mean horizontal optical flow over the car is divided by the width
+    of the car, so the measure follows the rotation rather than the size
+    the car happens to appear at.
+    """
+    a = load_frame(a_path)
+    b = load_frame(b_path)
+    if a is None or b is None:
+        raise ValueError(f"Failed to load: {a_path.name} / {b_path.name}")
+
+    mask = a[:, :, 3] > 128 if a.shape[2] == 4 else np.ones(a.shape[:2], bool)
+    columns = np.flatnonzero(mask.any(axis=0))
+    if columns.size == 0:
+        return 0.0
+    flow = dense_flow(a, b)
+    return float(np.abs(flow[:, :, 0][mask]).mean() / (columns[-1] - columns[0] + 1))
+
+def estimate_angles(steps):
+    """Turntable angle of every frame from the motion steps between neighbors.
+
+    steps[i] is the motion from frame i to frame i + 1, and the last one is
+    the loop closure from the last frame back to the first, so together
+    they make one full revolution of 360 degrees.
+    """
+    total = sum(steps)
+    if total <= 0:
+        return [360 * i / len(steps) for i in range(len(steps))]
+    return [360 * s / total for s in np.concatenate([[0.0], np.cumsum(steps[:-1])])]
+
+def keep_frames(angles, min_step=MIN_STEP):
+    """Indices of the frames worth showing: each at least min_step past the previous one.
+
+    Frames in slow-rotation stretches, and frames almost back at the first
+    one, repeat an angle that is already covered.
+    """
+    kept = [0]
+    for i, angle in enumerate(angles[1:], 1):
+        if angle - angles[kept[-1]] >= min_step and 360 - angle >= min_step:
+            kept.append(i)
+    return kept
+
+def lookup_table(angles, kept, bins=ANGLE_BINS):
+    """For every angle bin, the index of the kept frame nearest its center (wrapping at 360)"""
+    kept_angles = np.array([angles[i] for i in kept])
+    centers = (np.arange(bins) + 0.5) * 360 / bins
+    distance = np.abs(centers[:, None] - kept_angles[None, :])
+    distance = np.minimum(distance, 360 - distance)
+    return [kept[j] for j in distance.argmin(axis=1)]
+
+def main():
+    parser = argparse.ArgumentParser(description="Estimate the turntable angle of every frame")
+    parser.add_argument('--input', default=INPUT_FOLDER, help=f"Aligned frames (default: {INPUT_FOLDER})")
+    parser.add_argument('--output', help="Folder to write angles.json to (default: the input folder)")
+    parser.add_argument('--min-step', type=float, default=MIN_STEP,
+                        help=f"Drop frames turned less than this many degrees past the previous one "
+                             f"(default: {MIN_STEP}, 0 keeps all)")
+    args = parser.parse_args()
+
+    frame_files = sorted(Path(args.input).glob('frame_*.png'))
+    if len(frame_files) < 2:
+        print(f"Need at least two frames in {args.input}")
+        return
+
+    print(f"Estimating the angles of {len(frame_files)} frames from their optical flow...")
+    print(f"Workers: {WORKERS}")
+
+    def report(i, result, error):
+        if error:
+            print(f"✗ {error}")
+        if i % 10 == 0:
+            print(f"✓ {i}/{len(frame_files)} frame pairs")
+
+    # The last pair closes the loop back to the first frame
+    jobs = [(frame_files[i], frame_files[(i + 1) % len(frame_files)]) for i in range(len(frame_files))]
+    results = map_frames(step_motion, jobs, WORKERS, report)
+    if any(error for _, error in results):
+        print("❌ Cannot estimate angles with frame pairs missing")
+        return
+    steps = [result for result, _ in results]
+
+    angles = estimate_angles(steps)
+    kept = keep_frames(angles, args.min_step)
+    frames = [int(f.stem.split('_')[1]) for f in frame_files]
+    table = {
+        'frames': frames,
+        'angles': [round(angle, 2) for angle in angles],
+        'kept': [frames[i] for i in kept],
+        'lookup': [frames[i] for i in lookup_table(angles, kept)],
+    }
+
+    output_folder = Path(args.output or args.input)
+    output_folder.mkdir(exist_ok=True)
+    (output_folder / ANGLES_FILE).write_text(json.dumps(table, separators=(',', ':')))
+
+    degrees = [360 * s / sum(steps) for s in steps] if sum(steps) > 0 else []
+    if degrees:
+        print(f"\nStep per frame: {min(degrees):.1f}° to {max(degrees):.1f}° "
+              f"(even spacing would be {360 / len(steps):.1f}°)")
+        median = float(np.median(degrees))
+        if median > 0 and degrees[-1] > CLOSURE_WARNING * median:
+            print(f"⚠️  The last frame is {degrees[-1]:.1f}° from the first; "
+                  f"the set may not cover a full revolution")
+    print(f"✅ {len(kept)}/{len(frames)} frames kept, "
+          f"{len(frames) - len(kept)} redundant in slow-rotation sections")
+    print(f"Output: {output_folder / ANGLES_FILE}")
+
+if __name__ == '__main__':
+    main()
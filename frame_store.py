@@ -0,0 +1,309 @@
+import hashlib
+import json
+import mmap
+import os
+import cv2
+import numpy as np
+from pathlib import Path
+
+from encoders import temporary_path
+from parallel import WORKERS, map_frames
+from tracing import span
+
+# Configuration
+INGEST_FOLDERS = ['car_frames', 'car_frames_nobg']
+STORE_FILE = '.frame_store.bgra'  # Raw frames stored next to the originals
+STORE_MAGIC = b'FRAMESTORE1\n'
+STORE_ALIGNMENT = 4096  # Frame data starts on a page boundary
+FRAME_PATTERNS = ('frame_*.png', 'frame_*.jpg')
+
+# Stores this process has already mapped, by folder
+_open_stores = {}
+
+def list_frames(folder):
+    """Frame files of a folder, PNG and JPEG"""
+    frame_files = []
+    for pattern in FRAME_PATTERNS:
+        frame_files.extend(Path(folder).glob(pattern))
+    return sorted(frame_files)
+
+def decode_file(frame_path):
+    """Decode a frame and hash its bytes from a single read"""
+    data = Path(frame_path).read_bytes()
+    img = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_UNCHANGED)
+    return img, hashlib.sha1(data).hexdigest()
+
+class FrameStore:
+    """Read-only memory map of a decoded frame set.
+
+    Layout: magic, header length and data offset (little-endian uint64),
+    a JSON header with one index entry per frame, then an N x H x W x 4
+    uint8 BGRA array starting at the data offset. Frames smaller than H x W
+    sit in the top-left corner of their slot; 3-channel frames are stored
+    with an opaque alpha channel and read back as BGR.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        with open(self.path, 'rb') as f:
+            if f.read(len(STORE_MAGIC)) != STORE_MAGIC:
+                raise ValueError(f"Not a frame store: {self.path}")
+            header_len = int.from_bytes(f.read(8), 'little')
+            offset = int.from_bytes(f.read(8), 'little')
+            self.header = json.loads(f.read(header_len))
+
+        self.entries = self.header['frames']
+        self.positions = {entry['name']: i for i, entry in enumerate(self.entries)}
+        shape = (len(self.entries), self.header['height'], self.header['width'], 4)
+        self.data = np.memmap(self.path, dtype=np.uint8, mode='r', offset=offset, shape=shape)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def entry(self, name):
+        """Index entry of a frame, or None"""
+        position = self.positions.get(name)
+        return self.entries[position] if position is not None else None
+
+    def is_current(self, frame_path):
+        """True if the stored frame was decoded from the file as it is now"""
+        entry = self.entry(Path(frame_path).name)
+        if entry is None:
+            return False
+        stat = os.stat(frame_path)
+        return entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns
+
+    def frame(self, name):
+        """Zero-copy view of a frame, shaped like cv2.imread(..., IMREAD_UNCHANGED)"""
+        position = self.positions[name]
+        entry = self.entries[position]
+        view = self.data[position, :entry['height'], :entry['width']]
+        return view if entry['channels'] == 4 else view[:, :, :3]
+
+def open_store(folder):
+    """The folder's frame store, or None if it has not been ingested"""
+    path = Path(folder) / STORE_FILE
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+
+    # Reuse the mapping unless the store was rebuilt since it was opened
+    key = (stat.st_ino, stat.st_mtime_ns)
+    cached = _open_stores.get(str(path))
+    if cached is not None and cached[0] == key:
+        return cached[1]
+
+    try:
+        store = FrameStore(path)
+    except (OSError, ValueError, KeyError):
+        return None
+    _open_stores[str(path)] = (key, store)
+    return store
+
+def stored_frame(frame_path):
+    """(view, index entry) of a frame from its folder's store, or (None, None) if not stored or stale"""
+    frame_path = Path(frame_path)
+    store = open_store(frame_path.parent)
+    if store is None or not store.is_current(frame_path):
+        return None, None
+    return store.frame(frame_path.name), store.entry(frame_path.name)
+
+def load_frame(frame_path):
+    """Frame from the store when it is current, else decoded from the file"""
+    with span('imread', 'io', frame=Path(frame_path).name):
+        img, _ = stored_frame(frame_path)
+        if img is not None:
+            return img
+        return cv2.imread(str(frame_path), cv2.IMREAD_UNCHANGED)
+
+def release_rows(img, start, stop):
+    """Let the kernel drop rows start:stop of a stored frame view from this process.
+
+    Stored frames are file-backed, so the rows are read again from the page
+    cache if they are touched later. Decoded frames are left alone.
+    """
+    mapping = getattr(img, '_mmap', None)
+    if mapping is None or stop <= start or not hasattr(mmap, 'MADV_DONTNEED'):
+        return
+    base = np.frombuffer(mapping, dtype=np.uint8).ctypes.data
+    first = img[start].ctypes.data - base
+    end = img[stop - 1].ctypes.data - base + img.shape[1] * img.strides[1]
+    offset = first - first % mmap.PAGESIZE
+    mapping.madvise(mmap.MADV_DONTNEED, offset, end - offset)
+
+def read_frame(frame_path):
+    """Frame and the SHA-1 of its file, without decoding when it is stored"""
+    with span('imread', 'io', frame=Path(frame_path).name):
+        img, entry = stored_frame(frame_path)
+        if img is not None:
+            return img, entry['sha1']
+        return decode_file(frame_path)
+
+def frame_size(frame_path):
+    """(height, width) read from a PNG or JPEG header without decoding, or None"""
+    with open(frame_path, 'rb') as f:
+        head = f.read(24)
+        if head[:8] == b'\x89PNG\r\n\x1a\n' and head[12:16] == b'IHDR':
+            return int.from_bytes(head[20:24], 'big'), int.from_bytes(head[16:20], 'big')
+        if head[:2] != b'\xff\xd8':
+            return None
+        # Walk the JPEG segments to the start-of-frame header
+        f.seek(2)
+        while True:
+            marker = f.read(4)
+            if len(marker) < 4 or marker[0] != 0xFF:
+                return None
+            kind, length = marker[1], int.from_bytes(marker[2:4], 'big')
+            # SOF0-SOF15, except DHT (C4), JPG (C8) and DAC (CC)
+            if 0xC0 <= kind <= 0xCF and kind not in (0xC4, 0xC8, 0xCC):
+                sof = f.read(5)
+                return int.from_bytes(sof[1:3], 'big'), int.from_bytes(sof[3:5], 'big')
+            f.seek(length - 2, 1)
+
+def store_layout(entries):
+    """(JSON header, data offset, N x H x W x 4 shape) of a store holding entries"""
+    height = max(entry['height'] for entry in entries)
+    width = max(entry['width'] for entry in entries)
+    header = json.dumps({'height': height, 'width': width, 'frames': entries}).encode()
+    offset = -(-(len(STORE_MAGIC) + 16 + len(header)) // STORE_ALIGNMENT) * STORE_ALIGNMENT
+    return header, offset, (len(entries), height, width, 4)
+
+def put_frame(data, position, img):
+    """Copy a BGR or BGRA frame into the top-left corner of its slot"""
+    h, w, channels = img.shape
+    data[position, :h, :w, :channels] = img
+    if channels == 3:
+        data[position, :h, :w, 3] = 255
+
+def decode_into(frame_path, tmp_path, offset, shape, position):
+    """Decode a frame straight into its slot of a store being written; returns its index entry.
+
+    Workers write their own frames, so no frame travels back to the
+    ingesting process.
+    """
+    img, digest = decode_file(frame_path)
+    if img is None or img.dtype != np.uint8 or img.ndim != 3 or img.shape[2] not in (3, 4):
+        raise ValueError(f"Skipping unsupported frame: {frame_path.name}")
+    if img.shape[0] > shape[1] or img.shape[1] > shape[2]:
+        raise ValueError(f"Skipping {frame_path.name}: larger than its header says")
+
+    data = np.memmap(tmp_path, dtype=np.uint8, mode='r+', offset=offset, shape=shape)
+    put_frame(data, position, img)
+    data.flush()
+    del data
+
+    stat = os.stat(frame_path)
+    return {
+        'name': frame_path.name, 'height': img.shape[0], 'width': img.shape[1],
+        'channels': img.shape[2], 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha1': digest,
+    }
+
+def ingest(folder, workers=WORKERS):
+    """Decode every frame of a folder into its memory-mapped store.
+
+    Frames already in the store (same size and mtime, or same content) are
+    copied over instead of decoded again. The store is laid out up front
+    from the sizes in the file headers, and every frame is decoded straight
+    into its slot of a temporary file, so memory does not grow with the
+    set. Returns the store, or None when the folder has no frames.
+    """
+    folder = Path(folder)
+    frame_files = list_frames(folder)
+    old = open_store(folder)
+
+    entries = []  # In frame order; decoded frames get a placeholder until they are
+    reused = {}  # position in the new store -> position in the old one
+    stale = {}  # position in the new store -> frame file
+    for frame_path in frame_files:
+        stat = os.stat(frame_path)
+        entry = old.entry(frame_path.name) if old is not None else None
+        if entry is not None and entry['size'] == stat.st_size and (
+                entry['mtime_ns'] == stat.st_mtime_ns
+                or entry['sha1'] == hashlib.sha1(frame_path.read_bytes()).hexdigest()):
+            reused[len(entries)] = old.positions[frame_path.name]
+            entries.append(dict(entry, mtime_ns=stat.st_mtime_ns))
+            continue
+
+        size = frame_size(frame_path)
+        if size is None:
+            img = cv2.imread(str(frame_path), cv2.IMREAD_UNCHANGED)
+            if img is None:
+                print(f"Skipping unreadable frame: {frame_path.name}")
+                continue
+            size = img.shape[:2]
+        stale[len(entries)] = frame_path
+        # Widest values the decoded entry can take, so the header fits in its room
+        entries.append({
+            'name': frame_path.name, 'height': size[0], 'width': size[1], 'channels': 4,
+            'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha1': '0' * 40,
+        })
+
+    if not stale and old is not None and entries == old.entries:
+        return old
+    if not entries:
+        return None
+
+    print(f"Decoding {len(stale)}/{len(frame_files)} frames into {folder / STORE_FILE}...")
+
+    path = folder / STORE_FILE
+    _, offset, shape = store_layout(entries)
+    tmp_path = temporary_path(path)
+    try:
+        with open(tmp_path, 'xb') as f:
+            f.truncate(offset + int(np.prod(shape)))
+
+        data = np.memmap(tmp_path, dtype=np.uint8, mode='r+', offset=offset, shape=shape)
+        for position, old_position in reused.items():
+            entry = entries[position]
+            data[position, :entry['height'], :entry['width']] = old.data[old_position, :entry['height'], :entry['width']]
+
+        args = [(frame_path, tmp_path, offset, shape, position) for position, frame_path in stale.items()]
+        for position, (entry, error) in zip(stale, map_frames(decode_into, args, workers)):
+            if error:
+                print(error)
+            entries[position] = entry
+
+        # Close the gaps left by frames that could not be decoded
+        kept = [position for position, entry in enumerate(entries) if entry is not None]
+        for slot, position in enumerate(kept):
+            if slot != position:
+                data[slot] = data[position]
+        data.flush()
+        del data
+
+        entries = [entries[position] for position in kept]
+        if not entries:
+            tmp_path.unlink()
+            return None
+        header = json.dumps({'height': shape[1], 'width': shape[2], 'frames': entries}).encode()
+        with open(tmp_path, 'r+b') as f:
+            f.write(STORE_MAGIC)
+            f.write(len(header).to_bytes(8, 'little'))
+            f.write(offset.to_bytes(8, 'little'))
+            f.write(header)
+            f.truncate(offset + len(entries) * int(np.prod(shape[1:])))
+        os.replace(tmp_path, path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+
+    return open_store(folder)
+
+def main():
+    for folder in INGEST_FOLDERS:
+        if not list_frames(folder):
+            print(f"No frames found in {folder}")
+            continue
+
+        store = ingest(folder)
+        if store is None:
+            print(f"No frames could be decoded in {folder}")
+            continue
+
+        size = store.path.stat().st_size
+        print(f"✅ {folder}: {len(store)} frames, {store.header['width']}x{store.header['height']} slots, "
+              f"{size / 1e6:.1f} MB -> {store.path}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+
+from alpha_stats import frame_stats, perceptual_hash
+from frame_store import read_frame
+from parallel import WORKERS, map_frames
+
+# Configuration
+INDEX_FILE = '.geometry_index.json'  # Sidecar stored next to the frames
+INDEX_VERSION = 3
+
+def compute_geometry(img):
+    """Every per-frame statistic the alignment stages need, plus the perceptual hash for dedupe"""
+    return dict(frame_stats(img), phash=perceptual_hash(img))
+
+def measure_frame(frame_path):
+    """Decode one frame and build its index entry"""
+    img, digest = read_frame(frame_path)
+
+    if img is None:
+        raise ValueError(f"Failed to load: {Path(frame_path).name}")
+
+    return make_entry(frame_path, digest, compute_geometry(img))
+
+def make_entry(frame_path, digest, geometry):
+    """Index entry: the geometry plus the keys that prove it is current"""
+    stat = os.stat(frame_path)
+    return dict(geometry, size=stat.st_size, mtime_ns=stat.st_mtime_ns, sha1=digest)
+
+def as_geometry(entry):
+    """Geometry of an entry with JSON lists turned back into tuples"""
+    return {
+        key: tuple(value) if isinstance(value, list) else value
+        for key, value in entry.items()
+        if key not in ('size', 'mtime_ns', 'sha1')
+    }
+
+def load_index(folder):
+    """Index entries of a frame folder, keyed by file name"""
+    index_path = Path(folder) / INDEX_FILE
+    try:
+        data = json.loads(index_path.read_text())
+    except (OSError, ValueError):
+        return {}
+    if data.get('version') != INDEX_VERSION:
+        return {}
+    return data.get('frames', {})
+
+def save_index(folder, entries):
+    """Write the index atomically, skipping the write when nothing changed"""
+    index_path = Path(folder) / INDEX_FILE
+    text = json.dumps({'version': INDEX_VERSION, 'frames': entries}, indent=1, sort_keys=True)
+    try:
+        if index_path.read_text() == text:
+            return
+    except OSError:
+        pass
+    tmp_path = index_path.with_name(index_path.name + '.tmp')
+    tmp_path.write_text(text)
+    os.replace(tmp_path, index_path)
+
+def lookup(entries, frame_path):
+    """Entry for a frame if it still matches the file on disk, else None.
+
+    Size and mtime are checked first; when only the mtime changed (touched
+    or copied file) the content hash decides and the entry is refreshed.
+    """
+    entry = entries.get(Path(frame_path).name)
+    if entry is None:
+        return None
+
+    stat = os.stat(frame_path)
+    if entry['size'] != stat.st_size:
+        return None
+    if entry['mtime_ns'] == stat.st_mtime_ns:
+        return entry
+
+    digest = hashlib.sha1(Path(frame_path).read_bytes()).hexdigest()
+    if digest != entry['sha1']:
+        return None
+
+    entry['mtime_ns'] = stat.st_mtime_ns
+    return entry
+
+def build_index(folder, workers=WORKERS, extension='.png'):
+    """Geometry of every frame with extension in a folder, measuring only new or changed ones.
+
+    Returns {file name: geometry}; frames that fail to decode are left out.
+    """
+    folder = Path(folder)
+    frame_files = sorted(folder.glob(f'frame_*{extension}'))
+    entries = load_index(folder)
+
+    stale = [frame_path for frame_path in frame_files if lookup(entries, frame_path) is None]
+
+    if stale:
+        print(f"Measuring geometry of {len(stale)}/{len(frame_files)} frames...")
+
+        for frame_path, (entry, error) in zip(stale, map_frames(measure_frame, [(p,) for p in stale], workers)):
+            if error:
+                print(error)
+                entries.pop(frame_path.name, None)
+            else:
+                entries[frame_path.name] = entry
+
+    # Forget frames that were removed from the folder
+    names = {frame_path.name for frame_path in frame_files}
+    entries = {name: entry for name, entry in entries.items() if name in names}
+    save_index(folder, entries)
+
+    return {name: as_geometry(entry) for name, entry in entries.items()}
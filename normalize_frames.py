@@ -1,25 +1,62 @@
-import cv2
 import numpy as np
 from pathlib import Path
 
+from encoders import save_frame
+from frame_store import load_frame
+from geometry_index import build_index
+from parallel import WORKERS, map_frames
+from tiles import resize_into
+from tracing import span, traced
+
 # Configuration
 INPUT_FOLDER = 'car_frames_nobg'
 OUTPUT_FOLDER = 'car_frames_normalized'
 OUTPUT_SIZE = (800, 600)  # Final output size (width, height)
 
-def get_car_bbox(image):
-    """Get bounding box of the car"""
-    if image.shape[2] == 4:
-        alpha = image[:, :, 3]
-        coords = cv2.findNonZero(alpha)
-    else:
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-        _, binary = cv2.threshold(gray, 10, 255, cv2.THRESH_BINARY)
-        coords = cv2.findNonZero(binary)
-    
-    if coords is not None:
-        return cv2.boundingRect(coords)
-    return None
+def compute_scale(max_width, max_height):
+    """Scale that fits the largest car in the output size with padding"""
+    padding = 50
+    scale_w = (OUTPUT_SIZE[0] - 2 * padding) / max_width
+    scale_h = (OUTPUT_SIZE[1] - 2 * padding) / max_height
+    return min(scale_w, scale_h)
+
+@traced('composite', 'render')
+def normalize_car(img, bbox, scale):
+    """Crop the car, scale it and center it on the output canvas"""
+    x, y, w, h = bbox
+    
+    # Crop car from original image
+    car_crop = img[y:y+h, x:x+w]
+    
+    # Normalized size maintaining aspect ratio
+    scaled_w, scaled_h = int(w * scale), int(h * scale)
+    
+    # Create output canvas
+    canvas = np.zeros((OUTPUT_SIZE[1], OUTPUT_SIZE[0], 4), dtype=np.uint8)
+    
+    # Calculate paste position (center the scaled car)
+    paste_x = OUTPUT_SIZE[0] // 2 - scaled_w // 2
+    paste_y = OUTPUT_SIZE[1] // 2 - scaled_h // 2
+    
+    # Resize straight into place on the canvas
+    with span('resize', 'render'):
+        resize_into(canvas[paste_y:paste_y+scaled_h, 
+                           paste_x:paste_x+scaled_w], car_crop)
+    
+    return canvas
+
+def process_frame(frame_path, bbox, output_folder, scale):
+    """Load one frame, normalize the car and save it"""
+    img = load_frame(frame_path)
+    
+    if img is None or bbox is None:
+        raise ValueError(f"Skipping {frame_path.name}")
+    
+    canvas = normalize_car(img, bbox, scale)
+    
+    # Save normalized frame
+    output_path = output_folder / frame_path.name
+    save_frame(output_path, canvas)
 
 def main():
     input_folder = Path(INPUT_FOLDER)
@@ -37,26 +74,19 @@ def main():
     # Find maximum bounding box
     max_width = 0
     max_height = 0
-    bboxes = []
+    # Bounding boxes come from the geometry index, measured once per frame
+    geometry = build_index(input_folder, WORKERS)
+    bboxes = [geometry.get(frame_path.name, {}).get('bbox') for frame_path in frame_files]
     
-    for frame_path in frame_files:
-        img = cv2.imread(str(frame_path), cv2.IMREAD_UNCHANGED)
-        bbox = get_car_bbox(img)
+    for bbox in bboxes:
         if bbox:
             x, y, w, h = bbox
             max_width = max(max_width, w)
             max_height = max(max_height, h)
-            bboxes.append(bbox)
-        else:
-            bboxes.append(None)
     
     print(f"Maximum car dimensions: {max_width}x{max_height}")
     
-    # Calculate scale to fit in output size with padding
-    padding = 50
-    scale_w = (OUTPUT_SIZE[0] - 2 * padding) / max_width
-    scale_h = (OUTPUT_SIZE[1] - 2 * padding) / max_height
-    scale = min(scale_w, scale_h)
+    scale = compute_scale(max_width, max_height)
     
     print(f"Scale factor: {scale:.3f}")
     
@@ -72,42 +102,17 @@ def main():
     print(f"All cars will be {final_car_w}x{final_car_h} pixels")
     print(f"Centered at: ({center_x}, {center_y})")
     
-    success = 0
-    for i, (frame_path, bbox) in enumerate(zip(frame_files, bboxes), 1):
-        img = cv2.imread(str(frame_path), cv2.IMREAD_UNCHANGED)
-        
-        if img is None or bbox is None:
-            print(f"Skipping {frame_path.name}")
-            continue
-        
-        x, y, w, h = bbox
-        
-        # Crop car from original image
-        car_crop = img[y:y+h, x:x+w]
-        
-        # Resize to normalized size maintaining aspect ratio
-        car_scaled = cv2.resize(car_crop, (int(w * scale), int(h * scale)), 
-                               interpolation=cv2.INTER_LANCZOS4)
-        
-        # Create output canvas
-        canvas = np.zeros((OUTPUT_SIZE[1], OUTPUT_SIZE[0], 4), dtype=np.uint8)
-        
-        # Calculate paste position (center the scaled car)
-        paste_x = center_x - car_scaled.shape[1] // 2
-        paste_y = center_y - car_scaled.shape[0] // 2
-        
-        # Paste car onto canvas
-        canvas[paste_y:paste_y+car_scaled.shape[0], 
-               paste_x:paste_x+car_scaled.shape[1]] = car_scaled
-        
-        # Save normalized frame
-        output_path = output_folder / frame_path.name
-        cv2.imwrite(str(output_path), canvas)
-        success += 1
-        
+    def report(i, result, error):
+        if error:
+            print(error)
         if i % 10 == 0:
             print(f"Processed {i}/{len(frame_files)} frames...")
     
+    results = map_frames(process_frame,
+                         [(frame_path, bbox, output_folder, scale) for frame_path, bbox in zip(frame_files, bboxes)],
+                         WORKERS, report)
+    success = sum(1 for _, error in results if error is None)
+    
     print(f"\nNormalization complete!")
     print(f"Successfully normalized {success}/{len(frame_files)} frames")
     print(f"All frames are now {OUTPUT_SIZE[0]}x{OUTPUT_SIZE[1]} pixels")
@@ -0,0 +1,59 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import tracing
+
+# Configuration
+# Number of worker processes for per-frame loops (FRAME_WORKERS overrides,
+# 1 runs serially in the current process)
+WORKERS = int(os.environ.get('FRAME_WORKERS', os.cpu_count() or 1))
+
+def resolve_workers(workers):
+    """Worker count to use; None or 0 means one per CPU core"""
+    if not workers:
+        return os.cpu_count() or 1
+    return max(1, int(workers))
+
+def call_frame(func, args):
+    """Run func(*args) and capture a failure instead of raising it"""
+    # Traced as one span per frame, named after the stage function
+    frame = next((arg.name for arg in args if isinstance(arg, Path)), None)
+    try:
+        with tracing.span(f"{Path(func.__code__.co_filename).stem}.{func.__name__}", 'frame', frame=frame):
+            return func(*args), None
+    except Exception as e:
+        return None, str(e) or type(e).__name__
+    finally:
+        tracing.flush()
+
+def map_frames(func, args_list, workers=WORKERS, on_result=None):
+    """Run func(*args) for every frame and return (result, error) pairs.
+
+    Frames are independent once the reference/scale is known, so with more
+    than one worker they are spread over a process pool. Results always come
+    back in input order and on_result(i, result, error) is called in that
+    order too, so progress output is identical to a serial run. A frame that
+    raises is reported through its error and does not stop the others.
+    """
+    args_list = list(args_list)
+    workers = min(resolve_workers(workers), max(1, len(args_list)))
+    results = []
+
+    if workers == 1:
+        outcomes = (call_frame(func, args) for args in args_list)
+        for i, (result, error) in enumerate(outcomes, 1):
+            results.append((result, error))
+            if on_result:
+                on_result(i, result, error)
+        return results
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(call_frame, func, args) for args in args_list]
+        for i, future in enumerate(futures, 1):
+            result, error = future.result()
+            results.append((result, error))
+            if on_result:
+                on_result(i, result, error)
+
+    return results
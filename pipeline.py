@@ -0,0 +1,430 @@
+import argparse
+from pathlib import Path
+
+import align_frames_precise
+import build_atlas
+import build_cache
+import dedupe_frames
+import final_fix
+import fix_alignment
+import frame_store
+import geometry_index
+import normalize_frames
+import perfect_frames
+import stabilize_frames
+import tracing
+from encoders import CODECS, FRAME_CODEC, codec_extension, encode_frame, is_available, save_frame, write_atomic
+from parallel import WORKERS, map_frames, resolve_workers
+from streaming import QUEUE_SIZE, map_stream
+
+# Configuration
+INPUT_FOLDER = 'car_frames_nobg'
+DEFAULT_VARIANTS = ['final', 'stable', 'perfect']
+
+def reference_analysis(analyses, frame_num=1):
+    """Analysis of the reference frame (1-based, like the scripts)"""
+    return analyses[frame_num - 1]
+
+def prepare_normalized(analyses):
+    """Scale that fits the largest car of the whole set"""
+    bboxes = [a['bbox'] for a in analyses if a['bbox']]
+    if not bboxes:
+        raise ValueError("No car detected in any frame")
+    max_width = max(w for _, _, w, _ in bboxes)
+    max_height = max(h for _, _, _, h in bboxes)
+    return normalize_frames.compute_scale(max_width, max_height)
+
+def prepare_fixed(analyses):
+    """Consistent scale for center-of-mass alignment"""
+    ref = reference_analysis(analyses)
+    if ref['center_of_mass'] is None or ref['bbox'] is None:
+        raise ValueError("Could not detect car in reference frame")
+    bboxes = [a['bbox'] for a in analyses if a['bbox']]
+    max_w = max(w for _, _, w, _ in bboxes)
+    max_h = max(h for _, _, _, h in bboxes)
+    return fix_alignment.compute_scale(max_w, max_h)
+
+def prepare_stable(analyses):
+    """Scale and scaled visual center of the reference frame"""
+    ref_center, ref_bbox = reference_analysis(
+        analyses, stabilize_frames.REFERENCE_FRAME_NUM)['visual']
+    if ref_center is None or ref_bbox is None:
+        raise ValueError("Could not detect car in reference frame")
+    return stabilize_frames.reference_transform(ref_center, ref_bbox)
+
+def prepare_aligned(analyses):
+    """Reference bounding box and its center"""
+    ref_bbox = reference_analysis(analyses)['bbox']
+    if ref_bbox is None:
+        raise ValueError("Could not detect car in reference frame")
+    ref_x, ref_y, ref_w, ref_h = ref_bbox
+    return ref_bbox, (ref_x + ref_w // 2, ref_y + ref_h // 2)
+
+def render_final(img, analysis, params):
+    if analysis['bbox'] is None:
+        return None
+    return final_fix.place_car(img, analysis['bbox'])
+
+def render_normalized(img, analysis, scale):
+    if analysis['bbox'] is None:
+        return None
+    return normalize_frames.normalize_car(img, analysis['bbox'], scale)
+
+def render_fixed(img, analysis, scale):
+    if analysis['bbox'] is None or analysis['center_of_mass'] is None:
+        return None
+    return fix_alignment.align_car(img, analysis['bbox'], analysis['center_of_mass'], scale)
+
+def render_perfect(img, analysis, params):
+    if analysis['bbox'] is None or analysis['center_of_mass'] is None:
+        return None
+    return perfect_frames.fit_car(img, analysis['bbox'], analysis['center_of_mass'])
+
+def render_stable(img, analysis, params):
+    center, bbox = analysis['visual']
+    if center is None or bbox is None:
+        return None
+    scale, ref_scaled_center = params
+    return stabilize_frames.stabilize_car(img, center, bbox, scale, ref_scaled_center)
+
+def render_aligned(img, analysis, params):
+    ref_bbox, ref_center = params
+    return align_frames_precise.align_to_reference(img, ref_bbox, ref_center, analysis['bbox'])
+
+# Output variants: a set-wide prepare step and a per-frame render; the
+# module's source is part of every output's cache key
+VARIANTS = {
+    'final': {
+        'output': final_fix.OUTPUT_FOLDER,
+        'module': final_fix,
+        'prepare': None,
+        'render': render_final,
+    },
+    'normalized': {
+        'output': normalize_frames.OUTPUT_FOLDER,
+        'module': normalize_frames,
+        'prepare': prepare_normalized,
+        'render': render_normalized,
+    },
+    'fixed': {
+        'output': fix_alignment.OUTPUT_FOLDER,
+        'module': fix_alignment,
+        'prepare': prepare_fixed,
+        'render': render_fixed,
+    },
+    'perfect': {
+        'output': perfect_frames.OUTPUT_FOLDER,
+        'module': perfect_frames,
+        'prepare': None,
+        'render': render_perfect,
+    },
+    'stable': {
+        'output': stabilize_frames.OUTPUT_FOLDER,
+        'module': stabilize_frames,
+        'prepare': prepare_stable,
+        'render': render_stable,
+    },
+    'aligned': {
+        'output': align_frames_precise.OUTPUT_FOLDER,
+        'module': align_frames_precise,
+        'prepare': prepare_aligned,
+        'render': render_aligned,
+    },
+}
+
+def frame_analysis(geometry):
+    """Per-frame analysis in the shape the render stages expect"""
+    return {
+        'bbox': geometry['bbox'],
+        'center_of_mass': geometry['center_of_mass'],
+        'visual': (geometry['visual_center'], geometry['visual_bbox']),
+    }
+
+def read_input(frame_path):
+    """Frame, SHA-1 of its file and whether it was mapped from the frame store"""
+    with tracing.span('imread', 'io', frame=frame_path.name):
+        img, stored = frame_store.stored_frame(frame_path)
+        if img is not None:
+            digest = stored['sha1']
+        else:
+            img, digest = frame_store.decode_file(frame_path)
+
+    if img is None:
+        raise ValueError(f"Failed to load: {frame_path.name}")
+
+    return frame_path, img, digest, stored is not None
+
+def measure_input(frame_path, img, digest, stored):
+    """Index entry of a decoded frame; the frame itself is not kept"""
+    return geometry_index.make_entry(frame_path, digest, geometry_index.compute_geometry(img))
+
+def decode_frame(frame_path):
+    """Index entry of one frame.
+
+    The frame is not sent back: keeping every frame of the set for the
+    render step would cost memory in proportion to the set, and copying it
+    to another worker would cost as much as a decode. The render step
+    reads it again, for free from the frame store.
+    """
+    return measure_input(*read_input(frame_path))
+
+def render_canvases(img, analysis, variant_params):
+    """Canvas of every variant that has a car to place, and the names of those that do not"""
+    canvases = {}
+    skipped = []
+    for name, params in variant_params.items():
+        canvas = VARIANTS[name]['render'](img, analysis, params)
+
+        if canvas is None:
+            skipped.append(name)
+        else:
+            canvases[name] = canvas
+
+    return canvases, skipped
+
+def render_frame(frame_path, img, analysis, variant_params, codec=FRAME_CODEC, output_root='.'):
+    """Render and save one frame for every variant in variant_params.
+
+    img is the already decoded frame, or None to decode it here; outputs
+    are written with codec into the variants' folders under output_root.
+    Returns the names of the variants that had no car to place.
+    """
+    if img is None:
+        img = frame_store.load_frame(frame_path)
+
+        if img is None:
+            raise ValueError(f"Failed to load: {frame_path.name}")
+
+    canvases, skipped = render_canvases(img, analysis, variant_params)
+    for name, canvas in canvases.items():
+        save_frame(Path(output_root) / VARIANTS[name]['output'] / frame_path.name, canvas, codec)
+
+    return skipped
+
+# The render step as stream stages (see streaming.py): each gets the tuple
+# the previous one returned
+
+def stream_decode(frame_path, img, analysis, variant_params, codec=FRAME_CODEC, output_root='.'):
+    """Decode the frame unless the analysis step handed it over; the arguments are render_frame's"""
+    if img is None:
+        img = frame_store.load_frame(frame_path)
+
+        if img is None:
+            raise ValueError(f"Failed to load: {frame_path.name}")
+
+    return frame_path, img, analysis, variant_params, codec, output_root
+
+def stream_render(frame_path, img, analysis, variant_params, codec, output_root):
+    canvases, skipped = render_canvases(img, analysis, variant_params)
+    return frame_path, canvases, skipped, codec, output_root
+
+def stream_encode(frame_path, canvases, skipped, codec, output_root):
+    encoded = {name: encode_frame(canvas, codec) for name, canvas in canvases.items()}
+    return frame_path, encoded, skipped, codec, output_root
+
+def stream_write(frame_path, encoded, skipped, codec, output_root):
+    """Write the encoded outputs where render_frame would; returns the variants with no car"""
+    for name, data in encoded.items():
+        write_atomic(Path(output_root) / VARIANTS[name]['output'] / (frame_path.stem + codec_extension(codec)), data)
+    return skipped
+
+RENDER_STAGES = [stream_decode, stream_render, stream_encode, stream_write]
+
+def run_pipeline(input_folder, variant_names, workers=WORKERS, force=False, codec=FRAME_CODEC, stream=False,
+                 dedupe=False):
+    """Render every frame into all requested variants from one decode.
+
+    Geometry comes from the index, so only frames that are new to it or
+    whose outputs are out of date get decoded. With force the output
+    caches are ignored and every frame is rendered again. Outputs are
+    written with codec (see encoders.CODECS).
+
+    Frames decoded for analysis are dropped and read again for rendering,
+    so memory does not grow with the size of the set. With stream, both
+    steps run in this process as threaded stages joined by bounded queues
+    instead of on the process pool, so only a few frames are in flight.
+
+    With dedupe, frames whose perceptual hash repeats the frame before
+    them are not rendered; every output manifest lists them as references
+    to the frame the viewer shows instead.
+    """
+    input_folder = Path(input_folder)
+    frame_files = sorted(input_folder.glob('frame_*.png'))
+    extension = codec_extension(codec)
+
+    if not frame_files:
+        print(f"No frames found in {input_folder}")
+        return {}
+
+    variants = {name: VARIANTS[name] for name in variant_names}
+    entries = geometry_index.load_index(input_folder)
+    stale = [frame_path for frame_path in frame_files if geometry_index.lookup(entries, frame_path) is None]
+
+    print(f"Step 1: Analyzing {len(stale)}/{len(frame_files)} frames missing from the geometry index...")
+    if stream:
+        print(f"Streaming: one thread per stage, queues of {QUEUE_SIZE}, codec: {codec}")
+    else:
+        print(f"Workers: {resolve_workers(workers)}, codec: {codec}")
+
+    def report_decode(i, result, error):
+        if error:
+            print(error)
+        if i % 10 == 0:
+            print(f"Decoded {i}/{len(stale)} frames...")
+
+    if stream:
+        results = map_stream([read_input, measure_input], [(frame_path,) for frame_path in stale], report_decode)
+    else:
+        results = map_frames(decode_frame, [(frame_path,) for frame_path in stale], workers, report_decode)
+    for frame_path, (result, error) in zip(stale, results):
+        if error is None:
+            entries[frame_path.name] = result
+        else:
+            entries.pop(frame_path.name, None)
+
+    names = {frame_path.name for frame_path in frame_files}
+    entries = {name: entry for name, entry in entries.items() if name in names}
+    geometry_index.save_index(input_folder, entries)
+
+    frames = [(frame_path, entries[frame_path.name], frame_analysis(geometry_index.as_geometry(entries[frame_path.name])))
+              for frame_path in frame_files if frame_path.name in entries]
+
+    print(f"\nStep 2: Preparing variants: {', '.join(variants)}")
+
+    analyses = [analysis for _, _, analysis in frames]
+    params = {}
+    for name, variant in variants.items():
+        try:
+            params[name] = variant['prepare'](analyses) if variant['prepare'] else None
+        except ValueError as e:
+            print(f"Skipping {name}: {e}")
+
+    for name in params:
+        Path(variants[name]['output']).mkdir(exist_ok=True)
+
+    # Near-duplicates are still part of the analyses above, so the variant
+    # parameters do not depend on dedupe
+    references = {}
+    if dedupe:
+        references = dedupe_frames.find_references([frame_path.name for frame_path, _, _ in frames],
+                                                   [entry['phash'] for _, entry, _ in frames])
+        frames = [frame for frame in frames if frame[0].name not in references]
+        print(f"Dedupe: {len(references)} near-duplicate frames become references")
+    output_references = {Path(name).stem + extension: Path(source).stem + extension
+                         for name, source in references.items()}
+
+    # Work out which outputs are out of date for their input bytes and parameters
+    sources = {name: build_cache.source_digest(variants[name]['module']) for name in params}
+    caches = {name: {} if force else build_cache.load_cache(variants[name]['output']) for name in params}
+    success = {name: 0 for name in params}
+    jobs = []
+    for frame_path, entry, analysis in frames:
+        # The codec settings are part of every key: png and png-max share a file name
+        keys = {name: build_cache.output_key(entry['sha1'], name, (params[name], CODECS[codec]), sources[name])
+                for name in params}
+        output_name = frame_path.stem + extension
+        pending = {}
+        for name in params:
+            if build_cache.is_fresh(caches[name], variants[name]['output'], output_name, keys[name]):
+                success[name] += 1
+            else:
+                pending[name] = params[name]
+        if pending:
+            jobs.append((frame_path, None, analysis, pending, keys))
+
+    print(f"\nStep 3: Rendering {len(jobs)}/{len(frames)} frames into {len(params)} variants "
+          f"({len(frames) - len(jobs)} up to date)...")
+
+    def report_render(i, skipped, error):
+        frame_path, _, _, pending, keys = jobs[i - 1]
+        output_name = frame_path.stem + extension
+        if error:
+            print(f"Failed to render {frame_path.name}: {error}")
+        else:
+            for name in pending:
+                output = variants[name]['output']
+                if name in skipped:
+                    print(f"No car detected ({name}): {frame_path.name}")
+                    build_cache.record(caches[name], output, output_name, keys[name], written=False)
+                else:
+                    build_cache.record(caches[name], output, output_name, keys[name])
+                    success[name] += 1
+        if i % 10 == 0:
+            print(f"Rendered {i}/{len(jobs)} frames...")
+
+    if stream:
+        map_stream(RENDER_STAGES, [job[:4] + (codec,) for job in jobs], report_render)
+    else:
+        map_frames(render_frame, [job[:4] + (codec,) for job in jobs], workers, report_render)
+
+    for name in params:
+        output = variants[name]['output']
+        for output_name in output_references:
+            (Path(output) / output_name).unlink(missing_ok=True)
+            caches[name].pop(output_name, None)
+        build_cache.save_cache(output, caches[name])
+        dedupe_frames.save_references(output, output_references)
+
+    print(f"\nPipeline complete!")
+    for name, count in success.items():
+        shared = f" (+{len(references)} references)" if references else ""
+        print(f"  {name}: {count}/{len(frame_files)} frames{shared} -> {variants[name]['output']}")
+
+    return success
+
+def main():
+    parser = argparse.ArgumentParser(description="Decode frames once and render every output variant")
+    parser.add_argument('variants', nargs='*',
+                        help=f"Output variants to build: {', '.join(VARIANTS)} "
+                             f"(default: {' '.join(DEFAULT_VARIANTS)})")
+    parser.add_argument('--input', default=INPUT_FOLDER, help="Folder with frame_*.png inputs")
+    parser.add_argument('--workers', type=int, default=WORKERS,
+                        help="Worker processes (1 = serial, 0 = one per CPU core)")
+    parser.add_argument('--force', action='store_true',
+                        help="Ignore the output caches and render every frame again")
+    parser.add_argument('--codec', default=FRAME_CODEC, choices=list(CODECS),
+                        help=f"Output encoder (default: {FRAME_CODEC})")
+    parser.add_argument('--ingest', action='store_true',
+                        help="Decode the inputs into a memory-mapped frame store first")
+    parser.add_argument('--atlas', action='store_true',
+                        help="Also pack every built variant into atlas sheets (<output>_atlas)")
+    parser.add_argument('--stream', action='store_true',
+                        help="Overlap decode, render, encode and write on threads in one process "
+                             "with bounded memory (instead of --workers)")
+    parser.add_argument('--dedupe', action='store_true',
+                        help="Render one frame of every run of near-duplicate inputs; the rest become "
+                             "manifest references")
+    parser.add_argument('--trace', metavar='FILE',
+                        help="Record per-frame stage spans to a Chrome trace file (same as FRAME_TRACE)")
+    args = parser.parse_args()
+
+    variant_names = args.variants or DEFAULT_VARIANTS
+    unknown = [name for name in variant_names if name not in VARIANTS]
+    if unknown:
+        parser.error(f"unknown variants: {', '.join(unknown)}")
+    if not is_available(args.codec):
+        parser.error(f"codec {args.codec} is not supported by this OpenCV build")
+
+    if args.trace:
+        tracing.enable(args.trace)
+
+    if args.ingest:
+        frame_store.ingest(args.input, args.workers)
+
+    success = run_pipeline(args.input, variant_names, args.workers, args.force, args.codec, args.stream,
+                           args.dedupe)
+
+    if args.atlas:
+        print(f"\nPacking atlases...")
+        for name in success:
+            output = VARIANTS[name]['output']
+            try:
+                manifest = build_atlas.build_atlas(output, f"{output}_atlas", workers=args.workers,
+                                                   codec=args.codec)
+            except ValueError as e:
+                print(f"Skipping {name} atlas: {e}")
+                continue
+            print(f"  {name}: {len(manifest['frames'])} frames -> {len(manifest['sheets'])} sheets in {output}_atlas")
+
+if __name__ == '__main__':
+    main()
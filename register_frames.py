@@ -0,0 +1,291 @@
+import json
+import cv2
+import numpy as np
+from pathlib import Path
+
+from alpha_stats import car_mask
+from encoders import save_frame
+from frame_store import load_frame
+from geometry_index import build_index
+from parallel import WORKERS, map_frames
+from tracing import span, traced
+
+# Configuration
+INPUT_FOLDER = 'car_frames_nobg'
+OUTPUT_FOLDER = 'car_frames_registered'
+TRANSFORMS_FILE = 'registration.json'  # Per-frame (scale, tx, ty) to reference coordinates
+OUTPUT_SIZE = (800, 600)
+REFERENCE_FRAME_NUM = 1
+PADDING = 80  # Margin around the reference car on the canvas
+WORK_SIZE = 256  # Longest side registration looks at, whatever the input resolution
+COARSE_SIZE = 48  # Longest side of the coarsest pyramid level
+MAX_ITERATIONS = 30  # Gauss-Newton steps per pyramid level
+MIN_STEP = 1e-3  # Stop refining a level once the update is below this (pixels)
+DRIFT_SIGMA = 4.0  # Frames; the per-frame anchors only correct drift slower than this
+
+# Transforms are 3x3 matrices [[s, 0, tx], [0, s, ty], [0, 0, 1]] mapping a
+# frame's pixel coordinates to the reference frame's.
+
+def similarity(scale, tx, ty):
+    """3x3 matrix of a scale + translation"""
+    return np.array([[scale, 0, tx], [0, scale, ty], [0, 0, 1]], dtype=np.float64)
+
+def working_silhouette(image):
+    """Blurred float silhouette at WORK_SIZE and the factor from full resolution to it.
+
+    Only this resize touches every input pixel.
+    """
+    mask = car_mask(image)
+    h, w = mask.shape
+    factor = min(1.0, WORK_SIZE / max(h, w))
+    if factor < 1.0:
+        mask = cv2.resize(mask, (max(1, round(w * factor)), max(1, round(h * factor))),
+                          interpolation=cv2.INTER_AREA)
+    return factor, cv2.GaussianBlur(mask.astype(np.float32) / 255, (5, 5), 0)
+
+def level_count(shape):
+    """Pyramid levels from a working size down to COARSE_SIZE"""
+    count = 1
+    while max(shape) > COARSE_SIZE:
+        shape = ((shape[0] + 1) // 2, (shape[1] + 1) // 2)
+        count += 1
+    return count
+
+def registration_pyramid(silhouette, count):
+    """count levels of a working silhouette, each half the size of the last, coarsest first"""
+    levels = [silhouette]
+    while len(levels) < count:
+        levels.append(cv2.pyrDown(levels[-1]))
+    return levels[::-1]
+
+def warp(img, M, size):
+    """img resampled into a (w, h) frame through M"""
+    return cv2.warpAffine(img, M[:2], size, flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_CONSTANT)
+
+def initial_transform(ref, cur):
+    """Scale from the area ratio, translation from the centroids, then phase correlation"""
+    ref_m = cv2.moments(ref)
+    cur_m = cv2.moments(cur)
+    if ref_m['m00'] == 0 or cur_m['m00'] == 0:
+        return None
+
+    scale = np.sqrt(ref_m['m00'] / cur_m['m00'])
+    tx = ref_m['m10'] / ref_m['m00'] - scale * cur_m['m10'] / cur_m['m00']
+    ty = ref_m['m01'] / ref_m['m00'] - scale * cur_m['m01'] / cur_m['m00']
+    M = similarity(scale, tx, ty)
+
+    # Sub-pixel translation left over after the moment estimate
+    window = cv2.createHanningWindow(ref.shape[::-1], cv2.CV_32F)
+    (dx, dy), _ = cv2.phaseCorrelate(warp(cur, M, ref.shape[::-1]), ref, window)
+    return similarity(1.0, dx, dy) @ M
+
+def refine_transform(ref, cur, M):
+    """Gauss-Newton refinement of scale + translation on one pyramid level"""
+    h, w = ref.shape
+    ys, xs = np.mgrid[0:h, 0:w].astype(np.float32)
+    cx, cy = (w - 1) / 2, (h - 1) / 2
+    xs -= cx
+    ys -= cy
+
+    for _ in range(MAX_ITERATIONS):
+        warped = warp(cur, M, (w, h))
+        gx = cv2.Sobel(warped, cv2.CV_32F, 1, 0, ksize=3, scale=1 / 8)
+        gy = cv2.Sobel(warped, cv2.CV_32F, 0, 1, ksize=3, scale=1 / 8)
+
+        # Residual of an incremental scale about the level center plus a shift
+        J = np.stack([(gx * xs + gy * ys).ravel(), gx.ravel(), gy.ravel()], axis=1)
+        error = (warped - ref).ravel()
+        JtJ = J.T @ J
+        if abs(np.linalg.det(JtJ)) < 1e-12:
+            break
+        ds, dtx, dty = np.linalg.solve(JtJ, J.T @ error)
+
+        # warped(D^-1 y) ~ warped(y) - grad . (ds * y + dt), so D is applied on top of M
+        D = similarity(1 + ds, cx - (1 + ds) * cx + dtx, cy - (1 + ds) * cy + dty)
+        M = D @ M
+
+        if max(abs(ds) * max(w, h), abs(dtx), abs(dty)) < MIN_STEP:
+            break
+    return M
+
+@traced('register_pair', 'analysis')
+def register_pair(ref_image, cur_image):
+    """Sub-pixel scale + translation mapping cur_image's pixels onto ref_image's.
+
+    Estimated coarse to fine on silhouette pyramids capped at WORK_SIZE, so
+    the cost barely depends on the input resolution. Returns None if either
+    frame has no car.
+    """
+    ref_factor, ref = working_silhouette(ref_image)
+    cur_factor, cur = working_silhouette(cur_image)
+    # Both pyramids get as many levels as the smaller image has, so their
+    # coarsest levels are the same number of halvings from the working size
+    count = min(level_count(ref.shape), level_count(cur.shape))
+    ref_levels = registration_pyramid(ref, count)
+    cur_levels = registration_pyramid(cur, count)
+
+    M = None
+    for level, (ref, cur) in enumerate(zip(ref_levels, cur_levels)):
+        if M is None:
+            M = initial_transform(ref, cur)
+            if M is None:
+                return None
+        else:
+            # Translation doubles from one level to the next, scale is unchanged
+            M = M.copy()
+            M[:2, 2] *= 2
+        M = refine_transform(ref, cur, M)
+
+    # Back from working resolution to full-resolution pixels
+    to_ref = similarity(1 / ref_factor, 0, 0)
+    from_cur = similarity(cur_factor, 0, 0)
+    return to_ref @ M @ from_cur
+
+def register_neighbors(prev_path, frame_path):
+    """Transform from one frame to the previous one, as (scale, tx, ty)"""
+    prev = load_frame(prev_path)
+    cur = load_frame(frame_path)
+
+    if prev is None or cur is None:
+        raise ValueError(f"Failed to load: {frame_path.name}")
+
+    M = register_pair(prev, cur)
+    if M is None:
+        raise ValueError(f"No car to register: {frame_path.name}")
+    return M[0, 0], M[0, 2], M[1, 2]
+
+def chain_transforms(pair_transforms, reference):
+    """Absolute transforms to the reference frame from frame-to-previous ones.
+
+    pair_transforms[i] maps frame i + 1 onto frame i.
+    """
+    absolute = [similarity(1.0, 0, 0)]
+    for scale, tx, ty in pair_transforms:
+        absolute.append(absolute[-1] @ similarity(scale, tx, ty))
+    to_reference = np.linalg.inv(absolute[reference])
+    return [to_reference @ M for M in absolute]
+
+def anchor_transform(geometry, ref_geometry):
+    """Coarse absolute transform to the reference from center of mass and car height"""
+    if geometry is None or geometry['center_of_mass'] is None:
+        return None
+    scale = ref_geometry['bbox'][3] / geometry['bbox'][3]
+    (cx, cy), (ref_cx, ref_cy) = geometry['center_of_mass'], ref_geometry['center_of_mass']
+    return similarity(scale, ref_cx - scale * cx, ref_cy - scale * cy)
+
+def smooth(values, sigma):
+    """Gaussian low-pass along the frame axis of an (N, k) array"""
+    radius = max(1, int(3 * sigma))
+    kernel = np.exp(-0.5 * (np.arange(-radius, radius + 1) / sigma) ** 2)
+    kernel /= kernel.sum()
+    padded = np.pad(values, ((radius, radius), (0, 0)), mode='edge')
+    return np.stack([np.convolve(padded[:, k], kernel, mode='valid') for k in range(values.shape[1])], axis=1)
+
+def correct_drift(transforms, anchors, sigma=DRIFT_SIGMA):
+    """Pull chained transforms toward the anchors, keeping their frame-to-frame detail.
+
+    Chaining neighbor registrations accumulates error as the silhouette
+    changes with the car's rotation; the anchors have no drift but jitter.
+    Only the low-pass part of their difference is applied.
+    """
+    params = np.array([[M[0, 0], M[0, 2], M[1, 2]] for M in transforms])
+    residual = np.array([
+        [A[0, 0], A[0, 2], A[1, 2]] - p if A is not None else np.zeros(3)
+        for p, A in zip(params, anchors)
+    ])
+    corrected = params + smooth(residual, sigma)
+    return [similarity(*p) for p in corrected]
+
+def canvas_transform(ref_bbox):
+    """Placement of the reference frame on the canvas: car scaled to fit and centered"""
+    x, y, w, h = ref_bbox
+    scale = min((OUTPUT_SIZE[0] - 2 * PADDING) / w, (OUTPUT_SIZE[1] - 2 * PADDING) / h)
+    tx = OUTPUT_SIZE[0] / 2 - scale * (x + w / 2)
+    ty = OUTPUT_SIZE[1] / 2 - scale * (y + h / 2)
+    return similarity(scale, tx, ty)
+
+def process_frame(frame_path, output_folder, M):
+    """Load one frame, warp it onto the canvas with sub-pixel precision and save it"""
+    img = load_frame(frame_path)
+
+    if img is None:
+        raise ValueError(f"Failed: {frame_path.name}")
+
+    with span('warp', 'render'):
+        canvas = cv2.warpAffine(img, M[:2], OUTPUT_SIZE, flags=cv2.INTER_LANCZOS4,
+                                borderMode=cv2.BORDER_CONSTANT, borderValue=0)
+
+    output_path = output_folder / frame_path.name
+    save_frame(output_path, canvas)
+
+def register_folder(input_folder, output_folder):
+    """Register every frame of input_folder to the reference and warp it into output_folder"""
+    input_folder = Path(input_folder)
+    output_folder = Path(output_folder)
+    output_folder.mkdir(exist_ok=True)
+
+    frame_files = sorted(input_folder.glob('frame_*.png'))
+
+    if not frame_files:
+        print(f"No frames found in {input_folder}")
+        return
+
+    reference = REFERENCE_FRAME_NUM - 1
+    geometry = build_index(input_folder)
+    ref_geometry = geometry.get(frame_files[reference].name)
+
+    if ref_geometry is None or ref_geometry['center_of_mass'] is None:
+        print("Could not detect car in reference frame!")
+        return
+
+    print(f"Step 1: Registering {len(frame_files) - 1} neighbor pairs "
+          f"(working size {WORK_SIZE}px, {WORKERS} workers)...")
+
+    def report(i, result, error):
+        if error:
+            print(f"✗ {error}")
+        if i % 10 == 0:
+            print(f"Registered {i}/{len(frame_files) - 1} pairs")
+
+    pairs = map_frames(register_neighbors, list(zip(frame_files, frame_files[1:])), WORKERS, report)
+
+    # A pair that failed is treated as no motion so the chain stays intact
+    pair_transforms = [result if error is None else (1.0, 0.0, 0.0) for result, error in pairs]
+    transforms = chain_transforms(pair_transforms, reference)
+    anchors = [anchor_transform(geometry.get(frame_path.name), ref_geometry) for frame_path in frame_files]
+    transforms = correct_drift(transforms, anchors)
+
+    (output_folder / TRANSFORMS_FILE).write_text(json.dumps({
+        'reference': frame_files[reference].name,
+        'frames': {
+            frame_path.name: [M[0, 0], M[0, 2], M[1, 2]]
+            for frame_path, M in zip(frame_files, transforms)
+        },
+    }, indent=1))
+
+    scales = [M[0, 0] for M in transforms]
+    print(f"Scale range: {min(scales):.4f} - {max(scales):.4f}")
+
+    print(f"\nStep 2: Warping {len(frame_files)} frames onto the canvas...")
+    placement = canvas_transform(ref_geometry['bbox'])
+
+    def report_warp(i, result, error):
+        if error:
+            print(f"✗ {error}")
+        if i % 10 == 0:
+            print(f"Processed {i}/{len(frame_files)} frames")
+
+    results = map_frames(process_frame, [(frame_path, output_folder, placement @ M)
+                                         for frame_path, M in zip(frame_files, transforms)],
+                         WORKERS, report_warp)
+    success = sum(1 for _, error in results if error is None)
+
+    print(f"\n✅ Registered {success}/{len(frame_files)} frames!")
+    print(f"Output: {output_folder}")
+    print(f"Transforms: {output_folder / TRANSFORMS_FILE}")
+
+def main():
+    register_folder(INPUT_FOLDER, OUTPUT_FOLDER)
+
+if __name__ == '__main__':
+    main()
@@ -1,10 +1,16 @@
-import requests
+import os
 from pathlib import Path
-import time
+
+from build_cache import file_digest, is_fresh, load_cache, output_key, record, save_cache
+from removebg_client import API_URL, RemoveBgClient
 
 # Configuration
-API_KEY = "iaz2fWbNrcugK9z4vr4gcHak"
-API_URL = "https://api.remove.bg/v1.0/removebg"
+API_KEY = os.environ.get('REMOVEBG_API_KEY')  # Required, from your remove.bg account
+REQUEST_DATA = {'size': 'auto'}  # Part of every output's cache key
+WORKERS = int(os.environ.get('REMOVEBG_WORKERS', 4))  # Concurrent API requests
+
+if not API_KEY:
+    raise SystemExit("❌ REMOVEBG_API_KEY is not set; export your remove.bg API key to run this script")
 
 # Directories
 input_dir = Path("car_frames")
@@ -14,55 +20,64 @@ output_dir.mkdir(exist_ok=True)
 # Get all frame files
 frame_files = sorted(input_dir.glob("frame_*.jpg"))
 
+# Outputs are keyed on input bytes + request parameters
+cache = load_cache(output_dir)
+
 print(f"🚀 Starting Remove.bg API Processing")
 print(f"📁 Found {len(frame_files)} frames to process")
 print(f"🔑 Using API key: {API_KEY[:10]}...")
+print(f"🌐 Endpoint: {API_URL} ({WORKERS} concurrent requests)")
 print(f"📂 Output folder: {output_dir}\n")
 
+client = RemoveBgClient(API_KEY, API_URL, WORKERS, request_data=REQUEST_DATA)
 success_count = 0
 failed_files = []
+pending = []
 
 for i, frame_path in enumerate(frame_files, 1):
     output_path = output_dir / (frame_path.stem + ".png")
     
-    # Skip if already processed
-    if output_path.exists():
+    key = output_key(file_digest(frame_path), 'removebg', REQUEST_DATA)
+    
+    # Skip if already processed from the same input and parameters
+    if is_fresh(cache, output_dir, output_path.name, key):
+        print(f"⏭️  {i}/{len(frame_files)}: {frame_path.name} (up to date)")
+        success_count += 1
+        continue
+    
+    # Adopt an output made before the output cache existed only if it is the
+    # API's response to this very input; anything else is processed again
+    if (output_path.exists() and output_path.name not in cache and
+            client.cached_response(frame_path) == output_path.read_bytes()):
+        record(cache, output_dir, output_path.name, key)
         print(f"⏭️  {i}/{len(frame_files)}: {frame_path.name} (already exists)")
         success_count += 1
         continue
     
-    try:
-        print(f"🔄 {i}/{len(frame_files)}: Processing {frame_path.name}...", end=" ", flush=True)
-        
-        # Open and read the image file
-        with open(frame_path, 'rb') as img_file:
-            # Make API request with retry logic
-            response = requests.post(
-                API_URL,
-                files={'image_file': img_file},
-                data={'size': 'auto'},
-                headers={'X-Api-Key': API_KEY},
-                timeout=60
-            )
-        
-        # Check if successful
-        if response.status_code == 200:
-            # Save the result
-            with open(output_path, 'wb') as out_file:
-                out_file.write(response.content)
-            print(f"✅ Done!")
-            success_count += 1
-        else:
-            error_msg = response.json().get('errors', [{}])[0].get('title', 'Unknown error')
-            print(f"❌ Failed: {error_msg}")
-            failed_files.append((frame_path.name, error_msg))
-        
-        # Rate limiting: wait a bit between requests
-        time.sleep(1)
-        
-    except Exception as e:
-        print(f"❌ Error: {str(e)}")
-        failed_files.append((frame_path.name, str(e)))
+    pending.append((frame_path, output_path, key))
+
+save_cache(output_dir, cache)
+
+def report(i, png_bytes, from_cache, error):
+    global success_count
+    frame_path, output_path, key = pending[i - 1]
+    
+    if error:
+        print(f"❌ {i}/{len(pending)}: {frame_path.name} - {error}")
+        failed_files.append((frame_path.name, error))
+        return
+    
+    # Save the result
+    with open(output_path, 'wb') as out_file:
+        out_file.write(png_bytes)
+    record(cache, output_dir, output_path.name, key)
+    save_cache(output_dir, cache)
+    success_count += 1
+    print(f"✅ {i}/{len(pending)}: {frame_path.name}" + (" (cached response)" if from_cache else ""))
+
+if pending:
+    print(f"\n🔄 Sending {len(pending)} frames to the API...")
+    client.remove_backgrounds([frame_path for frame_path, _, _ in pending], report)
 
 # Summary
 print(f"\n{'='*60}")
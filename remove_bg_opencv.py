@@ -1,15 +1,25 @@
+import os
 import cv2
 import numpy as np
 from pathlib import Path
 
-def remove_background_simple(image_path, output_path):
+from frame_store import load_frame
+from tracing import traced
+
+# Configuration
+# 'simple': per-image HSV thresholds. 'batch': segment all frames against a
+# background plate - only for static-camera turntable shoots.
+MODE = os.environ.get('BG_MODE', 'simple')
+CLEAN_PLATE = os.environ.get('BG_CLEAN_PLATE')  # Photo of the empty set; estimated if unset
+PLATE_THRESHOLD = 30  # Min channel difference from the plate for foreground
+PLATE_CHUNK_ROWS = 64  # Rows per median pass (bounds temporary memory)
+SEGMENT_CHUNK_FRAMES = 16  # Frames per vectorized segmentation pass
+
+@traced('remove_background', 'analysis')
+def remove_background(img):
     """
-    Simple background removal using color-based segmentation.
-    Works best with uniform backgrounds.
+    BGRA version of a BGR image with a light, uniform background made transparent.
     """
-    # Read image
-    img = cv2.imread(str(image_path))
-    
     # Convert to HSV for better color segmentation
     hsv = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)
     
@@ -31,35 +41,136 @@ def remove_background_simple(image_path, output_path):
     
     # Create 4-channel image (BGRA)
     b, g, r = cv2.split(img)
-    rgba = cv2.merge((b, g, r, fg_mask))
+    return cv2.merge((b, g, r, fg_mask))
+
+def remove_background_simple(image_path, output_path):
+    """
+    Simple background removal using color-based segmentation.
+    Works best with uniform backgrounds.
+    """
+    # Read image
+    img = load_frame(image_path)
+    
+    rgba = remove_background(img)
     
     # Save as PNG with transparency
     cv2.imwrite(str(output_path), rgba)
     
     return True
 
-# Main processing
-input_dir = Path("car_frames")
-output_dir = Path("car_frames_nobg")
-output_dir.mkdir(exist_ok=True)
+def estimate_background_plate(frames, chunk_rows=PLATE_CHUNK_ROWS):
+    """
+    Per-pixel temporal median of an (N, H, W, 3) frame stack.
+    The set is static while the car rotates, so every background pixel is
+    uncovered in most frames. Pixels the car covers in more than half of
+    the frames (the turntable center) need a CLEAN_PLATE instead.
+    """
+    plate = np.empty(frames.shape[1:], dtype=np.uint8)
+    for y in range(0, frames.shape[1], chunk_rows):
+        plate[y:y+chunk_rows] = np.median(frames[:, y:y+chunk_rows], axis=0)
+    return plate
+
+def segment_against_plate(frames, plate, threshold=PLATE_THRESHOLD,
+                          chunk_frames=SEGMENT_CHUNK_FRAMES):
+    """
+    Foreground masks (N, H, W) for a whole stack.
+    A pixel is foreground when any channel differs from the plate by more
+    than threshold. Differences go into one reused chunk buffer and the
+    channel maximum is taken on whole chunks, then the masks get the same
+    morphology as remove_background_simple.
+    """
+    masks = np.empty(frames.shape[:3], dtype=np.uint8)
+    diff = np.empty((chunk_frames,) + frames.shape[1:], dtype=np.uint8)
+    for start in range(0, len(frames), chunk_frames):
+        chunk = frames[start:start+chunk_frames]
+        d = diff[:len(chunk)]
+        for frame, frame_diff in zip(chunk, d):
+            cv2.absdiff(frame, plate, dst=frame_diff)
+        channel_max = np.maximum(np.maximum(d[..., 0], d[..., 1]), d[..., 2])
+        np.multiply(channel_max > threshold, 255, out=masks[start:start+len(chunk)], casting='unsafe')
+    
+    kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (5, 5))
+    for mask in masks:
+        cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel, dst=mask)
+        cv2.morphologyEx(mask, cv2.MORPH_OPEN, kernel, dst=mask)
+    return masks
+
+def load_stack(frame_files):
+    """(N, H, W, 3) stack of a frame set, decoded straight into one preallocated array"""
+    first = load_frame(frame_files[0])
+    if first is None:
+        raise ValueError(f"Failed to load: {frame_files[0]}")
+    frames = np.empty((len(frame_files),) + first.shape, dtype=first.dtype)
+    frames[0] = first
+    del first
+    for i, frame_path in enumerate(frame_files[1:], 1):
+        img = load_frame(frame_path)
+        if img is None:
+            raise ValueError(f"Failed to load: {frame_path}")
+        if img.shape != frames.shape[1:]:
+            raise ValueError(f"{frame_path} is {img.shape}, the set is {frames.shape[1:]}")
+        frames[i] = img
+    return frames
 
-frame_files = sorted(input_dir.glob("frame_*.jpg"))
+def load_plate(clean_plate, shape):
+    """Clean plate photo, checked against the frame shape"""
+    plate = cv2.imread(str(clean_plate))
+    if plate is None:
+        raise ValueError(f"Failed to load clean plate: {clean_plate}")
+    if plate.shape != shape:
+        raise ValueError(f"Clean plate {clean_plate} is {plate.shape}, the frames are {shape}")
+    return plate
 
-print(f"Processing {len(frame_files)} frames...")
-print("This uses simple color-based background removal.")
-print("Adjust color thresholds if results aren't good.\n")
+def remove_background_batch(frame_files, output_dir, clean_plate=CLEAN_PLATE):
+    """Remove the background of a whole frame set against one plate"""
+    frames = load_stack(frame_files)
+    
+    if clean_plate is not None:
+        plate = load_plate(clean_plate, frames.shape[1:])
+    else:
+        plate = estimate_background_plate(frames)
+    
+    masks = segment_against_plate(frames, plate)
+    
+    for frame_path, frame, mask in zip(frame_files, frames, masks):
+        rgba = np.dstack((frame, mask))
+        cv2.imwrite(str(output_dir / (frame_path.stem + ".png")), rgba)
+    
+    return len(frame_files)
 
-success_count = 0
-for i, frame_path in enumerate(frame_files, 1):
-    output_path = output_dir / (frame_path.stem + ".png")
-    
-    try:
-        remove_background_simple(frame_path, output_path)
-        print(f"✓ {i}/{len(frame_files)}: {frame_path.name}")
-        success_count += 1
-    except Exception as e:
-        print(f"✗ {i}/{len(frame_files)}: {frame_path.name} - Error: {e}")
+def main():
+    input_dir = Path("car_frames")
+    output_dir = Path("car_frames_nobg")
+    output_dir.mkdir(exist_ok=True)
+    
+    frame_files = sorted(input_dir.glob("frame_*.jpg"))
+    
+    if MODE == 'batch':
+        print(f"Processing {len(frame_files)} frames against a background plate...")
+        print("Plate: " + (str(CLEAN_PLATE) if CLEAN_PLATE else "temporal median of all frames"))
+        success_count = remove_background_batch(frame_files, output_dir)
+        print(f"\n✅ Processed {success_count}/{len(frame_files)} frames")
+        print(f"Output: {output_dir}")
+        return
+    
+    print(f"Processing {len(frame_files)} frames...")
+    print("This uses simple color-based background removal.")
+    print("Adjust color thresholds if results aren't good.\n")
+    
+    success_count = 0
+    for i, frame_path in enumerate(frame_files, 1):
+        output_path = output_dir / (frame_path.stem + ".png")
+        
+        try:
+            remove_background_simple(frame_path, output_path)
+            print(f"✓ {i}/{len(frame_files)}: {frame_path.name}")
+            success_count += 1
+        except Exception as e:
+            print(f"✗ {i}/{len(frame_files)}: {frame_path.name} - Error: {e}")
+    
+    print(f"\n✅ Processed {success_count}/{len(frame_files)} frames")
+    print(f"Output: {output_dir}")
+    print("\nNote: Results may vary. For best quality, use remove.bg or similar AI tools.")
 
-print(f"\n✅ Processed {success_count}/{len(frame_files)} frames")
-print(f"Output: {output_dir}")
-print("\nNote: Results may vary. For best quality, use remove.bg or similar AI tools.")
+if __name__ == '__main__':
+    main()
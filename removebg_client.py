@@ -0,0 +1,193 @@
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
+from pathlib import Path
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Configuration
+API_URL = os.environ.get('REMOVEBG_API_URL', 'https://api.remove.bg/v1.0/removebg')
+CACHE_DIR = '.removebg_cache'  # Responses keyed by input image hash
+WORKERS = 4  # Concurrent requests
+REQUESTS_PER_MINUTE = 500  # Starting budget, refined from the rate-limit headers
+MAX_RETRIES = 5
+BACKOFF_SECONDS = 1.0  # First retry delay, doubled on every further retry
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+class RemoveBgError(Exception):
+    """A frame the API could not process"""
+
+def parse_retry_after(value):
+    """Seconds to wait from a Retry-After header (delta or HTTP date)"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def api_error(response):
+    """Error title from an API error response"""
+    try:
+        return response.json().get('errors', [{}])[0].get('title', 'Unknown error')
+    except ValueError:
+        return f"HTTP {response.status_code}"
+
+class TokenBucket:
+    """Thread-safe token bucket that follows the server's rate-limit headers"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate  # Tokens per second
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self):
+        """Block until a request may be sent"""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self._refill(now)
+                wait = self.blocked_until - now
+                if wait <= 0:
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def update(self, headers):
+        """Adjust to X-RateLimit-Limit/-Remaining/-Reset and Retry-After"""
+        with self.lock:
+            now = time.monotonic()
+            self._refill(now)
+
+            limit = headers.get('X-RateLimit-Limit')
+            if limit:
+                # remove.bg limits are per minute
+                self.rate = max(float(limit), 1.0) / 60
+
+            remaining = headers.get('X-RateLimit-Remaining')
+            if remaining is not None:
+                self.tokens = min(self.tokens, float(remaining))
+                reset = headers.get('X-RateLimit-Reset')  # Unix timestamp
+                if float(remaining) < 1 and reset:
+                    pause = max(0.0, float(reset) - time.time())
+                    self.blocked_until = max(self.blocked_until, now + pause)
+
+            retry_after = parse_retry_after(headers.get('Retry-After'))
+            if retry_after is not None:
+                self.blocked_until = max(self.blocked_until, now + retry_after)
+
+class RemoveBgClient:
+    """Concurrent remove.bg client with a pooled session and a response cache"""
+
+    def __init__(self, api_key, api_url=API_URL, workers=WORKERS, cache_dir=CACHE_DIR,
+                 request_data=None, requests_per_minute=REQUESTS_PER_MINUTE):
+        self.api_url = api_url
+        self.workers = workers
+        self.cache_dir = Path(cache_dir)
+        self.request_data = request_data or {'size': 'auto'}
+        self.limiter = TokenBucket(requests_per_minute / 60, capacity=max(1, workers))
+
+        # One keep-alive connection per worker instead of a new one per request
+        self.session = requests.Session()
+        self.session.headers['X-Api-Key'] = api_key
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(1, workers))
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def cache_path(self, image_bytes):
+        """Cache file for an input image and the current request parameters"""
+        key = hashlib.sha1(image_bytes + json.dumps(self.request_data, sort_keys=True).encode()).hexdigest()
+        return self.cache_dir / f"{key}.png"
+
+    def post(self, image_bytes, name):
+        """Send one image, retrying 429/5xx and network errors with backoff"""
+        for attempt in range(MAX_RETRIES + 1):
+            self.limiter.acquire()
+            retry_after = None
+            try:
+                response = self.session.post(
+                    self.api_url,
+                    files={'image_file': (name, image_bytes)},
+                    data=self.request_data,
+                    timeout=60
+                )
+            except requests.RequestException as e:
+                error = str(e)
+            else:
+                self.limiter.update(response.headers)
+                if response.status_code == 200:
+                    return response.content
+                error = api_error(response)
+                if response.status_code not in RETRY_STATUSES:
+                    raise RemoveBgError(error)
+                retry_after = parse_retry_after(response.headers.get('Retry-After'))
+
+            if attempt == MAX_RETRIES:
+                raise RemoveBgError(f"{error} (gave up after {MAX_RETRIES} retries)")
+
+            # Exponential backoff with jitter unless the server said how long to wait
+            delay = retry_after if retry_after is not None else BACKOFF_SECONDS * 2 ** attempt
+            time.sleep(delay * random.uniform(1.0, 1.25))
+
+    def cached_response(self, frame_path):
+        """PNG bytes the API returned for this frame and request, or None if it was never sent"""
+        cache_path = self.cache_path(Path(frame_path).read_bytes())
+        return cache_path.read_bytes() if cache_path.exists() else None
+
+    def remove_background(self, frame_path):
+        """Background-free PNG bytes for one frame, from the cache when possible"""
+        image_bytes = Path(frame_path).read_bytes()
+        cache_path = self.cache_path(image_bytes)
+
+        if cache_path.exists():
+            return cache_path.read_bytes(), True
+
+        result = self.post(image_bytes, Path(frame_path).name)
+
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        tmp_path = cache_path.with_name(f"{cache_path.name}.{threading.get_ident()}.tmp")
+        tmp_path.write_bytes(result)
+        os.replace(tmp_path, cache_path)
+        return result, False
+
+    def remove_backgrounds(self, frame_paths, on_result=None):
+        """Process frames concurrently; results and callbacks stay in input order.
+
+        Returns (png_bytes, from_cache, error) per frame; a failed frame
+        carries its error instead of aborting the batch.
+        """
+        def run(frame_path):
+            try:
+                png_bytes, from_cache = self.remove_background(frame_path)
+                return png_bytes, from_cache, None
+            except (RemoveBgError, OSError) as e:
+                return None, False, str(e)
+
+        results = []
+        with ThreadPoolExecutor(max_workers=max(1, self.workers)) as executor:
+            futures = [executor.submit(run, frame_path) for frame_path in frame_paths]
+            for i, future in enumerate(futures, 1):
+                result = future.result()
+                results.append(result)
+                if on_result:
+                    on_result(i, *result)
+        return results
@@ -0,0 +1,157 @@
+import argparse
+import cv2
+import numpy as np
+from pathlib import Path
+
+from encoders import FRAME_CODEC, save_frame
+from frame_store import load_frame
+from parallel import WORKERS, map_frames
+from tracing import span
+
+# Configuration
+INPUT_FOLDER = 'car_frames_final'
+OUTPUT_FOLDER = 'car_frames_final_resampled'
+TARGET_FRAMES = 77
+FLOW_SIZE = 160  # Longest side optical flow is computed at, whatever the frame size
+
+def flow_plane(img, factor):
+    """Grayscale of the frame weighted by its alpha, reduced by factor, for flow estimation"""
+    gray = cv2.cvtColor(img[:, :, :3], cv2.COLOR_BGR2GRAY)
+    if img.shape[2] == 4:
+        gray = cv2.multiply(gray, img[:, :, 3], scale=1 / 255)
+    if factor < 1.0:
+        h, w = gray.shape
+        gray = cv2.resize(gray, (max(1, round(w * factor)), max(1, round(h * factor))),
+                          interpolation=cv2.INTER_AREA)
+    return gray
+
+def dense_flow(a, b):
+    """Full-resolution Farneback flow from frame a to frame b, estimated at FLOW_SIZE"""
+    if a.shape != b.shape:
+        raise ValueError(f"Frames differ in size: {a.shape} vs {b.shape}")
+    h, w = a.shape[:2]
+    factor = min(1.0, FLOW_SIZE / max(h, w))
+    with span('optical_flow', 'analysis'):
+        flow = cv2.calcOpticalFlowFarneback(flow_plane(a, factor), flow_plane(b, factor), None,
+                                            pyr_scale=0.5, levels=4, winsize=15, iterations=3,
+                                            poly_n=5, poly_sigma=1.2, flags=0)
+    if factor < 1.0:
+        flow = cv2.resize(flow, (w, h), interpolation=cv2.INTER_LINEAR) / factor
+    return flow
+
+def premultiply(img):
+    """float32 frame with color scaled by alpha, so transparent pixels blend as nothing"""
+    img = img.astype(np.float32)
+    if img.shape[2] != 4:
+        return img
+    b, g, r, a = cv2.split(img)
+    weight = a * (1 / 255)
+    return cv2.merge([b * weight, g * weight, r * weight, a])
+
+def unpremultiply(img):
+    """uint8 frame from premultiplied float32"""
+    if img.shape[2] == 4:
+        b, g, r, a = cv2.split(img)
+        weight = np.divide(255.0, a, out=np.zeros_like(a), where=a > 0)
+        img = cv2.merge([b * weight, g * weight, r * weight, a])
+    # Rounds and saturates; values are never negative
+    return cv2.convertScaleAbs(img)
+
+def warp_by_flow(img, flow, t):
+    """Frame moved a fraction t along flow (pixels sample from x - t * flow(x))"""
+    h, w = flow.shape[:2]
+    xs, ys = np.meshgrid(np.arange(w, dtype=np.float32), np.arange(h, dtype=np.float32))
+    return cv2.remap(img, xs - t * flow[:, :, 0], ys - t * flow[:, :, 1], cv2.INTER_LINEAR,
+                     borderMode=cv2.BORDER_CONSTANT, borderValue=0)
+
+def interpolate(a, b, t, flow_ab, flow_ba):
+    """Frame a fraction t of the way from a to b.
+
+    Both frames are warped toward the in-between position along their flow
+    to each other and cross-faded, in premultiplied alpha so the edges of
+    the car do not pick up the color of transparent pixels.
+    """
+    with span('interpolate', 'render'):
+        from_a = warp_by_flow(premultiply(a), flow_ab, t)
+        from_b = warp_by_flow(premultiply(b), flow_ba, 1 - t)
+        return unpremultiply(cv2.addWeighted(from_a, 1 - t, from_b, t, 0))
+
+def resample_positions(frame_count, target):
+    """For every output frame: (input index, fraction toward the next input).
+
+    Outputs are spread evenly over the revolution, which wraps from the
+    last input frame back to the first.
+    """
+    positions = []
+    for k in range(target):
+        position = k * frame_count / target
+        index = int(position)
+        positions.append((index, position - index))
+    return positions
+
+def process_pair(a_path, b_path, outputs, output_folder, codec=FRAME_CODEC):
+    """Write every output frame between two neighboring inputs; outputs is [(number, t)]"""
+    a = load_frame(a_path)
+    b = load_frame(b_path)
+    if a is None or b is None:
+        raise ValueError(f"Failed to load: {a_path.name} / {b_path.name}")
+
+    flows = None
+    for number, t in outputs:
+        if t == 0:
+            frame = a
+        else:
+            if flows is None:
+                flows = dense_flow(a, b), dense_flow(b, a)
+            frame = interpolate(a, b, t, *flows)
+        save_frame(output_folder / f"frame_{number:03d}.png", frame, codec)
+
+    return len(outputs)
+
+def main():
+    parser = argparse.ArgumentParser(description="Resample a frame set to N evenly spaced frames")
+    parser.add_argument('--input', default=INPUT_FOLDER, help=f"Aligned frames (default: {INPUT_FOLDER})")
+    parser.add_argument('--output', default=OUTPUT_FOLDER, help=f"Output folder (default: {OUTPUT_FOLDER})")
+    parser.add_argument('--frames', type=int, default=TARGET_FRAMES,
+                        help=f"Frames per revolution to produce (default: {TARGET_FRAMES})")
+    args = parser.parse_args()
+
+    frame_files = sorted(Path(args.input).glob('frame_*.png'))
+    if not frame_files:
+        print(f"No frames found in {args.input}")
+        return
+    if args.frames < 1:
+        parser.error("--frames must be at least 1")
+
+    output_folder = Path(args.output)
+    output_folder.mkdir(exist_ok=True)
+    for stale in output_folder.glob('frame_*.*'):
+        stale.unlink()  # A smaller target must not leave old frames behind
+
+    # Group outputs by the input pair they fall between, so each pair's flow is computed once
+    pairs = {}
+    for number, (index, t) in enumerate(resample_positions(len(frame_files), args.frames), 1):
+        pairs.setdefault(index, []).append((number, t))
+
+    interpolated = sum(1 for outputs in pairs.values() for _, t in outputs if t > 0)
+    print(f"Resampling {len(frame_files)} frames to {args.frames} "
+          f"({interpolated} interpolated, flow at {FLOW_SIZE}px)...")
+    print(f"Workers: {WORKERS}")
+
+    def report(i, result, error):
+        if error:
+            print(f"✗ {error}")
+        if i % 10 == 0:
+            print(f"✓ {i}/{len(pairs)} frame pairs")
+
+    jobs = [(frame_files[index], frame_files[(index + 1) % len(frame_files)], outputs, output_folder, FRAME_CODEC)
+            for index, outputs in sorted(pairs.items())]
+    results = map_frames(process_pair, jobs, WORKERS, report)
+    written = sum(result for result, error in results if error is None)
+
+    print(f"\n✅ {written}/{args.frames} frames saved to {args.output}")
+    if args.frames != TARGET_FRAMES:
+        print(f"Note: set totalFrames = {args.frames} in script.js to view them")
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,11 @@
 // Car 360 Viewer Configuration
 const totalFrames = 77; // Total number of frames extracted
 const FRAME_FOLDER = 'car_frames_final'; // Final frames - absolute positioning
-const FRAME_EXTENSION = 'png'; // PNG for transparency
+const FRAME_EXTENSION = 'png'; // PNG for transparency; match FRAME_CODEC (webp, avif) of the export
+const FRAME_MANIFEST = 'manifest.json'; // Written by crop_frames.py / build_atlas.py / build_pyramid.py
+const FRAME_ANGLES = 'angles.json'; // Written by frame_angles.py
+const DEGREES_PER_PIXEL = 360 / totalFrames / 6; // Drag sensitivity when frames have measured angles
+const VIEWER_SIZE = { width: 800, height: 600 }; // Display size of a full canvas
 let currentFrame = 1;
 let isAutoRotating = false;
 let autoRotateInterval;
@@ -12,12 +16,28 @@ let hasInteracted = false;
 let lastFrameChangeTime = 0;
 const frameChangeDelay = 25; // Optimized for smooth rotation
 let accumulatedDelta = 0;
+let currentAngle = 0; // Degrees, when frames have measured angles
 
 // Image cache to prevent flickering
 const imageCache = {};
+const cachedLevels = {}; // Pyramid level held in imageCache per frame
+
+// Paste rectangles of cropped frames; null when frames are full canvases
+let frameLayout = null;
+
+// Measured angle of each frame and the angle -> frame lookup; null for evenly spaced frames
+let angleTable = null;
+const frameAngles = {}; // Frame number -> degrees
+const keptIndex = {}; // Frame number -> position in angleTable.kept
+
+// Atlas sheets, when the frame folder was built by build_atlas.py
+const atlasSheets = [];
+let atlasReady = false;
 
 const carImage = document.getElementById('car-image');
 const carImageBuffer = document.getElementById('car-image-buffer');
+const carCanvas = document.getElementById('car-canvas');
+const carCanvasContext = carCanvas.getContext('2d');
 let activeImage = carImage; // Track which image is currently visible
 let bufferImage = carImageBuffer;
 
@@ -30,31 +50,206 @@ const interactOverlay = document.getElementById('interact-overlay');
 // Update total frames display
 totalFramesDisplay.textContent = totalFrames;
 
-// Preload all frames and show loading
-let loadedFrames = 0;
-const framesToPreload = totalFrames;
+// Frames the viewer shows: every frame, or only the non-redundant ones of the angle table
+function shownFrames() {
+    if (angleTable) return angleTable.kept;
+    return Array.from({ length: totalFrames }, (_, i) => i + 1);
+}
+
+// Frame whose file is shown for a frame that dedupe_frames.py collapsed into a reference
+function sourceFrame(frameNumber) {
+    const references = frameLayout && frameLayout.references;
+    const source = references && references[frameName(frameNumber)];
+    return source ? parseInt(source.match(/frame_(\d+)/)[1], 10) : frameNumber;
+}
+
+// Files to download: each shown frame's source, once
+function framesToFetch() {
+    return [...new Set(shownFrames().map(sourceFrame))];
+}
+
+function frameName(frameNumber) {
+    return `frame_${String(frameNumber).padStart(3, '0')}.${FRAME_EXTENSION}`;
+}
+
+function isPyramid() {
+    return Boolean(frameLayout && frameLayout.levels);
+}
+
+// Pyramid levels are ordered smallest first, so level 0 is the quickest to load
+function frameUrl(frameNumber, level = 0) {
+    if (isPyramid()) {
+        return `${FRAME_FOLDER}/${frameLayout.levels[level].folder}/${frameName(frameNumber)}`;
+    }
+    return `${FRAME_FOLDER}/${frameName(frameNumber)}`;
+}
+
+// Load the crop manifest if the frame folder has one
+function loadFrameLayout() {
+    return fetch(`${FRAME_FOLDER}/${FRAME_MANIFEST}`)
+        .then(response => response.ok ? response.json() : null)
+        .then(manifest => {
+            frameLayout = manifest;
+        })
+        .catch(() => {
+            frameLayout = null;
+        });
+}
+
+// Load the angle table if the frame folder has one
+function loadFrameAngles() {
+    return fetch(`${FRAME_FOLDER}/${FRAME_ANGLES}`)
+        .then(response => response.ok ? response.json() : null)
+        .then(table => {
+            angleTable = table;
+            if (!table) return;
+            table.frames.forEach((frameNumber, i) => {
+                frameAngles[frameNumber] = table.angles[i];
+            });
+            table.kept.forEach((frameNumber, i) => {
+                keptIndex[frameNumber] = i;
+            });
+            currentFrame = frameAtAngle(currentAngle);
+        })
+        .catch(() => {
+            angleTable = null;
+        });
+}
+
+// Constant-time lookup of the frame closest to an angle
+function frameAtAngle(angle) {
+    const bins = angleTable.lookup.length;
+    const bin = Math.floor((((angle % 360) + 360) % 360) / 360 * bins);
+    return angleTable.lookup[Math.min(bin, bins - 1)];
+}
+
+// Turn to an angle and show the frame for it
+function rotateTo(angle) {
+    currentAngle = ((angle % 360) + 360) % 360;
+    const frameNumber = frameAtAngle(currentAngle);
+    if (frameNumber !== currentFrame) loadFrame(frameNumber);
+}
+
+// Show the next (1) or previous (-1) frame
+function stepFrame(direction) {
+    if (!angleTable) {
+        loadFrame(currentFrame + direction);
+        return;
+    }
+    const kept = angleTable.kept;
+    const next = kept[(keptIndex[currentFrame] + direction + kept.length) % kept.length];
+    currentAngle = frameAngles[next];
+    loadFrame(next);
+}
+
+// Position an image layer where its crop sits on the full canvas
+function placeFrame(img, frameNumber) {
+    if (!frameLayout || !frameLayout.frames) return;
+    
+    const rect = frameLayout.frames[frameName(frameNumber)];
+    if (!rect) return;
+    
+    const scaleX = VIEWER_SIZE.width / frameLayout.canvas[0];
+    const scaleY = VIEWER_SIZE.height / frameLayout.canvas[1];
+    const [x, y, w, h] = rect;
+    
+    // The stylesheet pins the layers to the full canvas with !important
+    img.classList.add('cropped');
+    img.style.setProperty('left', `${x * scaleX}px`, 'important');
+    img.style.setProperty('top', `${y * scaleY}px`, 'important');
+    img.style.setProperty('width', `${w * scaleX}px`, 'important');
+    img.style.setProperty('height', `${h * scaleY}px`, 'important');
+}
+
+function isAtlas() {
+    return Boolean(frameLayout && frameLayout.sheets);
+}
+
+// Draw a frame from its atlas sheet; synchronous, so no double-buffering is needed
+function drawAtlasFrame(frameNumber) {
+    const name = frameName(sourceFrame(frameNumber));
+    const placement = frameLayout.atlas[name];
+    if (!placement) return;
+    
+    const [sheet, sx, sy] = placement;
+    const [x, y, w, h] = frameLayout.frames[name];
+    carCanvasContext.clearRect(0, 0, carCanvas.width, carCanvas.height);
+    carCanvasContext.drawImage(atlasSheets[sheet], sx, sy, w, h, x, y, w, h);
+}
 
-function preloadAllFrames() {
-    for (let i = 1; i <= framesToPreload; i++) {
-        const frameString = String(i).padStart(3, '0');
+// Load the few atlas sheets instead of one request per frame
+function preloadAtlas() {
+    let loadedSheets = 0;
+    carCanvas.width = frameLayout.canvas[0];
+    carCanvas.height = frameLayout.canvas[1];
+    
+    frameLayout.sheets.forEach((sheetFile, index) => {
         const img = new Image();
         img.onload = () => {
-            // Cache the loaded image
-            imageCache[i] = img;
-            loadedFrames++;
-            if (loadedFrames === framesToPreload) {
-                // All frames loaded, hide loading overlay
+            atlasSheets[index] = img;
+            loadedSheets++;
+            if (loadedSheets === frameLayout.sheets.length) {
+                atlasReady = true;
+                carImage.hidden = true;
+                carImageBuffer.hidden = true;
+                carCanvas.hidden = false;
+                drawAtlasFrame(currentFrame);
                 setTimeout(() => {
                     loadingOverlay.classList.add('hidden');
                 }, 500);
             }
         };
-        img.src = `${FRAME_FOLDER}/frame_${frameString}.${FRAME_EXTENSION}`;
-    }
+        img.src = `${FRAME_FOLDER}/${sheetFile}`;
+    });
 }
 
-// Start preloading on page load
-preloadAllFrames();
+function preloadAllFrames(level = 0) {
+    const framesToPreload = framesToFetch();
+    let loadedFrames = 0;
+    framesToPreload.forEach(i => {
+        const img = new Image();
+        img.onload = () => {
+            // Cache the loaded image unless a sharper level is already there
+            if (!(cachedLevels[i] > level)) {
+                imageCache[i] = img;
+                cachedLevels[i] = level;
+                // Sharpen the frame on screen as soon as its better level arrives
+                if (level > 0 && i === sourceFrame(currentFrame)) {
+                    activeImage.src = img.src;
+                }
+            }
+            loadedFrames++;
+            if (loadedFrames === framesToPreload.length) {
+                if (level === 0) {
+                    // All frames loaded, hide loading overlay
+                    setTimeout(() => {
+                        loadingOverlay.classList.add('hidden');
+                    }, 500);
+                }
+                // Fetch the next pyramid level in the background
+                if (isPyramid() && level + 1 < frameLayout.levels.length) {
+                    preloadAllFrames(level + 1);
+                }
+            }
+        };
+        img.src = frameUrl(i, level);
+    });
+}
+
+// Start preloading once the frame layout and angles are known
+Promise.all([loadFrameLayout(), loadFrameAngles()]).then(() => {
+    if (isAtlas()) {
+        preloadAtlas();
+        return;
+    }
+    const source = sourceFrame(currentFrame);
+    placeFrame(carImage, source);
+    placeFrame(carImageBuffer, source);
+    carImage.src = frameUrl(source);
+    carImageBuffer.src = frameUrl(source);
+    preloadAllFrames();
+    preloadFrames();
+});
 
 // Handle interact overlay click
 interactOverlay.addEventListener('click', () => {
@@ -64,7 +259,7 @@ interactOverlay.addEventListener('click', () => {
     setTimeout(() => {
         if (!isDragging && !isAutoRotating) {
             for (let i = 1; i <= 10; i++) {
-                setTimeout(() => loadFrame(currentFrame + 1), i * 100);
+                setTimeout(() => stepFrame(1), i * 100);
             }
         }
     }, 300);
@@ -83,16 +278,23 @@ function loadFrame(frameNumber) {
     lastFrameChangeTime = now;
     
     currentFrame = frameNumber;
-    const frameString = String(frameNumber).padStart(3, '0');
     
-    // Load the new frame into the buffer image
-    const frameSrc = imageCache[frameNumber] ? imageCache[frameNumber].src : `${FRAME_FOLDER}/frame_${frameString}.${FRAME_EXTENSION}`;
+    if (isAtlas()) {
+        if (atlasReady) drawAtlasFrame(frameNumber);
+        currentFrameDisplay.textContent = currentFrame;
+        return;
+    }
+    
+    // Load the new frame into the buffer image; duplicates share their source's file
+    const source = sourceFrame(frameNumber);
+    const frameSrc = imageCache[source] ? imageCache[source].src : frameUrl(source);
     
-    // Set the buffer image source
+    // Set the buffer image source at the frame's position
+    placeFrame(bufferImage, source);
     bufferImage.src = frameSrc;
     
     // Once loaded, swap visibility instantly
-    if (imageCache[frameNumber]) {
+    if (imageCache[source]) {
         // Image is cached, swap immediately
         swapImages();
     } else {
@@ -136,6 +338,13 @@ document.addEventListener('mousemove', (e) => {
     currentX = e.clientX;
     const delta = currentX - startX;
     
+    // Measured angles: drag distance maps to degrees, not frames
+    if (angleTable) {
+        rotateTo(currentAngle + delta * DEGREES_PER_PIXEL);
+        startX = currentX;
+        return;
+    }
+    
     // Accumulate small movements for precise control
     accumulatedDelta += delta;
     
@@ -178,6 +387,12 @@ carImage.parentElement.addEventListener('touchmove', (e) => {
     currentX = e.touches[0].clientX;
     const delta = currentX - startX;
     
+    if (angleTable) {
+        rotateTo(currentAngle + delta * DEGREES_PER_PIXEL);
+        startX = currentX;
+        return;
+    }
+    
     // Accumulate small movements for precise control
     accumulatedDelta += delta;
     
@@ -210,6 +425,11 @@ document.getElementById('autoRotateBtn').addEventListener('click', function() {
         
         // Rotate through frames automatically
         autoRotateInterval = setInterval(() => {
+            // Measured angles: turn at a constant speed whatever the frame spacing
+            if (angleTable) {
+                rotateTo(currentAngle + 360 / totalFrames);
+                return;
+            }
             let nextFrame = currentFrame + 1;
             if (nextFrame > totalFrames) nextFrame = 1;
             loadFrame(nextFrame);
@@ -238,10 +458,10 @@ document.getElementById('fullscreenBtn').addEventListener('click', function() {
 document.addEventListener('keydown', function(e) {
     switch(e.key) {
         case 'ArrowLeft':
-            loadFrame(currentFrame - 1);
+            stepFrame(-1);
             break;
         case 'ArrowRight':
-            loadFrame(currentFrame + 1);
+            stepFrame(1);
             break;
         case 'f':
         case 'F':
@@ -267,27 +487,29 @@ setTimeout(() => {
 
 // Preload adjacent frames for smooth rotation
 function preloadFrames() {
+    // Atlas sheets already hold every frame
+    if (isAtlas()) return;
+    
     // Preload more frames ahead and behind for ultra-smooth rotation
+    const frames = shownFrames();
+    const position = angleTable ? keptIndex[currentFrame] : currentFrame - 1;
     for (let i = -5; i <= 5; i++) {
-        let frameNum = currentFrame + i;
-        if (frameNum < 1) frameNum += totalFrames;
-        if (frameNum > totalFrames) frameNum -= totalFrames;
+        const frameNum = sourceFrame(frames[(position + i + frames.length) % frames.length]);
         
         // Only preload if not already cached
         if (!imageCache[frameNum]) {
-            const frameString = String(frameNum).padStart(3, '0');
             const img = new Image();
             img.onload = () => {
-                imageCache[frameNum] = img;
+                if (!imageCache[frameNum]) {
+                    imageCache[frameNum] = img;
+                    cachedLevels[frameNum] = 0;
+                }
             };
-            img.src = `${FRAME_FOLDER}/frame_${frameString}.${FRAME_EXTENSION}`;
+            img.src = frameUrl(frameNum);
         }
     }
 }
 
-// Preload initial frames
-preloadFrames();
-
 // Preload on frame change
 carImage.addEventListener('load', preloadFrames);
 
@@ -0,0 +1,73 @@
+import os
+import queue
+import threading
+
+from parallel import call_frame
+
+# Configuration
+# Items waiting between two stages (FRAME_QUEUE_SIZE overrides); frames in
+# flight never exceed about (stages + 1) * (QUEUE_SIZE + 1)
+QUEUE_SIZE = int(os.environ.get('FRAME_QUEUE_SIZE', 2))
+
+# End-of-stream marker passed down the queues
+_DONE = object()
+
+def feed(args_list, outbox):
+    """Put every args tuple on the first queue as a (args, no error) item.
+
+    args_list may be a generator (frames decoded on the fly); if it raises,
+    the stream ends with the error as one last failed item.
+    """
+    try:
+        for args in args_list:
+            outbox.put((args, None))
+    except Exception as e:
+        outbox.put((None, str(e) or type(e).__name__))
+    outbox.put(_DONE)
+
+def run_stage(func, inbox, outbox):
+    """Apply func to every item until the end marker; failed items pass straight through"""
+    while True:
+        item = inbox.get()
+        if item is _DONE:
+            outbox.put(_DONE)
+            return
+        args, error = item
+        if error is None:
+            item = call_frame(func, args)
+        outbox.put(item)
+
+def stream_frames(stages, args_list, queue_size=QUEUE_SIZE):
+    """Yield (result, error) for every frame as it leaves the last stage.
+
+    Each stage is a function on its own thread, connected to the next by a
+    bounded queue, so decoding, transforming and encoding/writing of
+    different frames overlap (OpenCV and file I/O release the GIL). The
+    first stage is called with each args tuple, later stages with the tuple
+    the previous stage returned. Frames come out in input order. A stage
+    that raises skips the rest of the stages for that frame only.
+    """
+    queues = [queue.Queue(queue_size) for _ in range(len(stages) + 1)]
+    threads = [threading.Thread(target=feed, args=(args_list, queues[0]), daemon=True)]
+    threads += [threading.Thread(target=run_stage, args=(stage, inbox, outbox), daemon=True)
+                for stage, inbox, outbox in zip(stages, queues, queues[1:])]
+    for thread in threads:
+        thread.start()
+
+    while True:
+        item = queues[-1].get()
+        if item is _DONE:
+            break
+        yield item
+
+    for thread in threads:
+        thread.join()
+
+def map_stream(stages, args_list, on_result=None, queue_size=QUEUE_SIZE):
+    """Streaming counterpart of parallel.map_frames: (result, error) pairs in input order"""
+    results = []
+    for i, (result, error) in enumerate(stream_frames(stages, args_list, queue_size), 1):
+        results.append((result, error))
+        if on_result:
+            on_result(i, result, error)
+    return results
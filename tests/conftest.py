@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# The pipeline is a folder of top-level scripts; make them importable
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
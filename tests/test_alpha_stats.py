@@ -0,0 +1,18 @@
+import cv2
+import numpy as np
+
+from alpha_stats import batch_stats, frame_stats
+
+def test_batch_stats_matches_frame_stats():
+    rng = np.random.default_rng(0)
+    stack = np.zeros((5, 60, 80, 4), dtype=np.uint8)
+    stack[..., :3] = rng.integers(0, 256, stack.shape[:3] + (3,), dtype=np.uint8)
+    for i, frame in enumerate(stack[1:], 1):
+        alpha = np.ascontiguousarray(frame[:, :, 3])
+        cv2.ellipse(alpha, (20 + 8 * i, 30), (12, 7 + i), 0, 0, 360, 255, -1)
+        alpha[rng.integers(0, 60), rng.integers(0, 80)] = 9  # A stray faint pixel
+        frame[:, :, 3] = alpha
+
+    stats = batch_stats(stack)
+    assert stats == [frame_stats(frame) for frame in stack]
+    assert stats[0]['bbox'] is None and stats[1]['bbox'] is not None
@@ -0,0 +1,23 @@
+import cv2
+import numpy as np
+
+from build_pyramid import build_levels
+
+def test_transparent_color_does_not_bleed_into_edges():
+    # A red car on a transparent background that still holds green pixels
+    img = np.zeros((64, 64, 4), dtype=np.uint8)
+    img[..., 1] = 255
+    img[16:48, 16:48] = (0, 0, 255, 255)
+
+    levels = build_levels(img, 3)
+    assert [level.shape for level in levels] == [(64, 64, 4), (32, 32, 4), (16, 16, 4)]
+    for level in levels[1:]:
+        visible = level[..., 3] > 0
+        assert (level[..., 3] < 255).any()
+        assert np.abs(level[visible][:, :3].astype(int) - (0, 0, 255)).max() <= 1
+        assert (level[~visible][:, :3] == 0).all()
+
+def test_opaque_levels_match_pyrdown():
+    rng = np.random.default_rng(0)
+    img = rng.integers(0, 256, (40, 60, 3), dtype=np.uint8)
+    np.testing.assert_array_equal(build_levels(img, 2)[1], cv2.pyrDown(img))
@@ -0,0 +1,156 @@
+import multiprocessing
+import shutil
+import time
+from pathlib import Path
+
+import cv2
+import pytest
+
+import cluster
+import geometry_index
+
+SOURCE = Path(__file__).resolve().parent.parent / 'car_frames_nobg'
+
+@pytest.fixture
+def queue(tmp_path):
+    """A queue with one spin set of two frames; the frames are never read"""
+    spin_set = tmp_path / 'car'
+    spin_set.mkdir()
+    for frame in ('frame_001.png', 'frame_002.png'):
+        (spin_set / frame).write_bytes(b'')
+    cluster.submit(tmp_path)
+    conn = cluster.open_queue(tmp_path / cluster.QUEUE_FILE)
+    yield tmp_path, conn
+    conn.close()
+
+def states(conn):
+    return dict(((stage, frame), state) for stage, frame, state in
+                conn.execute("SELECT stage, frame, state FROM tasks"))
+
+def finish(conn, root, task, node):
+    """Complete a task as its node would, with a stand-in analysis"""
+    _, spin_set, stage, frame = task
+    result = geometry_index.make_entry(root / spin_set / frame, '', {}) if stage == 'analyze' else {}
+    return cluster.complete_task(conn, task, node, result, None)
+
+def expire(conn, task, attempts):
+    conn.execute("UPDATE tasks SET lease_expires = 0, attempts = ? WHERE id = ?", (attempts, task[0]))
+
+def test_expired_lease_is_retried(queue):
+    root, conn = queue
+    task = cluster.lease_task(conn, 'a')
+    expire(conn, task, 1)
+    assert cluster.lease_task(conn, 'b') == task
+    assert not finish(conn, root, task, 'a')
+    assert finish(conn, root, task, 'b')
+
+def test_last_expired_analyze_fails_and_unlocks_prepare(queue):
+    root, conn = queue
+    first = cluster.lease_task(conn, 'a')
+    second = cluster.lease_task(conn, 'b')
+    assert finish(conn, root, second, 'b')
+    expire(conn, first, cluster.MAX_ATTEMPTS)
+
+    task = cluster.lease_task(conn, 'c')
+    assert task[2] == 'prepare'
+    assert states(conn)[('analyze', first[3])] == 'failed'
+
+def test_failed_analyze_unlocks_prepare(queue):
+    root, conn = queue
+    first = cluster.lease_task(conn, 'a')
+    second = cluster.lease_task(conn, 'a')
+    assert finish(conn, root, first, 'a')
+    conn.execute("UPDATE tasks SET attempts = ? WHERE id = ?", (cluster.MAX_ATTEMPTS, second[0]))
+    assert cluster.complete_task(conn, second, 'a', None, 'boom')
+    assert states(conn)[('prepare', '')] == 'ready'
+
+def test_prepare_retry_holds_back_renders(queue):
+    root, conn = queue
+    for _ in range(2):
+        task = cluster.lease_task(conn, 'a')
+        finish(conn, root, task, 'a')
+    prepare = cluster.lease_task(conn, 'a')
+    assert cluster.complete_task(conn, prepare, 'a', None, 'boom')
+    assert not any(stage == 'render' for stage, _ in states(conn))
+
+def test_submit_retries_failed_frames(queue):
+    root, conn = queue
+    first = cluster.lease_task(conn, 'a')
+    second = cluster.lease_task(conn, 'a')
+    assert finish(conn, root, first, 'a')
+    expire(conn, second, cluster.MAX_ATTEMPTS)
+    assert cluster.lease_task(conn, 'a')[2] == 'prepare'
+
+    assert cluster.submit(root) == 1
+    assert states(conn) == {('analyze', first[3]): 'done', ('analyze', second[3]): 'ready'}
+
+def node_process(root, node, log, stall=None):
+    """A node that appends each task it completes to log; with stall set, hangs in its first render"""
+    complete_task = cluster.complete_task
+
+    def logged(conn, task, node, result, error):
+        completed = complete_task(conn, task, node, result, error)
+        if completed:
+            with open(log, 'a') as f:
+                f.write(f"{task[0]} {node}\n")
+        return completed
+
+    def hang(*args):
+        stall.set()
+        time.sleep(60)
+
+    cluster.complete_task = logged
+    if stall is not None:
+        cluster.render_frame = hang
+    cluster.run_node(root, node=node, on_event=lambda message: None)
+
+def test_nodes_share_the_queue(tmp_path, monkeypatch):
+    # Forked nodes inherit the short lease
+    monkeypatch.setattr(cluster, 'LEASE_SECONDS', 1.0)
+    monkeypatch.setattr(cluster, 'HEARTBEAT_SECONDS', 0.2)
+    monkeypatch.setattr(cluster, 'POLL_SECONDS', 0.1)
+    frames = [f"frame_{i:03d}.png" for i in range(1, 5)]
+    for root in (tmp_path / 'nodes', tmp_path / 'single'):
+        (root / 'car').mkdir(parents=True)
+        for frame in frames:
+            shutil.copy(SOURCE / frame, root / 'car' / frame)
+        cluster.submit(root, ['final'], 'png')
+    root, log = tmp_path / 'nodes', tmp_path / 'completed.log'
+    context = multiprocessing.get_context('fork')
+
+    # The first node is killed in its first render, with the lease still held
+    stall = context.Event()
+    victim = context.Process(target=node_process, args=(root, 'victim', log, stall))
+    victim.start()
+    assert stall.wait(60)
+    victim.kill()
+    victim.join()
+
+    nodes = [context.Process(target=node_process, args=(root, f"node{i}", log)) for i in (1, 2)]
+    for node in nodes:
+        node.start()
+    for node in nodes:
+        node.join(120)
+        assert node.exitcode == 0
+
+    conn = cluster.open_queue(root / cluster.QUEUE_FILE)
+    tasks = conn.execute("SELECT id, stage, state, owner, attempts FROM tasks").fetchall()
+    conn.close()
+    assert len(tasks) == 2 * len(frames) + 1
+    assert {state for _, _, state, _, _ in tasks} == {'done'}
+    completions = [line.split() for line in log.read_text().splitlines()]
+    assert sorted(int(task_id) for task_id, _ in completions) == sorted(task_id for task_id, *_ in tasks)
+
+    # The killed render went to another node on the second lease
+    [(_, _, _, owner, attempts)] = [task for task in tasks if task[4] > 1]
+    assert owner in ('node1', 'node2') and attempts == 2
+    renders = {task_id for task_id, stage, *_ in tasks if stage == 'render'}
+    assert not any(int(task_id) in renders for task_id, node in completions if node == 'victim')
+
+    cluster.run_node(tmp_path / 'single', node='single', on_event=lambda message: None)
+    output = cluster.VARIANTS['final']['output']
+    for frame in frames:
+        data = (root / 'car' / output / frame).read_bytes()
+        assert cv2.imread(str(root / 'car' / output / frame), cv2.IMREAD_UNCHANGED) is not None
+        assert data == (tmp_path / 'single' / 'car' / output / frame).read_bytes()
+    assert [path.name for path in (root / 'car' / output).iterdir() if path.name.endswith('.tmp')] == []
@@ -0,0 +1,54 @@
+import os
+
+import cv2
+import numpy as np
+import pytest
+
+import frame_store
+
+def write_frames(folder):
+    """Frames of mixed size, channels and format, as cv2.imread reads them back"""
+    rng = np.random.default_rng(0)
+    frames = {
+        'frame_001.png': rng.integers(0, 256, (40, 60, 4), dtype=np.uint8),
+        'frame_002.png': rng.integers(0, 256, (52, 30, 3), dtype=np.uint8),
+        'frame_003.jpg': rng.integers(0, 256, (33, 71, 3), dtype=np.uint8),
+    }
+    for name, img in frames.items():
+        cv2.imwrite(str(folder / name), img)
+    return {name: cv2.imread(str(folder / name), cv2.IMREAD_UNCHANGED) for name in frames}
+
+def assert_stored(store, frames):
+    assert [entry['name'] for entry in store.entries] == sorted(frames)
+    for name, img in frames.items():
+        np.testing.assert_array_equal(store.frame(name), img)
+
+def test_frame_size_reads_headers(tmp_path):
+    for name, img in write_frames(tmp_path).items():
+        assert frame_store.frame_size(tmp_path / name) == img.shape[:2]
+    (tmp_path / 'frame_004.png').write_bytes(b'not an image')
+    assert frame_store.frame_size(tmp_path / 'frame_004.png') is None
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_ingest_stores_every_frame(tmp_path, workers):
+    frames = write_frames(tmp_path)
+    assert_stored(frame_store.ingest(tmp_path, workers), frames)
+    assert [path.name for path in tmp_path.iterdir() if path.name.endswith('.tmp')] == []
+
+def test_unreadable_frames_are_left_out(tmp_path):
+    frames = write_frames(tmp_path)
+    # A valid header over a truncated body: laid out, then fails to decode
+    data = (tmp_path / 'frame_002.png').read_bytes()
+    (tmp_path / 'frame_002.png').write_bytes(data[:40])
+    del frames['frame_002.png']
+    store = frame_store.ingest(tmp_path, 1)
+    assert_stored(store, frames)
+    assert os.path.getsize(store.path) == store.data.offset + store.data.nbytes
+
+def test_reingest_keeps_current_frames(tmp_path):
+    frames = write_frames(tmp_path)
+    frame_store.ingest(tmp_path, 1)
+    img = np.full((20, 20, 4), 7, dtype=np.uint8)
+    cv2.imwrite(str(tmp_path / 'frame_001.png'), img)
+    frames['frame_001.png'] = img
+    assert_stored(frame_store.ingest(tmp_path, 1), frames)
@@ -0,0 +1,23 @@
+from pathlib import Path
+
+import geometry_index
+import pipeline
+from streaming import map_stream
+
+FRAME = Path(__file__).resolve().parent.parent / 'car_frames_nobg' / 'frame_001.png'
+
+def test_stream_writes_where_render_frame_does(tmp_path):
+    analysis = pipeline.frame_analysis(geometry_index.as_geometry(geometry_index.measure_frame(FRAME)))
+    variant_params = {'final': None, 'perfect': None}
+    for name in variant_params:
+        (tmp_path / 'pool' / pipeline.VARIANTS[name]['output']).mkdir(parents=True)
+        (tmp_path / 'stream' / pipeline.VARIANTS[name]['output']).mkdir(parents=True)
+
+    pipeline.render_frame(FRAME, None, analysis, variant_params, 'png', tmp_path / 'pool')
+    [(skipped, error)] = map_stream(pipeline.RENDER_STAGES,
+                                    [(FRAME, None, analysis, variant_params, 'png', tmp_path / 'stream')])
+
+    assert error is None and skipped == []
+    for name in variant_params:
+        output = Path(pipeline.VARIANTS[name]['output']) / FRAME.name
+        assert (tmp_path / 'stream' / output).read_bytes() == (tmp_path / 'pool' / output).read_bytes()
@@ -0,0 +1,33 @@
+import cv2
+import numpy as np
+import pytest
+
+import register_frames
+
+def car(size, center, axes):
+    """BGRA frame of a size (w, h) with an opaque ellipse as the car"""
+    img = np.zeros((size[1], size[0], 4), dtype=np.uint8)
+    cv2.ellipse(img, center, axes, 0, 0, 360, (40, 80, 160, 255), -1, cv2.LINE_AA)
+    return img
+
+@pytest.mark.parametrize('cur_size', [(640, 400), (160, 100), (128, 80)])
+def test_registers_frames_of_different_sizes(cur_size):
+    ref = car((640, 400), (300, 210), (180, 90))
+    # The same car in a smaller frame; for 128x80 the frame is below the working size
+    f = cur_size[0] / 640
+    cur = car(cur_size, (round(300 * f), round(210 * f)), (round(180 * f), round(90 * f)))
+
+    M = register_frames.register_pair(ref, cur)
+    assert M[0, 0] == pytest.approx(1 / f, rel=0.03)
+    # The center lands within a pixel or two, the tip 180px out within the scale tolerance
+    for x, y, tolerance in [(300, 210, 1.5), (120, 210, 0.03 * 180)]:
+        assert (M @ [x * f, y * f, 1])[:2] == pytest.approx([x, y], abs=tolerance)
+
+def test_pyramids_have_the_levels_of_the_smaller_frame():
+    ref_factor, ref = register_frames.working_silhouette(car((640, 400), (300, 210), (180, 90)))
+    cur_factor, cur = register_frames.working_silhouette(car((96, 60), (45, 32), (27, 14)))
+    count = min(register_frames.level_count(ref.shape), register_frames.level_count(cur.shape))
+    assert count == 2
+    levels = register_frames.registration_pyramid(ref, count)
+    assert [level.shape for level in levels] == [(80, 128), ref.shape]
+    assert ref.shape == (160, 256)
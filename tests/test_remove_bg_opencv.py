@@ -0,0 +1,61 @@
+import cv2
+import numpy as np
+import pytest
+
+from remove_bg_opencv import remove_background_batch
+
+FRAMES = 9
+SIZE = 12  # Side of the moving square, which covers each pixel in at most one frame
+
+def square(i):
+    return slice(20, 20 + SIZE), slice(6 + 13 * i, 6 + 13 * i + SIZE)
+
+@pytest.fixture
+def frame_set(tmp_path):
+    """A textured static background with a red square moving across it"""
+    rng = np.random.default_rng(0)
+    plate = rng.integers(100, 140, (50, 130, 3), dtype=np.uint8)
+    (tmp_path / 'frames').mkdir()
+    (tmp_path / 'out').mkdir()
+    frame_files = []
+    for i in range(FRAMES):
+        frame = plate.copy()
+        frame[square(i)] = (0, 0, 255)
+        frame_files.append(tmp_path / 'frames' / f"frame_{i + 1:03d}.png")
+        cv2.imwrite(str(frame_files[-1]), frame)
+    cv2.imwrite(str(tmp_path / 'plate.png'), plate)
+    return frame_files, tmp_path
+
+def expected_mask(i):
+    mask = np.zeros((50, 130), dtype=np.uint8)
+    mask[square(i)] = 255
+    return mask
+
+@pytest.mark.parametrize('use_plate', [False, True])
+def test_masks_cover_the_moving_object(frame_set, use_plate):
+    frame_files, root = frame_set
+    plate = root / 'plate.png' if use_plate else None
+    assert remove_background_batch(frame_files, root / 'out', plate) == FRAMES
+
+    kernel = np.ones((3, 3), dtype=np.uint8)
+    for i, frame_path in enumerate(frame_files):
+        rgba = cv2.imread(str(root / 'out' / frame_path.name), cv2.IMREAD_UNCHANGED)
+        np.testing.assert_array_equal(rgba[..., :3], cv2.imread(str(frame_path)))
+        mask, expected = rgba[..., 3], expected_mask(i)
+        # The morphology only rounds the corners of the square
+        assert (mask[cv2.erode(expected, kernel) > 0] == 255).all()
+        assert (mask[cv2.dilate(expected, kernel) == 0] == 0).all()
+
+def test_clean_plate_is_checked(frame_set):
+    frame_files, root = frame_set
+    with pytest.raises(ValueError, match='missing.png'):
+        remove_background_batch(frame_files, root / 'out', root / 'missing.png')
+    cv2.imwrite(str(root / 'small.png'), np.zeros((10, 10, 3), dtype=np.uint8))
+    with pytest.raises(ValueError, match='small.png'):
+        remove_background_batch(frame_files, root / 'out', root / 'small.png')
+
+def test_frames_of_another_size_are_rejected(frame_set):
+    frame_files, root = frame_set
+    cv2.imwrite(str(frame_files[3]), np.zeros((10, 10, 3), dtype=np.uint8))
+    with pytest.raises(ValueError, match=frame_files[3].name):
+        remove_background_batch(frame_files, root / 'out')
@@ -0,0 +1,147 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import removebg_client
+from removebg_client import RemoveBgClient, RemoveBgError, TokenBucket
+
+DROP = 'drop'  # Reply that closes the connection without an answer
+
+class Handler(BaseHTTPRequestHandler):
+    """Answers posts from the server's script of (status, body, headers) replies and records them"""
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        self.server.posts.append((self.headers['X-Api-Key'], body))
+        reply = self.server.replies.pop(0)
+        if reply == DROP:
+            self.close_connection = True
+            return
+        status, content, headers = reply
+        if isinstance(content, str):
+            content = json.dumps({'errors': [{'title': content}]}).encode()
+        self.send_response(status)
+        for name, value in {**self.server.rate_limit, **headers}.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass
+
+@pytest.fixture
+def server():
+    """A local stand-in for the remove.bg endpoint"""
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    httpd.replies, httpd.posts = [], []
+    httpd.rate_limit = {'X-RateLimit-Limit': '600', 'X-RateLimit-Remaining': '500',
+                        'X-RateLimit-Reset': str(int(time.time()) + 60)}
+    thread = threading.Thread(target=httpd.serve_forever, args=(0.05,), daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    delays = []
+    monkeypatch.setattr(removebg_client.time, 'sleep', delays.append)
+    monkeypatch.setattr(removebg_client.random, 'uniform', lambda low, high: 1.0)
+    return delays
+
+def client(tmp_path, server, replies, **kwargs):
+    server.replies.extend(replies)
+    return RemoveBgClient('key', f"http://127.0.0.1:{server.server_port}/removebg",
+                          cache_dir=tmp_path / 'cache', **kwargs)
+
+def frame(tmp_path, name='frame_001.jpg', data=b'jpeg bytes'):
+    path = tmp_path / name
+    path.write_bytes(data)
+    return path
+
+def test_posts_the_image_with_the_key(tmp_path, server, sleeps):
+    api = client(tmp_path, server, [(200, b'png', {})])
+    assert api.post(b'jpeg', 'frame_001.jpg') == b'png'
+    [(key, body)] = server.posts
+    assert key == 'key'
+    assert b'filename="frame_001.jpg"' in body and b'jpeg' in body and b'auto' in body
+    # Rate-limit headers of the reply: 600 requests per minute
+    assert api.limiter.rate == 10.0
+
+def test_retries_with_exponential_backoff(tmp_path, server, sleeps):
+    api = client(tmp_path, server, [(503, b'', {}), DROP, (200, b'png', {})])
+    assert api.post(b'jpeg', 'frame_001.jpg') == b'png'
+    assert sleeps == [removebg_client.BACKOFF_SECONDS, removebg_client.BACKOFF_SECONDS * 2]
+
+def test_retry_after_overrides_backoff(tmp_path, server, sleeps):
+    api = client(tmp_path, server, [(429, 'Rate limit exceeded', {'Retry-After': '0.2'}), (200, b'png', {})])
+    assert api.post(b'jpeg', 'frame_001.jpg') == b'png'
+    assert 0.2 in sleeps
+    assert len(server.posts) == 2
+
+def test_client_errors_are_not_retried(tmp_path, server, sleeps):
+    api = client(tmp_path, server, [(400, 'Invalid image', {})])
+    with pytest.raises(RemoveBgError, match='Invalid image'):
+        api.post(b'jpeg', 'frame_001.jpg')
+    assert len(server.posts) == 1
+
+def test_gives_up_after_max_retries(tmp_path, server, sleeps):
+    api = client(tmp_path, server, [(502, b'', {})] * (removebg_client.MAX_RETRIES + 1))
+    with pytest.raises(RemoveBgError, match='gave up'):
+        api.post(b'jpeg', 'frame_001.jpg')
+    assert len(server.posts) == removebg_client.MAX_RETRIES + 1
+
+def test_responses_are_cached_per_input_and_request(tmp_path, server, sleeps):
+    path = frame(tmp_path)
+    api = client(tmp_path, server, [(200, b'png', {})])
+    assert api.remove_background(path) == (b'png', False)
+    assert api.remove_background(path) == (b'png', True)
+    assert api.cached_response(path) == b'png'
+    assert len(server.posts) == 1
+
+    other = client(tmp_path, server, [(200, b'hd png', {})], request_data={'size': 'full'})
+    assert other.cached_response(path) is None
+    assert other.remove_background(path) == (b'hd png', False)
+    assert b'full' in server.posts[-1][1]
+
+    path.write_bytes(b'new jpeg bytes')
+    assert api.cached_response(path) is None
+
+def test_batch_keeps_input_order_and_failures(tmp_path, server, sleeps):
+    paths = [frame(tmp_path, f'frame_00{i}.jpg', bytes([i])) for i in (1, 2)]
+    api = client(tmp_path, server, [(200, b'png', {}), (402, 'Insufficient credits', {})], workers=1)
+    reported = []
+    results = api.remove_backgrounds(paths, lambda i, *result: reported.append((i, result)))
+    assert results == [(b'png', False, None), (None, False, 'Insufficient credits')]
+    assert reported == [(1, results[0]), (2, results[1])]
+
+def test_bucket_follows_the_limit():
+    bucket = TokenBucket(rate=1.0, capacity=4)
+    bucket.update({'X-RateLimit-Limit': '120'})
+    assert bucket.rate == 2.0
+    bucket.update({'X-RateLimit-Limit': '0'})
+    assert bucket.rate == 1 / 60
+
+def test_bucket_spends_no_more_than_remaining():
+    bucket = TokenBucket(rate=1.0, capacity=4)
+    bucket.update({'X-RateLimit-Remaining': '1', 'X-RateLimit-Reset': str(time.time() + 30)})
+    assert bucket.tokens == 1
+    assert bucket.blocked_until == 0.0
+
+def test_bucket_waits_for_the_reset_when_exhausted():
+    bucket = TokenBucket(rate=1.0, capacity=4)
+    bucket.update({'X-RateLimit-Remaining': '0', 'X-RateLimit-Reset': str(time.time() + 30)})
+    assert bucket.tokens == 0
+    assert 29 < bucket.blocked_until - time.monotonic() <= 30
+
+def test_bucket_keeps_the_longest_retry_after():
+    bucket = TokenBucket(rate=1.0, capacity=4)
+    bucket.update({'Retry-After': '20'})
+    blocked_until = bucket.blocked_until
+    assert 19 < blocked_until - time.monotonic() <= 20
+    bucket.update({'Retry-After': '5'})
+    assert bucket.blocked_until == blocked_until
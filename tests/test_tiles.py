@@ -0,0 +1,39 @@
+import cv2
+import numpy as np
+import pytest
+
+from tiles import lanczos_taps, resize_into
+
+def strip_resize(src, dsize, budget):
+    dst = np.zeros((dsize[1], dsize[0]) + src.shape[2:], dtype=np.uint8)
+    return resize_into(dst, src, budget)
+
+@pytest.mark.parametrize('seed', range(4))
+def test_strips_match_cv2_resize(seed):
+    rng = np.random.default_rng(seed)
+    for _ in range(60):
+        sh, sw = (int(n) for n in rng.integers(1, 120, 2))
+        dh, dw = (int(n) for n in rng.integers(1, 240, 2))
+        channels = int(rng.choice([1, 3, 4]))
+        shape = (sh, sw, channels) if channels > 1 else (sh, sw)
+        src = rng.integers(0, 256, shape, dtype=np.uint8)
+        expected = cv2.resize(src, (dw, dh), interpolation=cv2.INTER_LANCZOS4)
+        budget = int(rng.integers(1, 100000))
+        np.testing.assert_array_equal(strip_resize(src, (dw, dh), budget), expected,
+                                      err_msg=f"{shape} -> {(dh, dw)}, budget {budget}")
+
+def test_upscale_with_small_budget():
+    src = np.random.default_rng(0).integers(0, 256, (63, 133, 3), dtype=np.uint8)
+    expected = cv2.resize(src, (530, 268), interpolation=cv2.INTER_LANCZOS4)
+    np.testing.assert_array_equal(strip_resize(src, (530, 268), 50000), expected)
+
+def test_tap_on_sample_takes_all_weight():
+    # (93 + 0.5) / 187 - 0.5 rounds to just below zero, so the fraction rounds up to 1.0
+    index, weights = lanczos_taps(1, 187)
+    assert weights[93].tolist() == [0, 0, 0, 0, 2048, 0, 0, 0]
+
+def test_untiled_when_under_budget():
+    src = np.random.default_rng(1).integers(0, 256, (40, 50, 4), dtype=np.uint8)
+    expected = cv2.resize(src, (30, 20), interpolation=cv2.INTER_LANCZOS4)
+    np.testing.assert_array_equal(strip_resize(src, (30, 20), 0), expected)
+    np.testing.assert_array_equal(strip_resize(src, (30, 20), 10**9), expected)
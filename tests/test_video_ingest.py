@@ -0,0 +1,62 @@
+import cv2
+import numpy as np
+import pytest
+
+from video_ingest import ingest_video, read_frames, sample_indices
+
+FRAMES = 50
+LEVEL = 5  # Gray level step between frames, so a decoded frame tells its index
+
+@pytest.fixture(scope='module')
+def video(tmp_path_factory):
+    path = tmp_path_factory.mktemp('video') / 'spin.avi'
+    writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*'MJPG'), 10, (32, 16))
+    if not writer.isOpened():
+        pytest.skip("OpenCV cannot write MJPG video here")
+    for i in range(FRAMES):
+        writer.write(np.full((16, 32, 3), i * LEVEL, dtype=np.uint8))
+    writer.release()
+    return path
+
+def test_samples_cover_one_revolution():
+    assert sample_indices(0, 10, 5) == [0, 2, 4, 6, 8]
+    assert sample_indices(10, 20, 4) == [10, 12, 15, 17]
+    assert sample_indices(3, 80, 77) == list(range(3, 80))
+
+@pytest.mark.parametrize('first, end, count', [(0, 1000, 77), (12, 631, 77), (0, 144, 144), (5, 9, 2)])
+def test_samples_are_evenly_spaced_and_distinct(first, end, count):
+    indices = sample_indices(first, end, count)
+    assert len(indices) == count
+    assert indices[0] == first and indices[-1] < end
+    steps = np.diff(indices)
+    assert steps.min() >= 1
+    assert steps.max() - steps.min() <= 1
+
+def test_too_few_frames_for_count():
+    with pytest.raises(ValueError):
+        sample_indices(0, 76, 77)
+
+@pytest.mark.parametrize('seek_gap', [0, 4, FRAMES])
+def test_read_frames_returns_the_sampled_frames(video, seek_gap):
+    indices = [0, 1, 7, 8, 30, 49]
+    frames = list(read_frames(video, indices, seek_gap))
+    assert [index for index, _ in frames] == indices
+    assert [round(frame.mean() / LEVEL) for _, frame in frames] == indices
+
+def test_read_frames_past_the_end(video):
+    with pytest.raises(ValueError):
+        list(read_frames(video, [FRAMES + 5], seek_gap=FRAMES * 2))
+
+def test_ingest_replaces_old_frames_only_with_force(video, tmp_path):
+    output = tmp_path / 'frames'
+    output.mkdir()
+    for i in range(1, 11):
+        (output / f"frame_{i:03d}.png").write_bytes(b'old shoot')
+
+    with pytest.raises(ValueError, match='--force'):
+        ingest_video(video, output, count=5)
+    assert len(list(output.glob('frame_*'))) == 10
+
+    record = ingest_video(video, output, count=5, codec='png', force=True)
+    assert sorted(path.name for path in output.glob('frame_*')) == [f"frame_{i:03d}.png" for i in range(1, 6)]
+    assert [frame['index'] for frame in record['frames'].values()] == [0, 10, 20, 30, 40]
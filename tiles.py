@@ -0,0 +1,116 @@
+import math
+import os
+from functools import lru_cache
+
+import cv2
+import numpy as np
+
+from frame_store import release_rows
+
+# Configuration
+# Working memory cap for one resize, in MB per worker (FRAME_TILE_MEMORY
+# overrides). A crop whose resize would need more is resized in strips;
+# 0 always resizes the whole crop in one cv2.resize call.
+TILE_MEMORY = int(float(os.environ.get('FRAME_TILE_MEMORY', 0)) * 2**20)
+
+# OpenCV's INTER_LANCZOS4 for 8-bit images: 8 taps per axis, float
+# coefficients rounded to 11-bit fixed point, integer accumulation and a
+# rounding shift by 22 bits at the end. Reproducing those steps exactly is
+# what makes a strip identical to the same rows of a whole-crop resize.
+TAPS = 8
+COEF_BITS = 11
+S45 = 0.70710678118654752440084436210485
+PHASES = [(1, 0), (-S45, -S45), (0, 1), (S45, -S45), (-1, 0), (S45, S45), (0, -1), (-S45, S45)]
+
+def lanczos_weights(x):
+    """Normalized Lanczos-4 weights for fractional offset x, with OpenCV's float32 rounding steps"""
+    x = np.float32(x)
+    weights = np.zeros(TAPS, dtype=np.float32)
+    if x < np.finfo(np.float32).eps:
+        weights[3] = 1
+        return weights
+    shifted = x + np.float32(3)
+    y0 = -float(shifted) * math.pi * 0.25
+    s0, c0 = math.sin(y0), math.cos(y0)
+    total = np.float32(0)
+    for i, (a, b) in enumerate(PHASES):
+        offset = shifted - np.float32(i)
+        if abs(offset) >= np.float32(1e-6):
+            y = -float(offset) * math.pi * 0.25
+            weights[i] = np.float32((a * s0 + b * c0) / (y * y))
+        else:
+            # x rounded up to 1.0 and the tap sits on a sample, which takes all the weight
+            weights[i] = np.float32(1e30)
+        total = np.float32(total + weights[i])
+    return weights * (np.float32(1) / total)
+
+@lru_cache(maxsize=16)
+def lanczos_taps(src_size, dst_size):
+    """(source index, fixed-point weight) arrays of shape (dst_size, 8) for one axis"""
+    scale = 1.0 / (dst_size / src_size)
+    starts = np.zeros(dst_size, dtype=np.int64)
+    weights = np.zeros((dst_size, TAPS), dtype=np.int32)
+    for d in range(dst_size):
+        f = np.float32((d + 0.5) * scale - 0.5)
+        start = math.floor(f)
+        starts[d] = start
+        weights[d] = np.rint(lanczos_weights(f - np.float32(start)) * np.float32(1 << COEF_BITS))
+    # Taps past the edges repeat the edge pixel
+    index = np.clip(starts[:, None] + np.arange(-3, TAPS - 3)[None, :], 0, src_size - 1)
+    return index, weights
+
+def strip_height(src_shape, dsize, budget):
+    """Output rows per strip that keep one strip's buffers within budget bytes"""
+    src_h, src_w = src_shape[:2]
+    channels = src_shape[2] if len(src_shape) == 3 else 1
+    dst_w, dst_h = dsize
+    # A source row is read once and expanded to int32 at output width (plus
+    # temporaries); an output row holds int32 sums until the final shift
+    per_src_row = channels * (2 * src_w + 9 * dst_w)
+    per_dst_row = 13 * channels * dst_w + min(TAPS, src_h / dst_h) * per_src_row
+    rows = int((budget - TAPS * per_src_row) // per_dst_row)
+    return max(1, min(dst_h, rows))
+
+def resize_strip(src, x_taps, y_taps):
+    """Output rows for y_taps (a slice of lanczos_taps) reading only the source rows they need"""
+    x_index, x_weights = x_taps
+    y_index, y_weights = y_taps
+    rows = np.unique(y_index)
+    block = np.asarray(src[rows], dtype=np.uint8)
+
+    horizontal = np.zeros((len(rows), x_index.shape[0], block.shape[2]), dtype=np.int32)
+    for k in range(TAPS):
+        horizontal += block[:, x_index[:, k]] * x_weights[None, :, k, None]
+    release_rows(src, rows[0], rows[-1] + 1)
+
+    position = np.searchsorted(rows, y_index)
+    out = np.zeros((y_index.shape[0],) + horizontal.shape[1:], dtype=np.int32)
+    for k in range(TAPS):
+        out += horizontal[position[:, k]] * y_weights[:, k, None, None]
+    out += 1 << (2 * COEF_BITS - 1)
+    out >>= 2 * COEF_BITS
+    return np.clip(out, 0, 255).astype(np.uint8)
+
+def resize_into(dst, src, budget=TILE_MEMORY):
+    """Write cv2.resize(src, dst size, interpolation=cv2.INTER_LANCZOS4) into dst (e.g. a canvas slice).
+
+    When the crop and its resized copy together exceed budget bytes, the
+    output is built in horizontal strips instead, each from the few
+    source rows its taps reach, and stored source pages are released
+    after every strip. The pixels are the same either way.
+    """
+    dst_h, dst_w = dst.shape[:2]
+    if budget <= 0 or src.nbytes + dst.nbytes <= budget:
+        dst[...] = cv2.resize(src, (dst_w, dst_h), interpolation=cv2.INTER_LANCZOS4)
+        return dst
+
+    out = dst
+    if src.ndim == 2:
+        src, dst = src[:, :, None], dst[:, :, None]
+    x_taps = lanczos_taps(src.shape[1], dst_w)
+    y_index, y_weights = lanczos_taps(src.shape[0], dst_h)
+    rows = strip_height(src.shape, (dst_w, dst_h), budget)
+    for top in range(0, dst_h, rows):
+        bottom = min(dst_h, top + rows)
+        dst[top:bottom] = resize_strip(src, x_taps, (y_index[top:bottom], y_weights[top:bottom]))
+    return out
@@ -0,0 +1,178 @@
+import atexit
+import json
+import os
+import threading
+import time
+from contextlib import nullcontext
+from functools import wraps
+from multiprocessing import parent_process
+from pathlib import Path
+
+import numpy as np
+
+# Configuration
+# Chrome trace file to write; setting FRAME_TRACE turns tracing on for any
+# script (off by default, spans are then free no-ops)
+TRACE_FILE = os.environ.get('FRAME_TRACE')
+
+# Spans recorded by this process: (name, category, start ns, duration ns, thread id, args)
+_events = []
+_state = {'file': None}
+_NO_SPAN = nullcontext()
+
+# A forked worker starts with a copy of the parent's spans; they are not its own
+os.register_at_fork(after_in_child=_events.clear)
+
+class Span:
+    """Times a block and records it when the block exits"""
+
+    __slots__ = ('name', 'category', 'args', 'start')
+
+    def __init__(self, name, category, args):
+        self.name = name
+        self.category = category
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        # perf_counter is a system-wide monotonic clock, so worker spans line up
+        _events.append((self.name, self.category, self.start, time.perf_counter_ns() - self.start,
+                        threading.get_native_id(), self.args))
+        return False
+
+def is_enabled():
+    return _state['file'] is not None
+
+def enable(trace_file):
+    """Record spans from now on and write them to trace_file when the main process exits"""
+    if is_enabled():
+        return
+    _state['file'] = str(trace_file)
+    # Worker processes started later inherit the setting
+    os.environ['FRAME_TRACE'] = _state['file']
+    if parent_process() is None:
+        for part in part_files():
+            part.unlink()  # Left over from an interrupted run
+        atexit.register(finish)
+
+def span(name, category='stage', **args):
+    """Context manager timing one block as a span; a shared no-op when tracing is off"""
+    if _state['file'] is None:
+        return _NO_SPAN
+    return Span(name, category, args)
+
+def traced(name, category='stage'):
+    """Decorator recording every call of a function as a span"""
+    def decorate(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if _state['file'] is None:
+                return func(*args, **kwargs)
+            with Span(name, category, {}):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+def chrome_event(event, pid):
+    """A recorded span as a Chrome trace complete ("X") event, in microseconds"""
+    name, category, start, duration, tid, args = event
+    return {'name': name, 'cat': category, 'ph': 'X', 'ts': start / 1000, 'dur': duration / 1000,
+            'pid': pid, 'tid': tid, 'args': args}
+
+def part_files():
+    """Span files written by worker processes for the current trace"""
+    path = Path(_state['file'])
+    return sorted(path.parent.glob(f"{path.name}.*.part"))
+
+def flush():
+    """Hand this worker process's spans to the main process through a part file.
+
+    Worker processes exit without running atexit handlers, so parallel.py
+    calls this after every frame. The main process keeps its own spans in
+    memory until finish().
+    """
+    if _state['file'] is None or not _events or parent_process() is None:
+        return
+    pid = os.getpid()
+    events, _events[:] = _events[:], []
+    with open(f"{_state['file']}.{pid}.part", 'a') as f:
+        for event in events:
+            f.write(json.dumps(chrome_event(event, pid)) + '\n')
+
+def self_times(events):
+    """Duration of every event minus the events nested directly inside it (same thread)"""
+    exclusive = [event['dur'] for event in events]
+    threads = {}
+    for i, event in enumerate(events):
+        threads.setdefault((event['pid'], event['tid']), []).append(i)
+
+    for indices in threads.values():
+        indices.sort(key=lambda i: (events[i]['ts'], -events[i]['dur']))
+        stack = []
+        for i in indices:
+            while stack and events[stack[-1]]['ts'] + events[stack[-1]]['dur'] <= events[i]['ts']:
+                stack.pop()
+            if stack:
+                exclusive[stack[-1]] -= events[i]['dur']
+            stack.append(i)
+    return exclusive
+
+def summarize(events):
+    """Rows of (name, count, self ms, mean ms, p95 ms) by self time, largest first"""
+    exclusive = self_times(events)
+    by_name = {}
+    for event, own in zip(events, exclusive):
+        durations, total = by_name.setdefault(event['name'], ([], [0.0]))
+        durations.append(event['dur'])
+        total[0] += own
+
+    rows = []
+    for name, (durations, total) in by_name.items():
+        ms = np.array(durations) / 1000
+        rows.append((name, len(ms), total[0] / 1000, float(ms.mean()), float(np.percentile(ms, 95))))
+    return sorted(rows, key=lambda row: -row[2])
+
+def finish():
+    """Merge every process's spans into the Chrome trace file and print a summary"""
+    if _state['file'] is None:
+        return
+    pid = os.getpid()
+    events = [chrome_event(event, pid) for event in _events]
+    _events.clear()
+    for part in part_files():
+        events.extend(json.loads(line) for line in part.read_text().splitlines() if line)
+        part.unlink()
+
+    if not events:
+        print(f"\nTrace: no spans recorded, {_state['file']} not written")
+        return
+
+    # Timestamps relative to the first span; name processes for the trace viewer
+    origin = min(event['ts'] for event in events)
+    for event in events:
+        event['ts'] -= origin
+    pids = sorted({event['pid'] for event in events})
+    metadata = [{'name': 'process_name', 'ph': 'M', 'pid': p,
+                 'args': {'name': 'main' if p == pid else f"worker {p}"}} for p in pids]
+
+    Path(_state['file']).write_text(json.dumps({'traceEvents': metadata + events, 'displayTimeUnit': 'ms'}))
+
+    threads = {(event['pid'], event['tid']) for event in events}
+    wall = max(event['ts'] + event['dur'] for event in events) / 1e6
+    rows = summarize(events)
+    total = sum(row[2] for row in rows) or 1
+
+    print(f"\nTrace: {_state['file']} ({len(events)} spans, {len(pids)} processes, "
+          f"{len(threads)} threads, {wall:.2f} s)")
+    print("=" * 78)
+    print(f"{'span':<32}{'count':>7}{'self ms':>11}{'mean ms':>10}{'p95 ms':>10}{'share':>8}")
+    for name, count, self_ms, mean_ms, p95_ms in rows:
+        print(f"{name:<32}{count:>7}{self_ms:>11.1f}{mean_ms:>10.2f}{p95_ms:>10.2f}{self_ms / total:>8.0%}")
+    print("=" * 78)
+    print("Open the trace in chrome://tracing or https://ui.perfetto.dev")
+
+if TRACE_FILE:
+    enable(TRACE_FILE)
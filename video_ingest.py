@@ -0,0 +1,176 @@
+import argparse
+import json
+import cv2
+from pathlib import Path
+
+from encoders import CODECS, FRAME_CODEC, codec_extension, encode_frame, write_atomic
+from remove_bg_opencv import remove_background
+from streaming import QUEUE_SIZE, map_stream
+
+# Configuration
+OUTPUT_FOLDER = 'car_frames_nobg'
+DEFAULT_FRAMES = 77  # totalFrames in script.js
+SEEK_GAP = 24  # Seek rather than step through when the next sample is further ahead than this
+INGEST_FILE = 'video_ingest.json'  # Source frame, time and angle of every output frame
+
+def video_info(capture):
+    """(frame count, fps) of an open capture; the count is 0 when the container does not say"""
+    return max(0, int(capture.get(cv2.CAP_PROP_FRAME_COUNT))), capture.get(cv2.CAP_PROP_FPS) or 0.0
+
+def sample_indices(first, end, count):
+    """count frame indices evenly spaced over [first, end).
+
+    The range is one revolution, so the last sample stops a step short of
+    end instead of repeating the first angle.
+    """
+    if count > end - first:
+        raise ValueError(f"Cannot take {count} frames from a {end - first}-frame range")
+    step = (end - first) / count
+    return [first + int(i * step) for i in range(count)]
+
+def read_frames(video_path, indices, seek_gap=SEEK_GAP):
+    """Yield (index, BGR frame) for ascending frame indices, decoding as little as possible.
+
+    Nearby frames are passed over with grab(), which skips the conversion
+    to BGR. A sample further than seek_gap ahead is reached by seeking,
+    which skips decoding everything before the preceding keyframe.
+    """
+    capture = cv2.VideoCapture(str(video_path))
+    if not capture.isOpened():
+        raise ValueError(f"Cannot open video: {video_path}")
+
+    try:
+        position = 0  # Index of the frame the next grab() returns
+        for index in indices:
+            if index - position > seek_gap:
+                capture.set(cv2.CAP_PROP_POS_FRAMES, index)
+                position = index
+            while position < index:
+                if not capture.grab():
+                    raise ValueError(f"Video ended before frame {index}")
+                position += 1
+
+            ok, frame = capture.read()
+            if not ok:
+                raise ValueError(f"Could not decode frame {index}")
+            position += 1
+            yield index, frame
+    finally:
+        capture.release()
+
+# Stream stages (see streaming.py): each gets the tuple the previous one returned
+
+def cut_out(frame_name, frame, codec):
+    """Frame with its background made transparent"""
+    return frame_name, remove_background(frame), codec
+
+def encode(frame_name, img, codec):
+    return frame_name, encode_frame(img, codec), codec
+
+def write(frame_name, data, codec, output_folder):
+    path = output_folder / (frame_name + codec_extension(codec))
+    write_atomic(path, data)
+    return path.name
+
+def ingest_video(video_path, output_folder, count=DEFAULT_FRAMES, start=0.0, end=None,
+                 codec=FRAME_CODEC, on_result=None, force=False):
+    """Sample count frames from a turntable video and write them with the background removed.
+
+    The clip from start to end seconds (default: the whole video) is taken
+    to be one full revolution. Decoded frames go straight from the video to
+    background removal and the encoder on a thread per stage; no
+    intermediate image is written. Returns the ingest record that is also
+    saved as INGEST_FILE.
+
+    A folder that already holds frames, such as remove.bg cutouts, is only
+    written with force, and its frames are then deleted first so that a
+    smaller count does not leave frames of another shoot behind.
+    """
+    output_folder = Path(output_folder)
+    output_folder.mkdir(exist_ok=True)
+    existing = sorted(output_folder.glob('frame_*.*'))
+    if existing and not force:
+        raise ValueError(f"{output_folder} already holds {len(existing)} frames; "
+                         f"use --force to replace them")
+
+    capture = cv2.VideoCapture(str(video_path))
+    if not capture.isOpened():
+        raise ValueError(f"Cannot open video: {video_path}")
+    total, fps = video_info(capture)
+    capture.release()
+    if not total or not fps:
+        raise ValueError(f"Video does not report its frame count and rate: {video_path}")
+
+    first = min(total - 1, int(round(start * fps)))
+    last = total if end is None else min(total, int(round(end * fps)))
+    indices = sample_indices(first, last, count)
+
+    for stale in existing:
+        stale.unlink()
+
+    def frames():
+        for number, (index, frame) in enumerate(read_frames(video_path, indices), 1):
+            yield f"frame_{number:03d}", frame, codec
+
+    # A closure rather than functools.partial: stages are traced under
+    # their function's name
+    def write_frame(frame_name, data, codec):
+        return write(frame_name, data, codec, output_folder)
+
+    results = map_stream([cut_out, encode, write_frame], frames(), on_result)
+
+    record = {
+        'video': str(video_path),
+        'fps': fps,
+        'video_frames': total,
+        'revolution': [first, last],
+        'frames': {
+            name: {'index': index, 'time': index / fps, 'angle': 360 * (index - first) / (last - first)}
+            for (name, error), index in zip(results, indices) if error is None
+        },
+    }
+    (output_folder / INGEST_FILE).write_text(json.dumps(record, indent=1))
+    return record
+
+def main():
+    parser = argparse.ArgumentParser(description="Sample a turntable video straight into background-free frames")
+    parser.add_argument('video', help="Video file covering one revolution of the car")
+    parser.add_argument('--output', default=OUTPUT_FOLDER, help=f"Frame folder to write (default: {OUTPUT_FOLDER})")
+    sampling = parser.add_mutually_exclusive_group()
+    sampling.add_argument('--frames', type=int, help=f"Frames to take (default: {DEFAULT_FRAMES})")
+    sampling.add_argument('--step', type=float, help="Degrees of rotation between frames")
+    parser.add_argument('--start', type=float, default=0.0, help="Seconds where the revolution starts")
+    parser.add_argument('--end', type=float, help="Seconds where the revolution ends (default: end of video)")
+    parser.add_argument('--codec', default=FRAME_CODEC, choices=list(CODECS),
+                        help=f"Output encoder (default: {FRAME_CODEC})")
+    parser.add_argument('--force', action='store_true',
+                        help="Delete the frames already in the output folder instead of stopping")
+    args = parser.parse_args()
+
+    count = round(360 / args.step) if args.step else args.frames or DEFAULT_FRAMES
+    if count < 1:
+        parser.error("need at least one frame")
+
+    print(f"Sampling {count} frames from {args.video} into {args.output}...")
+    print(f"Streaming: decode -> background removal -> encode -> write, queues of {QUEUE_SIZE}")
+
+    def report(i, result, error):
+        if error:
+            print(f"✗ {error}")
+        elif i % 10 == 0:
+            print(f"✓ {i}/{count} frames")
+
+    try:
+        record = ingest_video(args.video, args.output, count, args.start, args.end, args.codec, report, args.force)
+    except ValueError as e:
+        print(e)
+        return
+
+    print(f"\n✅ {len(record['frames'])}/{count} frames from {record['video_frames']} video frames "
+          f"at {record['fps']:.3g} fps")
+    print(f"Output: {args.output}")
+    if len(record['frames']) != DEFAULT_FRAMES:
+        print(f"Note: the viewer expects {DEFAULT_FRAMES} frames; update totalFrames in script.js")
+
+if __name__ == '__main__':
+    main()